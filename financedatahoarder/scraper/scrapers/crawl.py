@@ -0,0 +1,52 @@
+"""Crawl the current key stats of the instruments listed in a file to the time series store
+
+Usage:
+
+    python -m financedatahoarder.scraper.scrapers.crawl instruments.txt --timeseries-dir .timeseries
+
+Scrapy settings (see `settings.py`) can be overridden with `-s NAME=VALUE`, e.g. `-s AUTOTHROTTLE_ENABLED=0`.
+"""
+import argparse
+
+from scrapy.crawler import CrawlerProcess
+from scrapy.settings import Settings
+
+from financedatahoarder.scraper.scrapers.spiders.morningstar_overview import MorningstarOverviewSpider
+
+
+def crawler_settings(overrides=()):
+    """
+    :param overrides: NAME=VALUE strings overriding the project settings
+    :rtype: Settings
+    """
+    settings = Settings()
+    settings.setmodule('financedatahoarder.scraper.scrapers.settings', priority='project')
+    for override in overrides:
+        name, _, value = override.partition('=')
+        settings.set(name, value, priority='cmdline')
+    return settings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('instruments', help='file with an instrument url on each line')
+    parser.add_argument('--timeseries-dir', default=None, help='time series store directory')
+    parser.add_argument('-s', '--set', action='append', default=[], metavar='NAME=VALUE', dest='settings',
+                        help='override a scrapy setting')
+    args = parser.parse_args(argv)
+
+    settings = crawler_settings(args.settings)
+    if args.timeseries_dir is not None:
+        settings.set('TIMESERIES_DIR', args.timeseries_dir, priority='cmdline')
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler(MorningstarOverviewSpider)
+    process.crawl(crawler, instruments=args.instruments)
+    process.start()
+    stats = crawler.stats.get_stats()
+    print '{} of {} instruments crawled'.format(stats.get('item_scraped_count', 0),
+                                                 len(crawler.spider.instrument_urls))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
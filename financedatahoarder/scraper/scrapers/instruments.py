@@ -0,0 +1,11 @@
+"""Instrument list files shared by the crawl (`crawl.py`) and the prefetch job of the service"""
+from collections import OrderedDict
+
+
+def read_instruments(f):
+    """Read instrument urls, one per line. Empty lines and lines starting with # are ignored.
+
+    :rtype: list[str]
+    """
+    urls = [line.strip() for line in f]
+    return list(OrderedDict.fromkeys(url for url in urls if url and not url.startswith('#')))
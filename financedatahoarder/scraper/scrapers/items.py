@@ -19,4 +19,18 @@ class TrailingReturns(scrapy.Item):
 
 class OverviewKeyStats(scrapy.Item):
     value = scrapy.Field()
-    value_date = scrapy.Field()
\ No newline at end of file
+    value_date = scrapy.Field()
+    # Optional fields, see morningstar_overview.KEY_STATS_FIELDS
+    change_1d = scrapy.Field()
+    yield_12m = scrapy.Field()
+    ongoing_charges = scrapy.Field()
+    fund_size = scrapy.Field()
+    share_class_size = scrapy.Field()
+
+
+class InstrumentKeyStats(scrapy.Item):
+    """Overview key stats of an instrument crawled on `query_date`"""
+    instrument_url = scrapy.Field()
+    query_date = scrapy.Field()
+    value = scrapy.Field()
+    value_date = scrapy.Field()
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""Locating and parsing single elements of Morningstar.fi pages with lxml, shared by the fast page parsers"""
+from lxml import html
+
+_HTML_PARSER = html.HTMLParser(encoding='utf-8')
+
+
+def element_text(element):
+    """Return text content of the element with whitespace collapsed"""
+    return ' '.join(element.text_content().split())
+
+
+def find_element(content, tag, marker):
+    """Return the first element of the page with `marker` (e.g. class or id) inside its start tag
+
+    Only the html of the element is parsed, the element is located using plain string search.
+
+    :param content: raw bytes of the page
+    :return: the element, or None if not found
+    :rtype: lxml.html.HtmlElement | None
+    """
+    start_tag, end_tag = '<' + tag, '</' + tag + '>'
+    pos = content.find(marker)
+    while pos != -1:
+        start = content.rfind('<', 0, pos)
+        end = content.find(end_tag, pos)
+        if end == -1:
+            return None
+        if content[start:start + len(start_tag)] == start_tag and content.find('>', start, pos) == -1:
+            return html.fragment_fromstring(content[start:end + len(end_tag)], parser=_HTML_PARSER)
+        pos = content.find(marker, pos + len(marker))
+    return None
@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+from collections import OrderedDict
+from datetime import datetime
 import scrapy
 import pandas as pd
 from lxml import html
@@ -6,6 +8,7 @@ from lxml.html.clean import Cleaner
 from pytz import UTC, timezone, FixedOffset
 import logging
 from financedatahoarder.scraper.scrapers.items import OverviewKeyStats
+from financedatahoarder.scraper.scrapers.parsers.html_utils import element_text, find_element
 
 OSUUDEN_ARVO = 'Osuuden arvo'  # Fund
 LOPETUSHINTA = 'Lopetushinta'  # ETF
@@ -13,9 +16,53 @@ MYYNTIKURSSI = 'Myyntikurssi'  # ETF
 
 _HTML_CLEANER = Cleaner(allow_tags=[''], remove_unknown_tags=False)
 
+# Key stats fields besides the value (price or NAV) and its date, by the headings of their rows in the key stats table.
+# Fields are extracted from all the rows of the table in the same pass as the value. Fields missing from the page are
+# left out of the parsed key stats.
+KEY_STATS_FIELDS = OrderedDict([
+    ('change_1d', (u'1 pv muutos',)),  # %
+    ('yield_12m', (u'12 kk tuotto', u'Tuotto 12 kk')),  # %
+    ('ongoing_charges', (u'Juoksevat kulut',)),  # TER, %
+    ('fund_size', (u'Rahaston koko (Mil)',)),  # Millions
+    ('share_class_size', (u'Rahastosarjan koko (Mil)',)),  # Millions
+])
+
+
+def _parse_number(text):
+    """Parse number such as 'EUR 217,36' or '-0,73%', None if there is no number (e.g. '-')"""
+    text = u''.join(unicode(text).replace(u'EUR', u'').replace(u'%', u'').split()).replace(u',', u'.')
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _parse_fields(rows):
+    """Parse :data:`KEY_STATS_FIELDS` from (heading, value text) pairs of the key stats table rows
+
+    Rows whose heading is not text (e.g. NaN or number column labels of an empty or numeric heading cell read by
+    pandas) are skipped.
+
+    :rtype: dict[str, float]
+    """
+    fields = {}
+    for heading, text in rows:
+        if not isinstance(heading, basestring):
+            continue
+        for field, labels in KEY_STATS_FIELDS.iteritems():
+            if field not in fields and heading.startswith(labels):
+                value = _parse_number(text)
+                if value is not None:
+                    fields[field] = value
+                break
+    return fields
+
 
 def parse_overview_key_stats(selector):
-    """Prase overview key stats from Morningstar.fi ETF, Fund or stocks page"""
+    """Prase overview key stats from Morningstar.fi ETF, Fund or stocks page
+
+    Besides the value and value date, the :data:`KEY_STATS_FIELDS` found from the key stats table are parsed.
+    """
     tables = selector.css('table.overviewKeyStatsTable').extract()
     if tables:
         table = tables[0]
@@ -23,7 +70,7 @@ def parse_overview_key_stats(selector):
         df.columns = df.iloc[0]
         df = df.drop(0)
         for col, val in df.iteritems():
-            if OSUUDEN_ARVO in col or MYYNTIKURSSI in col or LOPETUSHINTA in col:
+            if isinstance(col, basestring) and (OSUUDEN_ARVO in col or MYYNTIKURSSI in col or LOPETUSHINTA in col):
                 # Osuuden arvo<br>dd.mm.yyyy
                 # Or
                 # Myyntikurssi (dd.mm.yyyy)
@@ -32,7 +79,8 @@ def parse_overview_key_stats(selector):
                 break
         else:
             raise RuntimeError('Could not find date')
-        return [OverviewKeyStats(value=value, value_date=value_date)]
+        fields = _parse_fields((col, val.dropna().iloc[0]) for col, val in df.iteritems() if val.notnull().any())
+        return [OverviewKeyStats(value=value, value_date=value_date, **fields)]
     else:
         return [parse_stock_price(selector)]
 
@@ -46,6 +94,10 @@ def parse_stock_price(selector):
     # <abbr title="TimeZone_EET">EET</abbr>
     datetime_text = selector.css('p#Col0PriceTime.priceInformation').extract()[0]
     datetime_text = html.fromstring(_HTML_CLEANER.clean_html(datetime_text)).text
+    return OverviewKeyStats(value=value, value_date=_parse_stock_price_time(datetime_text))
+
+
+def _parse_stock_price_time(datetime_text):
     # datetime_text ~= u'Päivitetty 20.03.201518:29:38 EET | EUR \t\t ....
     date_text = datetime_text[10:21]
     time_text = datetime_text[21:29]
@@ -56,7 +108,87 @@ def parse_stock_price(selector):
         tz = FixedOffset(3 * 60)
     else:
         tz = timezone(tz_text)
-    value_date = pd.to_datetime(date_text + ' ' + time_text, dayfirst=True).tz_localize(tz)
-    value_date = value_date.tz_convert(UTC)
-    return OverviewKeyStats(value=value, value_date=value_date)
+    try:
+        value_date = pd.Timestamp(datetime.strptime(date_text.strip() + ' ' + time_text, '%d.%m.%Y %H:%M:%S'))
+    except ValueError:
+        value_date = pd.to_datetime(date_text + ' ' + time_text, dayfirst=True)
+    return value_date.tz_localize(tz).tz_convert(UTC)
+
+
+def parse_overview_key_stats_fast(content):
+    """Parse overview key stats from the raw bytes of Morningstar.fi ETF, Fund or stocks page
+
+    Faster alternative to :func:`parse_overview_key_stats`. Instead of parsing the whole page and reading the key stats
+    table with pandas, only the key stats table (or the stock price elements) is parsed with lxml. The
+    :data:`KEY_STATS_FIELDS` are parsed from the same table.
+
+    :raise ValueError: on pages that could not be parsed
+    """
+    if not content:
+        raise ValueError('Empty page')
+    table = find_element(content, 'table', 'overviewKeyStatsTable')
+    if table is not None:
+        key_stats = None
+        rows = []
+        for row in table.xpath('tr[td[3]]'):
+            cells = row.findall('td')
+            heading = element_text(cells[0])
+            value_texts = [text for text in map(element_text, cells[1:]) if text]
+            if key_stats is None and (OSUUDEN_ARVO in heading or MYYNTIKURSSI in heading or LOPETUSHINTA in heading):
+                # Osuuden arvo dd.mm.yyyy
+                # Or
+                # Myyntikurssi (dd.mm.yyyy)
+                value_date = pd.Timestamp(datetime.strptime(heading.replace(')', '')[-10:], '%d.%m.%Y'), tz=UTC)
+                if not value_texts:
+                    raise ValueError('Could not find value')
+                value = float(value_texts[0].replace(',', '.').replace('EUR', '').strip())
+                key_stats = OverviewKeyStats(value=value, value_date=value_date)
+            elif value_texts:
+                rows.append((heading, value_texts[0]))
+        if key_stats is None:
+            raise ValueError('Could not find date')
+        key_stats.update(_parse_fields(rows))
+        return [key_stats]
+
+    price_item = find_element(content, 'span', 'id="Col0Price"')
+    time_item = find_element(content, 'p', 'id="Col0PriceTime"')
+    if price_item is None or time_item is None or 'price' not in price_item.classes or \
+            'priceInformation' not in time_item.classes:
+        raise ValueError('Could not find key stats')
+    value = float(price_item.text.replace(',', '.'))
+    return [OverviewKeyStats(value=value, value_date=_parse_stock_price_time(time_item.text_content()))]
+
+
+def parse_overview_key_stats_from_content(content):
+    """Parse overview key stats from page content
+
+    Uses the fast lxml based parser, falling back to the scrapy selector and pandas based parser on pages the fast
+    parser does not recognize.
+
+    :param content: raw bytes of the page
+    :type content: str
+    :rtype: list[OverviewKeyStats]
+    """
+    try:
+        return parse_overview_key_stats_fast(content)
+    except ValueError:
+        logging.getLogger('parse_overview_key_stats_from_content').debug('Fast parse failed', exc_info=True)
+    return parse_overview_key_stats(scrapy.Selector(text=content))
+
+
+def parse_overview_key_stats_or_empty(content, url):
+    """Parse overview key stats from page content, e.g. a replay or a crawled page
 
+    :param content: raw bytes of the page, or None if the page could not be read
+    :return: the key stats, or empty dict if the content is None or could not be parsed
+    :rtype: OverviewKeyStats | dict
+    """
+    if content is None:
+        return {}
+    try:
+        key_stats, = parse_overview_key_stats_from_content(content)
+    except:
+        logging.getLogger('parse_overview_key_stats_or_empty').warning(
+            'Parse failed for {} -- ignoring entry'.format(url), exc_info=True)
+        key_stats = {}
+    return key_stats
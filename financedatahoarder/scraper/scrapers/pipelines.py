@@ -4,8 +4,62 @@
 #
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: http://doc.scrapy.org/en/latest/topics/item-pipeline.html
+import logging
+from collections import OrderedDict
 
+import pandas as pd
+from scrapy.utils.misc import load_object
+
+from financedatahoarder.scraper.scrapers.items import InstrumentKeyStats
+
+
+class TimeSeriesStorePipeline(object):
+    """Write crawled :class:`InstrumentKeyStats` to a time series store in batches
+
+    Items are buffered and written every `batch_size` items and when the spider closes. Each batch updates the time
+    series of an instrument once, with all the query dates of the instrument in the batch.
+
+    The store class is given by the TIMESERIES_STORE setting (the store of the REST service,
+    `KeyStatsTimeSeriesStore`, in the project settings), so that the scraper does not depend on the service.
+    """
+
+    def __init__(self, store, batch_size=500):
+        """
+        :param store: store with the `update(url, dates, date_key_stats)` method of `KeyStatsTimeSeriesStore`
+        :param batch_size: number of items to buffer before writing
+        :type batch_size: int
+        """
+        self.store = store
+        self.batch_size = batch_size
+        self._items = []
+        self._logger = logging.getLogger('TimeSeriesStorePipeline')
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        store_cls = load_object(settings.get('TIMESERIES_STORE'))
+        store = store_cls(settings.get('TIMESERIES_DIR'), settle_days=settings.getint('TIMESERIES_SETTLE_DAYS'))
+        return cls(store, batch_size=settings.getint('TIMESERIES_BATCH_SIZE'))
 
-class ScrapyprojPipeline(object):
     def process_item(self, item, spider):
+        if isinstance(item, InstrumentKeyStats):
+            self._items.append(item)
+            if len(self._items) >= self.batch_size:
+                self.flush()
         return item
+
+    def close_spider(self, spider):
+        self.flush()
+
+    def flush(self):
+        items_by_url = OrderedDict()
+        for item in self._items:
+            items_by_url.setdefault(item['instrument_url'], []).append(item)
+        for url, items in items_by_url.iteritems():
+            dates = pd.DatetimeIndex(sorted(set(item['query_date'] for item in items)))
+            self.store.update(url, dates, [(item['query_date'], {'value': item['value'],
+                                                                 'value_date': item['value_date']})
+                                           for item in items])
+        if self._items:
+            self._logger.info('Stored %d key stats of %d instruments', len(self._items), len(items_by_url))
+        self._items = []
@@ -10,8 +10,32 @@
 
 BOT_NAME = 'scrapers'
 
-SPIDER_MODULES = ['scrapers.spiders']
-NEWSPIDER_MODULE = 'scrapers.spiders'
+SPIDER_MODULES = ['financedatahoarder.scraper.scrapers.spiders']
+NEWSPIDER_MODULE = 'financedatahoarder.scraper.scrapers.spiders'
 
 # Crawl responsibly by identifying yourself (and your website) on the user-agent
 #USER_AGENT = 'scrapers (+http://www.yourdomain.com)'
+
+ROBOTSTXT_OBEY = True
+
+# Concurrent downloads, adapted to the latency of the site with AutoThrottle
+CONCURRENT_REQUESTS = 32
+CONCURRENT_REQUESTS_PER_DOMAIN = 8
+AUTOTHROTTLE_ENABLED = True
+AUTOTHROTTLE_START_DELAY = 1.0
+AUTOTHROTTLE_MAX_DELAY = 30.0
+AUTOTHROTTLE_TARGET_CONCURRENCY = 4.0
+DOWNLOAD_TIMEOUT = 30
+RETRY_TIMES = 2
+
+ITEM_PIPELINES = {
+    'financedatahoarder.scraper.scrapers.pipelines.TimeSeriesStorePipeline': 300,
+}
+
+# Time series store of the crawled key stats, same as the store of the REST service (see services/config.py). The
+# store class is loaded by the pipeline from its path, the scraper modules do not import the service.
+TIMESERIES_STORE = 'financedatahoarder.services.timeseries_store.KeyStatsTimeSeriesStore'
+TIMESERIES_DIR = '.timeseries'
+# Key stats of the current day are stored, a later crawl of the same day replaces them
+TIMESERIES_SETTLE_DAYS = 0
+TIMESERIES_BATCH_SIZE = 500
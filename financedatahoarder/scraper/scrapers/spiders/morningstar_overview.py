@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+import logging
+
+import pandas as pd
+import pytz
+import scrapy
+
+from financedatahoarder.scraper.scrapers.instruments import read_instruments
+from financedatahoarder.scraper.scrapers.items import InstrumentKeyStats
+from financedatahoarder.scraper.scrapers.parsers.morningstar_overview import parse_overview_key_stats_or_empty
+
+
+class MorningstarOverviewSpider(scrapy.Spider):
+    """Crawl the current key stats of Morningstar.fi fund, ETF and stock overview pages
+
+    Run with a file listing the instrument urls, one per line (see :func:`read_instruments`):
+
+        scrapy crawl morningstar_overview -a instruments=instruments.txt
+    """
+
+    name = 'morningstar_overview'
+
+    def __init__(self, instruments=None, urls=None, *args, **kwargs):
+        """
+        :param instruments: path of the file listing the instrument urls
+        :type instruments: str | None
+        :param urls: instrument urls, in addition to the listed ones
+        :type urls: list[str] | None
+        """
+        super(MorningstarOverviewSpider, self).__init__(*args, **kwargs)
+        self.instrument_urls = list(urls or [])
+        if instruments is not None:
+            with open(instruments) as f:
+                self.instrument_urls.extend(url for url in read_instruments(f) if url not in self.instrument_urls)
+        self.query_date = pd.Timestamp(datetime.now(pytz.UTC).date(), tz=pytz.UTC)
+
+    def start_requests(self):
+        for url in self.instrument_urls:
+            yield scrapy.Request(url, callback=self.parse, meta={'instrument_url': url})
+
+    def parse(self, response):
+        key_stats = parse_overview_key_stats_or_empty(response.body, response.url)
+        if not key_stats:
+            logging.getLogger(self.name).warning('No key stats found from %s', response.url)
+            return
+        yield InstrumentKeyStats(instrument_url=response.meta['instrument_url'], query_date=self.query_date,
+                                 value=key_stats['value'], value_date=key_stats['value_date'])
@@ -0,0 +1,87 @@
+"""Backfill the parsed key stats cache from the raw replays stored in the CacheControl file cache
+
+Replay urls are taken from the CDX index store, and each replay found from the HTTP cache is parsed and stored to the
+parsed key stats cache. Replays that are not in the HTTP cache are skipped.
+
+Usage:
+
+    python -m financedatahoarder.services.backfill_parsed_cache --http-cache .http_cache --cdx-index .cdx_index \
+        --parsed-cache .parsed_cache.sqlite
+"""
+import argparse
+import logging
+
+from cachecontrol.caches import FileCache
+from cachecontrol.controller import CacheController
+from cachecontrol.serialize import Serializer
+from requests import Request, Session
+
+from financedatahoarder.services.cdx_index import CdxIndexStore
+from financedatahoarder.services.http_utils import grequest_get
+from financedatahoarder.services.key_stats_cache import ParsedKeyStatsCache, replay_cache_key
+from financedatahoarder.services.parse_utils import parse_overview_key_stats_or_empty
+
+
+def iter_cached_replays(http_cache, replay_urls):
+    """Read replays from the HTTP cache
+
+    :param http_cache: CacheControl cache, e.g. `FileCache('.http_cache')`
+    :param replay_urls: replay urls as listed in the CDX index
+    :return: iterable of (replay cache key, content) tuples of replays found from the cache
+    """
+    session = Session()
+    serializer = Serializer()
+    for replay_url in replay_urls:
+        req = grequest_get(replay_url, session=None)
+        # Prepare the request as the session of the client does, so that the url (and the cache key) match
+        prepared = session.prepare_request(Request('GET', req.url, params=req.kwargs['params']))
+        response = serializer.loads(prepared, http_cache.get(CacheController.cache_url(prepared.url)))
+        if response is None or response.status != 200:
+            continue
+        yield replay_cache_key(req), response.read(decode_content=True)
+
+
+def backfill(http_cache, cdx_index, parsed_cache, batch_size=500):
+    """Parse replays found from the HTTP cache and store them to the parsed key stats cache
+
+    Replays already in the parsed key stats cache are not parsed again.
+
+    :type cdx_index: CdxIndexStore
+    :type parsed_cache: ParsedKeyStatsCache
+    :return: tuple of (number of replays listed, number of replays parsed and stored)
+    :rtype: (int, int)
+    """
+    logger = logging.getLogger('backfill')
+    num_listed = num_parsed = 0
+    for entry in cdx_index.iter_entries():
+        replay_urls = list(entry.idx.values)
+        num_listed += len(replay_urls)
+        for start in xrange(0, len(replay_urls), batch_size):
+            batch = replay_urls[start:start + batch_size]
+            cached = parsed_cache.get_many_by_url([replay_cache_key(grequest_get(url, session=None))
+                                                   for url in batch])
+            batch = [url for i, url in enumerate(batch) if i not in cached]
+            keys, key_stats = [], []
+            for key, content in iter_cached_replays(http_cache, batch):
+                keys.append(key)
+                key_stats.append(parse_overview_key_stats_or_empty(content, key))
+            parsed_cache.set_many_by_url(keys, key_stats)
+            num_parsed += sum(1 for key_stat in key_stats if key_stat)
+        logger.info('%d replays listed, %d parsed', num_listed, num_parsed)
+    return num_listed, num_parsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--http-cache', default='.http_cache', help='CacheControl file cache directory')
+    parser.add_argument('--cdx-index', default='.cdx_index', help='CDX index store directory')
+    parser.add_argument('--parsed-cache', default='.parsed_cache.sqlite', help='parsed key stats cache database')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    num_listed, num_parsed = backfill(FileCache(args.http_cache), CdxIndexStore(args.cdx_index),
+                                      ParsedKeyStatsCache(args.parsed_cache))
+    print '{} replays listed, {} parsed and stored'.format(num_listed, num_parsed)
+
+
+if __name__ == '__main__':
+    main()
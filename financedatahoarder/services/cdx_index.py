@@ -0,0 +1,172 @@
+import hashlib
+import logging
+import os
+import pickle
+import re
+import tempfile
+import time
+
+import pandas as pd
+
+_REPLAY_TIMESTAMP_RE = re.compile(r'/(\d{14})/')
+
+
+def last_replay_timestamp(idx):
+    """Return the pywb timestamp (e.g. 20150312190004) of the latest recording in the index
+
+    :param idx: index as returned by :func:`parse_idx_list`
+    :type idx: pd.Series
+    :rtype: str | None
+    """
+    if not len(idx):
+        return None
+    match = _REPLAY_TIMESTAMP_RE.search(idx.sort_index().iloc[-1])
+    return match.group(1) if match else None
+
+
+def merge_idx(idx, new_idx):
+    """Merge index of recordings with newer recordings
+
+    Recordings of `new_idx` take precedence, i.e. the last recording of a day is taken from `new_idx` if the day is
+    present in both.
+    """
+    if not len(new_idx):
+        return idx
+    if not len(idx):
+        return new_idx
+    return new_idx.combine_first(idx).sort_index()
+
+
+class CdxIndexEntry(object):
+    __slots__ = ('idx', 'last_timestamp', 'refreshed_at')
+
+    def __init__(self, idx, last_timestamp, refreshed_at):
+        self.idx = idx
+        self.last_timestamp = last_timestamp
+        self.refreshed_at = refreshed_at
+
+
+class CdxIndexStore(object):
+    """Store of pywb recordings (as parsed by :func:`parse_idx_list`) keyed by instrument url
+
+    Entries are kept in memory and, if `directory` is given, persisted on disk (one pickle file per instrument url).
+    An entry is considered stale `refresh_after` seconds after the last refresh. Stale entries should be refreshed by
+    querying only recordings newer than :attr:`CdxIndexEntry.last_timestamp` and merging them using :meth:`update`.
+    """
+
+    def __init__(self, directory=None, refresh_after=300):
+        """
+        :param directory: directory to persist the index in. None to keep the index only in memory
+        :type directory: str | None
+        :param refresh_after: seconds after which the recordings are refreshed. None or zero to refresh on every lookup
+        :type refresh_after: int | None
+        """
+        self._directory = directory
+        self._refresh_after = refresh_after or 0
+        self._entries = {}
+        self._logger = logging.getLogger('CdxIndexStore')
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        if directory is not None and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def stats(self):
+        """Return hit, miss and refresh counts of the store"""
+        return {'hits': self.hits, 'misses': self.misses, 'refreshes': self.refreshes,
+                'entries': len(self._entries)}
+
+    def _path(self, url):
+        if isinstance(url, unicode):
+            url = url.encode('utf-8')
+        return os.path.join(self._directory, hashlib.sha1(url).hexdigest() + '.pickle')
+
+    def _load(self, url):
+        if self._directory is None:
+            return None
+        try:
+            with open(self._path(url), 'rb') as f:
+                return pickle.load(f)
+        except IOError:
+            return None
+        except (EOFError, pickle.UnpicklingError, ValueError):
+            self._logger.warning('Ignoring corrupted cdx index of %s', url, exc_info=True)
+            return None
+
+    def _save(self, url, entry):
+        if self._directory is None:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self._directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, self._path(url))
+
+    def get(self, url):
+        """Return the entry of the url from memory or disk, or None if the url has not been indexed
+
+        :rtype: CdxIndexEntry | None
+        """
+        entry = self._entries.get(url)
+        if entry is None:
+            entry = self._load(url)
+            if entry is not None:
+                self._entries[url] = entry
+        return entry
+
+    def iter_entries(self):
+        """Iterate all entries of the store, including the ones persisted on disk
+
+        :rtype: iterable[CdxIndexEntry]
+        """
+        if self._directory is None:
+            for entry in self._entries.values():
+                yield entry
+            return
+        for filename in sorted(os.listdir(self._directory)):
+            if not filename.endswith('.pickle'):
+                continue
+            try:
+                with open(os.path.join(self._directory, filename), 'rb') as f:
+                    yield pickle.load(f)
+            except (IOError, EOFError, pickle.UnpicklingError, ValueError):
+                self._logger.warning('Ignoring corrupted cdx index %s', filename, exc_info=True)
+
+    def is_stale(self, entry, now=None):
+        now = time.time() if now is None else now
+        return now - entry.refreshed_at >= self._refresh_after
+
+    def lookup(self, url, now=None):
+        """Look up the url and count hits and misses
+
+        :return: tuple of (entry, needs_refresh). Entry is None if the url is not indexed, in which case full index
+            should be queried.
+        :rtype: (CdxIndexEntry | None, bool)
+        """
+        entry = self.get(url)
+        if entry is None:
+            self.misses += 1
+            return None, True
+        if self.is_stale(entry, now):
+            self.refreshes += 1
+            return entry, True
+        self.hits += 1
+        return entry, False
+
+    def update(self, url, new_idx, now=None):
+        """Merge newer recordings to the index of the url
+
+        :param new_idx: recordings, as returned by :func:`parse_idx_list`
+        :type new_idx: pd.Series
+        :return: the merged index
+        :rtype: pd.Series
+        """
+        now = time.time() if now is None else now
+        entry = self.get(url)
+        idx = new_idx if entry is None else merge_idx(entry.idx, new_idx)
+        last_timestamp = last_replay_timestamp(idx)
+        if last_timestamp is None and entry is not None:
+            last_timestamp = entry.last_timestamp
+        entry = CdxIndexEntry(idx, last_timestamp, now)
+        self._entries[url] = entry
+        self._save(url, entry)
+        return idx
@@ -0,0 +1,95 @@
+"""Construction of the archive client from the service configuration (see `config.py`)
+
+Shared by the REST server and the command line jobs, so that they use the same caches and stores.
+"""
+import logging
+import os
+
+from flask import Config
+from redis_cache.rediscache import SimpleCache
+
+from financedatahoarder.services import metrics, seligson_csv_cache
+from financedatahoarder.services.cdx_index import CdxIndexStore
+from financedatahoarder.services.data_access_api import NonCachingAsyncRequestsClient, grequests_map, DummyCache
+from financedatahoarder.services.flow_control import AIMDLimiter, FlowControlledMap, RetryPolicy
+from financedatahoarder.services.http_cache import SqliteHttpCache
+from financedatahoarder.services.key_stats_cache import ParsedKeyStatsCache, ParsedTrailingReturnsCache
+from financedatahoarder.services.parse_executor import ProcessPoolParseExecutor
+from financedatahoarder.services.threadpool_client import ThreadPoolMap
+from financedatahoarder.services.timeseries_store import KeyStatsTimeSeriesStore
+
+
+def load_config():
+    """Load `config.py`, overridden by the file pointed by APP_CONFIG_FILE environment variable, as the REST server does
+
+    :rtype: flask.Config
+    """
+    config = Config(os.path.dirname(os.path.abspath(__file__)))
+    config.from_pyfile('config.py')
+    config.from_envvar('APP_CONFIG_FILE', silent=True)
+    return config
+
+
+def create_redis_cache(config):
+    if config['REDIS_CACHING_ENABLED']:
+        logging.getLogger(__name__).info('Using redis cache {}:{}'.format(config['REDIS_HOST'], config['REDIS_PORT']))
+        return SimpleCache(expire=config['CACHE_EXPIRE_AFTER'], host=config['REDIS_HOST'], port=config['REDIS_PORT'],
+                           db=config['REDIS_DB'])
+    logging.getLogger(__name__).info('Not using redis cache')
+    return DummyCache
+
+
+def create_archive_map(config):
+    """Create the function sending the requests to pywb, see :func:`grequests_map`"""
+    if config['ARCHIVE_CLIENT'] == 'threadpool':
+        archive_map = ThreadPoolMap(config['GREQUESTS_POOL_SIZE'], per_host_limit=config['ARCHIVE_PER_HOST_LIMIT'],
+                                    timeout=config['ARCHIVE_TIMEOUT'],
+                                    retries=0 if config['ARCHIVE_FLOW_CONTROL'] else config['ARCHIVE_RETRIES'],
+                                    retry_backoff=config['ARCHIVE_RETRY_BACKOFF'])
+    else:
+        archive_map = grequests_map
+    if config['ARCHIVE_FLOW_CONTROL']:
+        archive_map = FlowControlledMap(archive_map,
+                                        AIMDLimiter(min_limit=config['ARCHIVE_MIN_CONCURRENCY'],
+                                                    max_limit=config['GREQUESTS_POOL_SIZE'],
+                                                    latency_target=config['ARCHIVE_LATENCY_TARGET']),
+                                        RetryPolicy(retries=config['ARCHIVE_RETRIES'],
+                                                    backoff=config['ARCHIVE_RETRY_BACKOFF']),
+                                        timeout=config['ARCHIVE_TIMEOUT'],
+                                        failure_threshold=config['ARCHIVE_CIRCUIT_FAILURE_THRESHOLD'],
+                                        reset_after=config['ARCHIVE_CIRCUIT_RESET_AFTER'],
+                                        threaded=config['ARCHIVE_CLIENT'] == 'threadpool')
+    return archive_map
+
+
+def create_client(config):
+    """Create the archive client with the caches and stores of the configuration
+
+    Statistics of the caches, stores and archive requests of the client are registered to :data:`metrics.REGISTRY`.
+
+    :rtype: NonCachingAsyncRequestsClient
+    """
+    if config['PARSE_PROCESSES']:
+        parse_executor = ProcessPoolParseExecutor(config['PARSE_PROCESSES'], chunk_size=config['PARSE_CHUNK_SIZE'])
+    else:
+        parse_executor = None
+    seligson_csv_cache.default_cache.refresh_after = config['SELIGSON_CSV_REFRESH_AFTER']
+    parsed_cache = ParsedKeyStatsCache(config['PARSED_CACHE_PATH']) if config['PARSED_CACHE_PATH'] else None
+    trailing_returns_cache = ParsedTrailingReturnsCache(config['PARSED_CACHE_PATH']) \
+        if config['PARSED_CACHE_PATH'] else None
+    http_cache = SqliteHttpCache(config['HTTP_CACHE_PATH'], max_bytes=config['HTTP_CACHE_MAX_BYTES'],
+                                 max_entries=config['HTTP_CACHE_MAX_ENTRIES'], ttl=config['HTTP_CACHE_TTL'])
+    list_http_cache = SqliteHttpCache(config['LIST_HTTP_CACHE_PATH'], max_bytes=config['LIST_HTTP_CACHE_MAX_BYTES'])
+    timeseries_store = KeyStatsTimeSeriesStore(config['TIMESERIES_DIR'], settle_days=config['TIMESERIES_SETTLE_DAYS'])
+    cdx_index = CdxIndexStore(config['CDX_INDEX_DIR'], refresh_after=config['CDX_INDEX_REFRESH_AFTER'])
+    archive_map = create_archive_map(config)
+    client = NonCachingAsyncRequestsClient(config['BASE_REPLAY_URL'], config['GREQUESTS_POOL_SIZE'],
+                                         create_redis_cache(config), expire_after=config['CACHE_EXPIRE_AFTER'],
+                                         expire_list_after=0, cdx_index=cdx_index,
+                                         cdx_output=config['CDX_LIST_OUTPUT'], parse_executor=parse_executor,
+                                         parsed_cache=parsed_cache, http_cache=http_cache,
+                                         list_http_cache=list_http_cache, timeseries_store=timeseries_store,
+                                         map_func=archive_map, trailing_returns_cache=trailing_returns_cache)
+    metrics.register_client(client, archive_map=archive_map,
+                            http_caches={'replay': http_cache, 'list': list_http_cache})
+    return client
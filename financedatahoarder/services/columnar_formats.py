@@ -0,0 +1,117 @@
+"""Binary columnar encodings of query results
+
+Results are encoded from columns (see :meth:`KeyStatsTable.to_columns`) as a whole, without formatting individual rows
+in Python. Encoders are available only if the optional dependency of the format is installed:
+
+- Apache Arrow IPC stream and Parquet: `pyarrow`
+- msgpack: `msgpack`
+"""
+from collections import OrderedDict
+from io import BytesIO
+
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+ARROW_STREAM_MIMETYPE = 'application/vnd.apache.arrow.stream'
+PARQUET_MIMETYPE = 'application/vnd.apache.parquet'
+MSGPACK_MIMETYPE = 'application/x-msgpack'
+NPZ_MIMETYPE = 'application/x-npz'
+
+_EPOCH_DAY = np.datetime64('1970-01-01', 'D')
+
+
+def _arrow_table(columns):
+    arrays = []
+    for name, column in columns.iteritems():
+        if column.dtype.kind == 'M':
+            arrays.append(pyarrow.array((column - _EPOCH_DAY).astype(np.int32), type=pyarrow.date32()))
+        elif column.dtype.kind in ('O', 'U', 'S'):
+            # E.g. instrument urls repeated on every row
+            arrays.append(pyarrow.array(column.tolist()).dictionary_encode())
+        else:
+            arrays.append(pyarrow.array(column, from_pandas=True))
+    return pyarrow.Table.from_arrays(arrays, names=list(columns))
+
+
+def encode_arrow_stream(columns):
+    """Encode columns as Apache Arrow IPC stream
+
+    Dates are encoded as date32, strings are dictionary encoded, NaN values are null.
+
+    :param columns: equal length arrays by column name, dates as datetime64[D]
+    :type columns: OrderedDict[str, np.ndarray]
+    :rtype: str
+    """
+    table = _arrow_table(columns)
+    sink = pyarrow.BufferOutputStream()
+    writer = pyarrow.RecordBatchStreamWriter(sink, table.schema)
+    writer.write_table(table)
+    writer.close()
+    return sink.getvalue().to_pybytes()
+
+
+def encode_parquet(columns):
+    """Encode columns as Parquet file, with the same column types as :func:`encode_arrow_stream`
+
+    :type columns: OrderedDict[str, np.ndarray]
+    :rtype: str
+    """
+    sink = pyarrow.BufferOutputStream()
+    pyarrow.parquet.write_table(_arrow_table(columns), sink)
+    return sink.getvalue().to_pybytes()
+
+
+def encode_msgpack(columns):
+    """Encode columns as msgpack map of column name to array
+
+    Dates are encoded as days since 1970-01-01, NaN values as nil.
+
+    :type columns: OrderedDict[str, np.ndarray]
+    :rtype: str
+    """
+    packed = OrderedDict()
+    for name, column in columns.iteritems():
+        if column.dtype.kind == 'M':
+            packed[name] = (column - _EPOCH_DAY).astype(np.int64).tolist()
+        elif column.dtype.kind == 'f' and np.isnan(column).any():
+            packed[name] = np.where(np.isnan(column), None, column).tolist()
+        else:
+            packed[name] = column.tolist()
+    # Strings as msgpack str type, decoded as text by msgpack clients
+    return msgpack.packb(packed, use_bin_type=False)
+
+
+def encode_npz(columns):
+    """Encode columns as NumPy npz archive, readable without pickle support
+
+    :type columns: OrderedDict[str, np.ndarray]
+    :rtype: str
+    """
+    buf = BytesIO()
+    np.savez(buf, **{name: column.astype(np.unicode_) if column.dtype.kind == 'O' else column
+                     for name, column in columns.iteritems()})
+    return buf.getvalue()
+
+
+def available_encoders():
+    """Return encoders of the formats whose dependencies are installed
+
+    :rtype: dict[str, function]
+    """
+    encoders = {NPZ_MIMETYPE: encode_npz}
+    if pyarrow is not None:
+        encoders[ARROW_STREAM_MIMETYPE] = encode_arrow_stream
+        encoders[PARQUET_MIMETYPE] = encode_parquet
+    if msgpack is not None:
+        encoders[MSGPACK_MIMETYPE] = encode_msgpack
+    return encoders
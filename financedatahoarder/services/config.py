@@ -5,4 +5,32 @@ CACHE_EXPIRE_AFTER = 3600 * 24 * 90
 REDIS_CACHING_ENABLED = False
 REDIS_HOST = None
 REDIS_PORT = None
-REDIS_DB = None
\ No newline at end of file
+REDIS_DB = None
+CDX_INDEX_DIR = '.cdx_index'
+CDX_INDEX_REFRESH_AFTER = 300
+CDX_LIST_OUTPUT = None
+PARSE_PROCESSES = 0
+PARSE_CHUNK_SIZE = 64
+PARSED_CACHE_PATH = '.parsed_cache.sqlite'
+HTTP_CACHE_PATH = '.http_cache.sqlite'
+HTTP_CACHE_MAX_BYTES = 2 * 1024 ** 3
+HTTP_CACHE_MAX_ENTRIES = None
+HTTP_CACHE_TTL = None
+LIST_HTTP_CACHE_PATH = '.list_http_cache.sqlite'
+LIST_HTTP_CACHE_MAX_BYTES = 256 * 1024 ** 2
+TIMESERIES_DIR = '.timeseries'
+TIMESERIES_SETTLE_DAYS = 1
+SELIGSON_CSV_REFRESH_AFTER = 3600
+# 'grequests' or 'threadpool' (see ThreadPoolMap)
+ARCHIVE_CLIENT = 'grequests'
+ARCHIVE_PER_HOST_LIMIT = 8
+ARCHIVE_TIMEOUT = (5, 30)
+ARCHIVE_RETRIES = 2
+ARCHIVE_RETRY_BACKOFF = 0.5
+# Adaptive concurrency (AIMD, between ARCHIVE_MIN_CONCURRENCY and GREQUESTS_POOL_SIZE) and circuit breaking of pywb
+# requests, see FlowControlledMap. Retries and timeouts are then applied by FlowControlledMap for both clients.
+ARCHIVE_FLOW_CONTROL = True
+ARCHIVE_MIN_CONCURRENCY = 2
+ARCHIVE_LATENCY_TARGET = 5.0
+ARCHIVE_CIRCUIT_FAILURE_THRESHOLD = 20
+ARCHIVE_CIRCUIT_RESET_AFTER = 30
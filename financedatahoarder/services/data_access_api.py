@@ -1,19 +1,40 @@
+import sys
 from collections import OrderedDict
 from cachecontrol import CacheControlAdapter
 from cachecontrol.caches import FileCache
 from cachecontrol.heuristics import ExpiresAfter
 from requests import Session
 import grequests
-from financedatahoarder.services.http_utils import prepare_replay_get, prepare_cdx_list_get
-from financedatahoarder.services.parse_utils import parse_overview_key_stats_from_responses, parse_idx_list
-from financedatahoarder.services.utils import iter_sort_uniq
+from financedatahoarder.services import seligson_csv_cache
+from financedatahoarder.services.cdx_index import CdxIndexStore
+from financedatahoarder.services.flow_control import is_failed_response
+from financedatahoarder.services.key_stats_cache import RedisKeyStatsCache, replay_cache_key
+from financedatahoarder.services.metrics import KEY_STATS_CACHE_LOOKUPS, STAGE_SECONDS, timed
+from financedatahoarder.services.http_utils import prepare_replay_get, prepare_cdx_list_get, trailing_returns_url
+from financedatahoarder.services.parse_utils import parse_overview_key_stats_from_responses, parse_idx_list, \
+    parse_trailing_returns_from_responses
+from financedatahoarder.services.single_flight import SingleFlight
+from financedatahoarder.services.utils import assemble_key_stats, assemble_trailing_returns, key_stats_array, \
+    key_stats_fields, key_stats_records
 from financedatahoarder.scraper.scrapers.parsers.morningstar_overview import OverviewKeyStats
-from toolz import groupby
+import numpy as np
 import pandas as pd
-import pytz
 import logging
 from itertools import chain
-from redis_cache.rediscache import cache_it
+
+# Recordings of an url that could not be listed
+_EMPTY_IDX = pd.Series([], index=pd.DatetimeIndex([]), dtype=object)
+
+
+def grequests_map(reqs, size):
+    """Send the requests concurrently with gevent, at most `size` at a time
+
+    :type reqs: list[grequests.AsyncRequest]
+    :return: responses in the order of the requests, None for failed requests
+    :rtype: list[requests.Response | None]
+    """
+    return grequests.map(reqs, size=size)
+
 
 class BaseClient(object):
 
@@ -21,55 +42,196 @@ class BaseClient(object):
         pass
 
 
+class BatchKeyStatsFetcher(object):
+    """Fetch and parse key stats of many replay requests as a single batch
+
+    Every request is first looked up from the parsed key stats cache and the redis cache, with a single batched query
+    per cache. All the cache misses are then sent as one bounded-concurrency batch (size of the batch is limited by
+    `grequests_pool_size`), and the parsed results are finally written back to the caches.
+
+    A replay already being fetched by a concurrent batch is not fetched again, but waited for (see
+    :attr:`replay_flight`).
+    """
+
+    def __init__(self, grequests_pool_size, redis_cache, parse_executor=None, parsed_cache=None, coalesce=True,
+                 map_func=grequests_map, parse_func=None, redis_namespace='overview_key_stats'):
+        """
+        :param parse_executor: Executor to parse the responses with, e.g. :class:`ProcessPoolParseExecutor`. None to
+            parse the responses inline after all of them have been downloaded.
+        :param parsed_cache: Persistent cache of parsed key stats, looked up before the redis cache
+        :type parsed_cache: ParsedKeyStatsCache | None
+        :param coalesce: False to fetch replays even if they are being fetched by concurrent batches
+        :type coalesce: bool
+        :param map_func: function sending the requests, see :func:`grequests_map`
+        :param parse_func: function parsing the responses inline, e.g. :func:`parse_trailing_returns_from_responses`.
+            Defaults to :func:`parse_overview_key_stats_from_responses`. Not used with `parse_executor`.
+        :param redis_namespace: namespace of the entries in the redis cache
+        """
+        self._grequests_pool_size = grequests_pool_size
+        self._map = map_func
+        self._caches = [cache for cache in (parsed_cache, RedisKeyStatsCache(redis_cache, namespace=redis_namespace))
+                        if cache is not None]
+        self._parse_executor = parse_executor
+        self._parse = parse_func
+        self.replay_flight = SingleFlight() if coalesce else None
+        self.failed = 0
+        self._logger = logging.getLogger('BatchKeyStatsFetcher')
+
+    @timed('cache_lookup')
+    def _lookup_cached(self, reqs):
+        """Look up requests from the caches, fastest cache first
+
+        Entries found from a slower cache are stored to the faster caches.
+        """
+        key_stats = {}
+        missing = range(len(reqs))
+        for level, cache in enumerate(self._caches):
+            if not missing:
+                break
+            found = sorted(cache.get_many([reqs[i] for i in missing]).iteritems())
+            if getattr(cache, 'enabled', True):
+                KEY_STATS_CACHE_LOOKUPS.inc((cache.metrics_name, 'hit'), len(found))
+                KEY_STATS_CACHE_LOOKUPS.inc((cache.metrics_name, 'miss'), len(missing) - len(found))
+            for j, key_stat in found:
+                key_stats[missing[j]] = key_stat
+            for faster_cache in self._caches[:level]:
+                faster_cache.set_many([reqs[missing[j]] for j, _ in found], [key_stat for _, key_stat in found])
+            missing = [i for i in missing if i not in key_stats]
+        return key_stats
+
+    @timed('fetch')
+    def _process_noncached(self, reqs):
+        """Fetch and parse the requests
+
+        :return: tuple of (key stats of each request, whether each request failed). Key stats of failed requests are
+            empty.
+        :rtype: (list[OverviewKeyStats], list[bool])
+        """
+        if self._parse_executor is None:
+            with STAGE_SECONDS.time(('replay',)):
+                responses = self._map(reqs, size=self._grequests_pool_size)
+            failed = map(is_failed_response, responses)
+            key_stats = (self._parse or parse_overview_key_stats_from_responses)(responses)
+            return key_stats, failed
+
+        # Download next chunk while the previous chunks are being parsed
+        chunk_size = self._parse_executor.chunk_size
+        parsed = []
+        failed = []
+        for start in xrange(0, len(reqs), chunk_size):
+            with STAGE_SECONDS.time(('replay',)):
+                responses = self._map(reqs[start:start + chunk_size], size=self._grequests_pool_size)
+            failed.extend(map(is_failed_response, responses))
+            parsed.append(self._parse_executor.submit(responses))
+        # Parsing in the worker processes is recorded as the time waited for the results, i.e. the parsing not
+        # overlapped by downloading
+        with STAGE_SECONDS.time(('parse',)):
+            key_stats = list(chain.from_iterable(result.get() for result in parsed))
+        return key_stats, failed
+
+    def fetch(self, reqs):
+        """Fetch key stats corresponding to the requests
+
+        :param reqs: replay requests
+        :type reqs: list[grequests.AsyncRequest]
+        :return: key stats, in the same order as the requests
+        :rtype: list[OverviewKeyStats]
+        """
+        reqs = list(reqs)
+        key_stats = self._lookup_cached(reqs)
+        missing = [i for i in xrange(len(reqs)) if i not in key_stats]
+        self._logger.debug('%d/%d requests found from cache, fetching %d', len(key_stats), len(reqs), len(missing))
+        if missing:
+            if self.replay_flight is None:
+                key_stats.update(zip(missing, self._fetch_noncached([reqs[i] for i in missing])))
+            else:
+                key_stats.update(self._fetch_coalesced(reqs, missing))
+        return [key_stats[i] for i in xrange(len(reqs))]
+
+    def _fetch_noncached(self, reqs):
+        fetched, failed = self._process_noncached(reqs)
+        # Failed requests (e.g. timeouts) are not cached, so that they are fetched again by later queries
+        cacheable = [i for i in xrange(len(reqs)) if not failed[i]]
+        if len(cacheable) < len(reqs):
+            self.failed += len(reqs) - len(cacheable)
+            self._logger.warning('%d/%d requests failed', len(reqs) - len(cacheable), len(reqs))
+        for cache in self._caches:
+            cache.set_many([reqs[i] for i in cacheable], [fetched[i] for i in cacheable])
+        return fetched
+
+    def _fetch_coalesced(self, reqs, missing):
+        """Fetch the missing requests not in flight, and wait for the rest to be fetched by the concurrent batches
+
+        :return: key stats by index of the request
+        :rtype: list[(int, OverviewKeyStats)]
+        """
+        owned = OrderedDict()
+        calls = []
+        for i in missing:
+            key = replay_cache_key(reqs[i])
+            if key in owned:
+                # Same replay twice in the batch
+                calls.append((i, owned[key][1]))
+                continue
+            leader, call = self.replay_flight.begin(key)
+            if leader:
+                owned[key] = (reqs[i], call)
+            calls.append((i, call))
+        self._logger.debug('Fetching %d replays, waiting for %d replays in flight', len(owned),
+                           len(missing) - len(owned))
+        if owned:
+            try:
+                fetched = self._fetch_noncached([req for req, _ in owned.itervalues()])
+            except BaseException:
+                exc_info = sys.exc_info()
+                for key, (_, call) in owned.iteritems():
+                    self.replay_flight.finish(key, call, exc_info=exc_info)
+                raise
+            for (key, (_, call)), key_stat in zip(owned.iteritems(), fetched):
+                self.replay_flight.finish(key, call, key_stat)
+        return [(i, call.wait()) for i, call in calls]
+
+
 class PyWbIndexBasedKeyStatsResolver(object):
 
-    def __init__(self, url, cdx_list_func, prepare_replay_get_func, grequests_pool_size,
-                 redis_cache):
+    def __init__(self, url, cdx_list_func, prepare_replay_get_func, fetcher):
+        """
+        :param fetcher: fetcher to fetch the replays with
+        :type fetcher: BatchKeyStatsFetcher
+        """
         self.url = url
         self._cdx_list = cdx_list_func
         self._prepare_replay_get = prepare_replay_get_func
-        self._grequests_pool_size = grequests_pool_size
-        self._redis_cache = redis_cache
+        self._fetcher = fetcher
         self._logger = logging.getLogger('PyWbIndexBasedParser')
 
-    def _from_cache(self, url, params, req):
-        assert req.url == url
-        assert req.kwargs['params'] == params
-        # Hack to cache using url and params, but use req in query
-
-        def _inner(req=req):
-            @cache_it(cache=self._redis_cache)
-            def query_from_cache(url, params):
-                self._logger.debug("Will process %s", url)
-                return self._process_noncached([req])[0]
-            return query_from_cache
-        return _inner()(url, params)
+    def prepare_requests(self, dates, url_idx):
+        """Prepare replay requests of the url for each date that has a recording
 
-    def _process_noncached(self, reqs):
-        responses = grequests.map(reqs, size=self._grequests_pool_size)
-        key_stats = parse_overview_key_stats_from_responses(responses)
-        return key_stats
-
-    def _process_cached(self, reqs):
-        key_stats = [self._from_cache(req.url, req.kwargs['params'], req) for req in reqs]
-        return key_stats
-
-    def parse(self, dates):
+        :param dates: dates to query
+        :param url_idx: recordings of the url, as returned by :func:`parse_idx_list`
+        :type url_idx: pd.Series
+        :return: replay request for each found date
+        :rtype: OrderedDict
+        """
         url = self.url
-        idx = self._cdx_list([url])
-
         prepared_requests = OrderedDict()
         for date in dates:
             try:
-                prepared_get = self._prepare_replay_get(date, idx[url])
+                prepared_get = self._prepare_replay_get(date, url_idx)
             except KeyError:
                 self._logger.warning('Could not find replay of {url} for {date}'.format(**locals()))
             else:
                 self._logger.debug('(date={}, url={}) -> {}'.format(date, url, prepared_get.url))
 
                 prepared_requests[(date, url)] = prepared_get
+        return prepared_requests
 
-        key_stats = self._process_cached(prepared_requests.values())
+    def parse(self, dates):
+        url = self.url
+        idx = self._cdx_list([url])
+        prepared_requests = self.prepare_requests(dates, idx[url])
+        key_stats = self._fetcher.fetch(prepared_requests.values())
 
         return key_stats
 
@@ -90,58 +252,114 @@ class SeligsonCSVKeyStatsResolver(object):
     def can_parse(cls, url):
         return url in cls.url_to_seligson_csv_url
 
-    def __init__(self, url):
+    def __init__(self, url, csv_cache=None):
         """
 
         :param url:
+        :param csv_cache: cache of the CSVs. Defaults to the process-wide cache
+        :type csv_cache: SeligsonCSVCache | None
         :return:
         :throw KeyError: on unsupported urls
         """
         self.url = self.url_to_seligson_csv_url[url]
+        self._csv_cache = seligson_csv_cache.default_cache if csv_cache is None else csv_cache
         logger = logging.getLogger('SeligsonCSVKeyStatsResolver')
         logger.debug('Resolved {} to {}'.format(url, self.url))
 
     def parse(self, dates):
+        return [key_stats for _, key_stats in self.resolve(dates)]
+
+    def resolve(self, dates):
+        """Resolve key stats of the dates found from the CSV
+
+        :return: (date, key stats) pairs
+        :rtype: list[(pd.Timestamp, OverviewKeyStats | dict)]
+        """
         logger = logging.getLogger('SeligsonCSVKeyStatsResolver')
-        # FIXME: error handling
         logger.debug('Querying {}'.format(self.url))
-        data = pd.read_csv(
-                self.url, sep=';', names=['date', 'value'], dayfirst=True, parse_dates=['date'],
-                index_col='date')
-        try:
-            data.index = data.index.tz_localize(dates.tz)
-        except TypeError: pass
-
-        try:
-            data = data.loc[dates, 'value']
-        except KeyError as e:
+        values = self._csv_cache.get(self.url)
+        if not len(dates):
+            return []
+        lookup_dates = dates if dates.tz is None else dates.tz_localize(None)
+        data = values.loc[lookup_dates.min():lookup_dates.max()].reindex(lookup_dates)
+        if data.isnull().all():
             # No match at all
-            logger.error("Error: {}".format(e))
+            logger.error('Error: none of the dates found from {}'.format(self.url))
             return []
+        data.index = dates
 
         logger.debug("Parsed: {}".format(data))
 
-        return [{} if pd.isnull(value) else OverviewKeyStats(value=value, value_date=value_date)
-            for value_date, value in data.iteritems()]
+        return [(value_date, {} if pd.isnull(value) else OverviewKeyStats(value=value, value_date=value_date))
+                for value_date, value in data.iteritems()]
 
 
 class DelegatingKeyStatsResolver(object):
 
-    def __init__(self, cdx_list_func, prepare_replay_get_func, grequests_pool_size, redis_cache):
+    def __init__(self, cdx_list_func, prepare_replay_get_func, fetcher):
         self.cdx_list_func = cdx_list_func
         self.prepare_replay_get_func = prepare_replay_get_func
-        self.grequests_pool_size = grequests_pool_size
-        self.redis_cache = redis_cache
+        self.fetcher = fetcher
+
+    def _pywb_resolver(self, url):
+        return PyWbIndexBasedKeyStatsResolver(url, self.cdx_list_func, self.prepare_replay_get_func, self.fetcher)
 
     def parse(self, url, dates):
         try:
             self.parser = SeligsonCSVKeyStatsResolver(url)
         except KeyError:
-            self.parser = PyWbIndexBasedKeyStatsResolver(url, self.cdx_list_func, self.prepare_replay_get_func,
-                                                         self.grequests_pool_size, self.redis_cache)
+            self.parser = self._pywb_resolver(url)
 
         return self.parser.parse(dates)
 
+    def parse_many(self, urls, dates):
+        """Resolve key stats of all urls for all dates
+
+        :return: key stats of each unique url
+        :rtype: dict[str, list[OverviewKeyStats]]
+        """
+        resolved = self.resolve_many(OrderedDict((url, dates) for url in urls))
+        return {url: [key_stats for _, key_stats in date_key_stats] for url, date_key_stats in resolved.iteritems()}
+
+    def resolve_many(self, dates_by_url, failed_urls=None):
+        """Resolve key stats of each url for the dates of the url
+
+        Recordings of all pywb urls are listed at once and the replays of every (url, date) pair are fetched as a single
+        batch.
+
+        :param dates_by_url: dates to query of each url
+        :type dates_by_url: OrderedDict[str, pd.DatetimeIndex]
+        :param failed_urls: set to add the urls whose recordings could not be listed to. Key stats of these urls are
+            resolved from the recordings listed before, and may miss dates having a recording. Seligson urls whose CSV
+            has none of the dates (e.g. NAV not yet published) are added as well.
+        :type failed_urls: set[str] | None
+        :return: (date, key stats) pairs of each url, for the dates having a recording
+        :rtype: dict[str, list[(pd.Timestamp, OverviewKeyStats)]]
+        """
+        key_stats_by_url = {}
+        pywb_urls = []
+        for url, dates in dates_by_url.iteritems():
+            try:
+                parser = SeligsonCSVKeyStatsResolver(url)
+            except KeyError:
+                pywb_urls.append(url)
+            else:
+                key_stats_by_url[url] = parser.resolve(dates)
+                if not key_stats_by_url[url] and failed_urls is not None:
+                    failed_urls.add(url)
+
+        if not pywb_urls:
+            return key_stats_by_url
+
+        idx = self.cdx_list_func(pywb_urls, failed_urls=failed_urls)
+        prepared_requests_by_url = OrderedDict(
+            (url, self._pywb_resolver(url).prepare_requests(dates_by_url[url], idx[url])) for url in pywb_urls)
+        key_stats = iter(self.fetcher.fetch(chain.from_iterable(prepared_requests.itervalues()
+                                                                for prepared_requests in
+                                                                prepared_requests_by_url.itervalues())))
+        for url, prepared_requests in prepared_requests_by_url.iteritems():
+            key_stats_by_url[url] = [(date, next(key_stats)) for date, _ in prepared_requests]
+        return key_stats_by_url
 
 
 class DummyCache(object):
@@ -150,7 +368,10 @@ class DummyCache(object):
 
 class NonCachingAsyncRequestsClient(BaseClient):
 
-    def __init__(self, base_replay_url, grequests_pool_size, redis_cache=None, expire_after=0, expire_list_after=300):
+    def __init__(self, base_replay_url, grequests_pool_size, redis_cache=None, expire_after=0, expire_list_after=300,
+                 cdx_index=None, cdx_output=None, parse_executor=None, parsed_cache=None, http_cache=None,
+                 list_http_cache=None, timeseries_store=None, coalesce=True, map_func=grequests_map,
+                 trailing_returns_cache=None):
         """
         :param base_replay_url: Base replay url to query
         :type base_replay_url: str
@@ -160,6 +381,28 @@ class NonCachingAsyncRequestsClient(BaseClient):
         :type expire_after: int | None
         :param expire_list_after: CDX list cache expiration in seconds. None or zero to disable
         :type expire_list_after: int | None
+        :param cdx_index: Store of already listed recordings. Defaults to in-memory store refreshed after
+            `expire_list_after` seconds.
+        :type cdx_index: CdxIndexStore | None
+        :param cdx_output: Output format to request recordings in (e.g. json). None for the pywb html index page
+        :type cdx_output: str | None
+        :param parse_executor: Executor to parse the replayed pages with. None to parse inline.
+        :type parse_executor: ProcessPoolParseExecutor | None
+        :param parsed_cache: Persistent cache of parsed key stats. None to disable
+        :type parsed_cache: ParsedKeyStatsCache | None
+        :param http_cache: CacheControl cache of the replayed pages, e.g. :class:`SqliteHttpCache`. Defaults to
+            `FileCache('.http_cache')`
+        :param list_http_cache: CacheControl cache of the recording listings. Defaults to
+            `FileCache('.list_http_cache')`
+        :param timeseries_store: Store of already queried key stats. Only dates not in the store are resolved from
+            pywb. None to disable
+        :type timeseries_store: KeyStatsTimeSeriesStore | None
+        :param coalesce: False to run identical concurrent queries, and fetch identical concurrent replays, separately.
+            Otherwise they are run once, see :attr:`query_flight` and :attr:`replay_flight`.
+        :type coalesce: bool
+        :param map_func: function sending the requests to pywb, see :func:`grequests_map`
+        :param trailing_returns_cache: Persistent cache of parsed trailing returns tables. None to disable
+        :type trailing_returns_cache: ParsedTrailingReturnsCache | None
         """
         redis_cache = DummyCache if redis_cache is None else redis_cache
         self.base_replay_url = base_replay_url
@@ -167,23 +410,50 @@ class NonCachingAsyncRequestsClient(BaseClient):
         # We need to increase requests pool size since grequests makes many requests concurrently
         # See # See http://stackoverflow.com/questions/23632794/in-requests-library-how-can-i-avoid-httpconnectionpool-is-full-discarding-con
         requests_pool = max(10, 2 * grequests_pool_size)
-        cache_adapter = CacheControlAdapter(cache=FileCache('.http_cache'),
+        cache_adapter = CacheControlAdapter(cache=FileCache('.http_cache') if http_cache is None else http_cache,
                                             heuristic=ExpiresAfter(seconds=expire_after),
                                             pool_connections=requests_pool,
                                             pool_maxsize=requests_pool)
         self._session = Session()
         self._session.mount('http://', cache_adapter)
         self._list_session = Session()
-        list_cache_adapter = CacheControlAdapter(cache=FileCache('.list_http_cache'),
+        list_http_cache = FileCache('.list_http_cache') if list_http_cache is None else list_http_cache
+        list_cache_adapter = CacheControlAdapter(cache=list_http_cache,
                                                  heuristic=ExpiresAfter(seconds=expire_list_after))
         self._list_session.mount('http://', list_cache_adapter)
         self.redis_cache = redis_cache
-
-    def _cdx_list(self, urls):
+        self.cdx_index = CdxIndexStore(refresh_after=expire_list_after) if cdx_index is None else cdx_index
+        self.cdx_output = cdx_output
+        self.timeseries_store = timeseries_store
+        self._fetcher = BatchKeyStatsFetcher(grequests_pool_size, redis_cache, parse_executor=parse_executor,
+                                             parsed_cache=parsed_cache, coalesce=coalesce, map_func=map_func)
+        self._trailing_returns_fetcher = BatchKeyStatsFetcher(grequests_pool_size, redis_cache,
+                                                              parsed_cache=trailing_returns_cache, coalesce=coalesce,
+                                                              map_func=map_func,
+                                                              parse_func=parse_trailing_returns_from_responses,
+                                                              redis_namespace='trailing_returns')
+        self._map = map_func
+        self.query_flight = SingleFlight() if coalesce else None
+        self.failed_listings = 0
+
+    @property
+    def replay_flight(self):
+        return self._fetcher.replay_flight
+
+    @property
+    def failed_requests(self):
+        """Number of failed recording listings and replays, e.g. timeouts and transient pywb errors"""
+        return self.failed_listings + self._fetcher.failed + self._trailing_returns_fetcher.failed
+
+    @timed('cdx_list')
+    def _cdx_list(self, urls, failed_urls=None):
         """Return dict representing successful pywb recordings.
 
         :param urls: Urls to query recordings from pywb HTTP API
         :type urls: list[str]
+        :param failed_urls: set to add the urls whose listing failed to. Their recordings are those listed before, if
+            any.
+        :type failed_urls: set[str] | None
 
         :return: dict for each url representing the successful recordings of that page. Dict value format is documented in
             :func:`parse_idx_list`.
@@ -193,53 +463,143 @@ class NonCachingAsyncRequestsClient(BaseClient):
         See also:
 
         :func:`parse_idx_list`
+
+        Recordings are served from :attr:`cdx_index`. Only recordings newer than the last known recording are queried
+        for stale entries.
         """
+        idx = {}
+        refreshed = []
         prepared_requests = []
         for url in urls:
-            request = prepare_cdx_list_get(self.base_replay_url, url, session=self._list_session)
+            entry, needs_refresh = self.cdx_index.lookup(url)
+            if not needs_refresh:
+                idx[url] = entry.idx
+                continue
+            from_timestamp = None if entry is None else entry.last_timestamp
+            request = prepare_cdx_list_get(self.base_replay_url, url, session=self._list_session,
+                                           from_timestamp=from_timestamp, output=self.cdx_output)
+            refreshed.append((url, entry))
             prepared_requests.append(request)
-        responses = grequests.map(prepared_requests, size=self.grequests_pool_size)
-        idx = map(parse_idx_list, responses)
-        idx = {url: idx for url, idx in zip(urls, idx)}
+        responses = self._map(prepared_requests, size=self.grequests_pool_size)
+        for (url, entry), response in zip(refreshed, responses):
+            if is_failed_response(response):
+                # Use the recordings listed before, and list again on the next query
+                logging.getLogger('cdx_list').warning('Listing recordings of {} failed'.format(url))
+                self.failed_listings += 1
+                if failed_urls is not None:
+                    failed_urls.add(url)
+                idx[url] = _EMPTY_IDX if entry is None else entry.idx
+                continue
+            idx[url] = self.cdx_index.update(url, parse_idx_list(response, replay_base_url=self.base_replay_url))
         return idx
 
     def prepare_replay_get(self, date, url_idx):
         return prepare_replay_get(date, url_idx, session=self._session)
 
-    def query_key_stats(self, date_interval, urls):
+    def query_key_stats(self, date_interval, urls, fields=None):
         """
 
         :param date_interval:
         :param urls:
-        :param base_replay_url:
-        :param grequests_pool_size:
+        :param fields: key stats fields to query, see :meth:`query_key_stats_frame`
         :return:
         :rtype list:
         """
         if not urls:
             return []
-        logger = logging.getLogger('query_key_stats')
+        return key_stats_records(self.query_key_stats_frame(date_interval, urls, fields))
+
+    def query_key_stats_frame(self, date_interval, urls, fields=None):
+        """Query key stats as columns
+
+        Identical concurrent queries are run once, and share the returned frame.
+
+        :param fields: key stats fields to query, see :data:`KEY_STATS_FIELD_NAMES`. Defaults to `value`
+        :type fields: list[str] | None
+        :return: key stats of the fields as assembled by :func:`assemble_key_stats`, sorted by value date and rank of
+            the url
+        :rtype: pd.DataFrame
+        :raise ValueError: on unknown fields
+        """
+        fields = key_stats_fields(fields)
+        if self.query_flight is None:
+            return self._query_key_stats_frame(date_interval, urls, fields)
+        return self.query_flight.do((tuple(date_interval), tuple(urls), fields), self._query_key_stats_frame,
+                                    date_interval, urls, fields)
+
+    @timed('query')
+    def _query_key_stats_frame(self, date_interval, urls, fields):
         dates = pd.date_range(*date_interval)
 
-        all_key_stats = []
+        resolver = DelegatingKeyStatsResolver(self._cdx_list, self.prepare_replay_get, self._fetcher)
+        # The time series store keeps only the values. Other fields are looked up from the parsed key stats caches.
+        if self.timeseries_store is None or fields != ('value',):
+            key_stats_by_url = resolver.parse_many(urls, dates)
+        else:
+            key_stats_by_url = self._query_key_stats_with_store(resolver, urls, dates)
+        return assemble_key_stats(urls, key_stats_by_url, fields)
+
+    def query_trailing_returns(self, date_interval, urls):
+        """Query trailing returns tables of the instruments from their tab=1 pages
+
+        Recordings of the tab=1 pages of all urls are listed at once, and the pages of every (url, date) pair are
+        fetched and parsed as a single batch. Parsed tables are cached by replay url.
+
+        :return: trailing returns as assembled by :func:`assemble_trailing_returns`
+        :rtype: pd.DataFrame
+        """
+        dates = pd.date_range(*date_interval)
+        tab_urls = OrderedDict((url, trailing_returns_url(url)) for url in urls)
+        idx = self._cdx_list(tab_urls.values())
+        prepared_requests_by_url = OrderedDict(
+            (url, PyWbIndexBasedKeyStatsResolver(tab_url, self._cdx_list, self.prepare_replay_get,
+                                                 self._trailing_returns_fetcher).prepare_requests(dates, idx[tab_url]))
+            for url, tab_url in tab_urls.iteritems())
+        tables = iter(self._trailing_returns_fetcher.fetch(chain.from_iterable(
+            prepared_requests.itervalues() for prepared_requests in prepared_requests_by_url.itervalues())))
+        tables_by_url = {url: [(date, next(tables)) for date, _ in prepared_requests]
+                         for url, prepared_requests in prepared_requests_by_url.iteritems()}
+        return assemble_trailing_returns(urls, tables_by_url)
+
+    def iter_key_stats(self, date_interval, urls):
+        """Query key stats instrument by instrument
+
+        Key stats of each unique url are yielded as soon as the url is resolved, in the format of
+        :meth:`query_key_stats`.
+
+        :rtype: iterable[list[dict]]
+        """
+        queried = set()
+        for url in urls:
+            if url in queried:
+                continue
+            queried.add(url)
+            yield self.query_key_stats(date_interval, [url])
+
+    def _query_key_stats_with_store(self, resolver, urls, dates):
+        """Answer from :attr:`timeseries_store` and resolve only the dates missing from the store
+
+        :return: values of each unique url, as arrays returned by :func:`key_stats_array`
+        :rtype: dict[str, np.ndarray]
+        """
+        key_stats_by_url = {}
+        missing_dates_by_url = OrderedDict()
         for url in urls:
-            key_stats = DelegatingKeyStatsResolver(self._cdx_list,
-                                                   self.prepare_replay_get, self.grequests_pool_size,
-                                                   self.redis_cache).parse(url, dates)
-            # Unwrap scrapy data types
-            key_stats = map(dict, key_stats)
-            for ks in key_stats:
-                ks['instrument_url'] = url
-
-            # Filter invalid
-            key_stats = [key_stat for key_stat in key_stats if len(key_stat) > 1]
-
-            # Day accuracy is enough
-            for key_stat in key_stats:
-                key_stat['value_date'] = pd.Timestamp(key_stat['value_date'].date(), tz=pytz.UTC)
-            all_key_stats.extend(key_stats)
-
-        sort_key_fun = lambda item: (item['value_date'], urls.index(item['instrument_url']))
-        all_key_stats = list(iter_sort_uniq(all_key_stats, sort_key_fun))
-
-        return all_key_stats
\ No newline at end of file
+            if url in key_stats_by_url:
+                continue
+            key_stats_by_url[url], missing_dates = self.timeseries_store.lookup_array(url, dates)
+            if len(missing_dates):
+                missing_dates_by_url[url] = missing_dates
+        logging.getLogger('query_key_stats').debug('Resolving {} of {} urls from pywb'.format(
+            len(missing_dates_by_url), len(key_stats_by_url)))
+        if not missing_dates_by_url:
+            return key_stats_by_url
+
+        failed_urls = set()
+        for url, date_key_stats in resolver.resolve_many(missing_dates_by_url, failed_urls=failed_urls).iteritems():
+            # Without a complete listing, dates having a recording would be stored as days without data
+            if url not in failed_urls:
+                self.timeseries_store.update(url, missing_dates_by_url[url], date_key_stats)
+            key_stats_by_url[url] = np.concatenate([key_stats_by_url[url],
+                                                    key_stats_array([key_stats for _, key_stats in date_key_stats])])
+        return key_stats_by_url
@@ -0,0 +1,267 @@
+"""Adaptive concurrency, retries and circuit breaking of pywb requests
+
+:class:`FlowControlledMap` wraps a map function (:func:`grequests_map` or :class:`ThreadPoolMap`). Each request is
+sent by itself from a greenlet (or a thread, for a map function blocking the calling thread), keeping up to
+:attr:`AIMDLimiter.limit` requests in flight. A failed request is scheduled to be retried after its own backoff delay,
+without holding back the other requests.
+"""
+import heapq
+import logging
+import random
+import threading
+import time
+import urlparse
+from collections import deque
+from Queue import Empty, Queue
+
+import gevent
+import gevent.queue
+
+# Statuses of transient pywb and proxy errors
+RETRY_STATUSES = frozenset([500, 502, 503, 504])
+
+
+def is_failed_response(response):
+    """Return True if the request failed (no response, e.g. connection error or timeout) or the status is transient
+
+    :type response: requests.Response | None
+    """
+    return response is None or response.status_code in RETRY_STATUSES
+
+
+class RetryPolicy(object):
+    """Bounded retries of failed requests, with exponential backoff and full jitter"""
+
+    def __init__(self, retries=2, backoff=0.5):
+        """
+        :param retries: number of retries of a failed request
+        :type retries: int
+        :param backoff: base delay between retries in seconds. Delay before retry n is drawn uniformly from
+            [0, backoff * 2 ** (n - 1)].
+        :type backoff: float
+        """
+        self.retries = retries
+        self.backoff = backoff
+
+    def should_retry(self, response, attempt):
+        """
+        :param attempt: zero-based number of the attempt that got the response
+        """
+        return attempt < self.retries and is_failed_response(response)
+
+    def delay(self, retry):
+        """Return delay in seconds before the retry (1 for the first retry)"""
+        return random.uniform(0, self.backoff * 2 ** (retry - 1))
+
+
+class AIMDLimiter(object):
+    """Concurrency limit with additive increase and multiplicative decrease (AIMD)
+
+    The limit grows by `increase` per `limit` successful requests, i.e. by `increase` per round trip when the limit is
+    used. It is multiplied by `decrease` on a failed request or on a request slower than `latency_target`. After a
+    decrease, congestion is ignored until as many requests as the limit before the decrease have completed, so that a
+    single wave of failures decreases the limit only once.
+    """
+
+    def __init__(self, min_limit=1, max_limit=64, initial_limit=None, increase=1.0, decrease=0.5,
+                 latency_target=None):
+        """
+        :param initial_limit: defaults to `max_limit`
+        :param latency_target: latency in seconds above which requests count as congested. None to react only to
+            failures.
+        :type latency_target: float | None
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self._limit = float(max_limit if initial_limit is None else initial_limit)
+        self._increase = increase
+        self._decrease = decrease
+        self._latency_target = latency_target
+        self._since_decrease = 0
+        self._decrease_window = 0
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    def record(self, latency, failed):
+        """Record completed request
+
+        :param latency: latency of the request in seconds
+        :param failed: True if the request failed
+        """
+        with self._lock:
+            self._since_decrease += 1
+            congested = failed or (self._latency_target is not None and latency > self._latency_target)
+            if not congested:
+                self._limit = min(self.max_limit, self._limit + self._increase / self._limit)
+            elif self._since_decrease > self._decrease_window:
+                self._decrease_window = self._limit
+                self._limit = max(self.min_limit, self._limit * self._decrease)
+                self._since_decrease = 0
+
+
+class CircuitBreaker(object):
+    """Fail fast after `failure_threshold` consecutive failures
+
+    The circuit is open for `reset_after` seconds, rejecting all requests. Then a single trial request is let through
+    (half-open): the circuit is closed if the trial succeeds and opened again if it fails.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold=20, reset_after=30, clock=time.time):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a request may be sent"""
+        with self._lock:
+            if self.state == self.OPEN and self._clock() - self._opened_at >= self.reset_after:
+                self.state = self.HALF_OPEN
+                return True
+            return self.state == self.CLOSED
+
+    def record(self, failed):
+        with self._lock:
+            if not failed:
+                self._failures = 0
+                self.state = self.CLOSED
+                return
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = self._clock()
+
+
+def _spawn_thread(func, *args):
+    thread = threading.Thread(target=func, args=args)
+    thread.daemon = True
+    thread.start()
+
+
+class FlowControlledMap(object):
+    """Map function with per-request timeouts, adaptive concurrency, bounded retries and per-host circuit breakers
+
+    Returns the same as the wrapped map function: responses in the order of the requests, None for failed requests and
+    for requests rejected by an open circuit.
+    """
+
+    def __init__(self, map_func, limiter, retry_policy=None, timeout=(5, 30), failure_threshold=20, reset_after=30,
+                 threaded=False):
+        """
+        :param map_func: map function to send each request with, e.g. :func:`grequests_map`
+        :type limiter: AIMDLimiter
+        :type retry_policy: RetryPolicy | None
+        :param timeout: requests timeout in seconds, or tuple of (connect, read) timeouts
+        :param failure_threshold: consecutive failures opening the circuit of a host, see :class:`CircuitBreaker`
+        :param reset_after: seconds before a trial request is sent to a host with open circuit
+        :param threaded: True if `map_func` blocks the calling thread (e.g. :class:`ThreadPoolMap`), to send each
+            request from a thread. Otherwise the requests are sent from greenlets.
+        :type threaded: bool
+        """
+        self._map = map_func
+        self._threaded = threaded
+        self.limiter = limiter
+        self.retry_policy = RetryPolicy(retries=0) if retry_policy is None else retry_policy
+        self._timeout = timeout
+        self._failure_threshold = failure_threshold
+        self._reset_after = reset_after
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self.retried = 0
+        self.rejected = 0
+        self._logger = logging.getLogger('FlowControlledMap')
+
+    def breaker(self, url):
+        """Return circuit breaker of the host of the url
+
+        :rtype: CircuitBreaker
+        """
+        host = urlparse.urlsplit(url).netloc
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(self._failure_threshold, self._reset_after)
+            return breaker
+
+    def _send(self, reqs, i, attempt, results):
+        """Send attempt of a request and put (index of the request, attempt, response) to `results`"""
+        req = reqs[i]
+        req.kwargs.setdefault('timeout', self._timeout)
+        # Response of a previous attempt
+        req.response = None
+        response = None
+        started = time.time()
+        try:
+            response, = self._map([req], size=1)
+        finally:
+            failed = is_failed_response(response)
+            self.limiter.record(time.time() - started if response is None else response.elapsed.total_seconds(),
+                                failed)
+            self.breaker(req.url).record(failed)
+            results.put((i, attempt, response))
+
+    def __call__(self, reqs, size=None):
+        """Send the requests
+
+        :param size: ignored, concurrency is limited by :attr:`limiter`
+        :rtype: list[requests.Response | None]
+        """
+        reqs = list(reqs)
+        responses = [None] * len(reqs)
+        if self._threaded:
+            spawn, results = _spawn_thread, Queue()
+        else:
+            spawn, results = gevent.spawn, gevent.queue.Queue()
+        # Indices of the requests not sent yet, and (time to retry at, index of the request, attempt) of failed ones
+        unsent = deque(xrange(len(reqs)))
+        retries = []
+        in_flight = 0
+        while unsent or retries or in_flight:
+            while in_flight < self.limiter.limit and (unsent or retries):
+                # Retries first, as soon as their delay has passed
+                if retries and retries[0][0] <= time.time():
+                    _, i, attempt = heapq.heappop(retries)
+                elif unsent:
+                    i, attempt = unsent.popleft(), 0
+                else:
+                    break
+                if not self.breaker(reqs[i].url).allow():
+                    self.rejected += 1
+                    continue
+                spawn(self._send, reqs, i, attempt, results)
+                in_flight += 1
+            if not in_flight and not retries:
+                break
+            # Wake up for a completed request, or for the next retry if a request could then be sent
+            timeout = None
+            if retries and in_flight < self.limiter.limit:
+                timeout = max(0, retries[0][0] - time.time())
+            try:
+                i, attempt, response = results.get(timeout=timeout)
+            except Empty:
+                continue
+            in_flight -= 1
+            if self.retry_policy.should_retry(response, attempt):
+                if response is not None:
+                    response.close()
+                self.retried += 1
+                self._logger.warning('Retrying failed request to %s, concurrency limit %d', reqs[i].url,
+                                     self.limiter.limit)
+                heapq.heappush(retries, (time.time() + self.retry_policy.delay(attempt + 1), i, attempt + 1))
+            else:
+                responses[i] = response
+        return responses
+
+    def stats(self):
+        with self._lock:
+            open_circuits = sum(breaker.state != CircuitBreaker.CLOSED for breaker in self._breakers.itervalues())
+        return {'limit': self.limiter.limit, 'retried': self.retried, 'rejected': self.rejected,
+                'open_circuits': open_circuits}
@@ -0,0 +1,61 @@
+"""WSGI entry point of the REST server on a gevent loop, e.g. uwsgi with --gevent (see scripts/run_uwsgi_gevent)
+
+The archive client sends its requests with grequests, i.e. as greenlets. Under synchronous uwsgi workers a worker
+is blocked for the whole fan-out of a query. On a gevent loop a worker serves many concurrent requests as greenlets,
+each switching away while waiting for pywb, and all of them share the client of the process: its HTTP connection
+pool, CDX index, caches, stores and coalescing of concurrent queries.
+
+gevent has to monkeypatch the standard library before anything creating sockets, locks or threads is imported
+(requests, redis, the client), so import this module first:
+
+    uwsgi --gevent 100 --gevent-early-monkey-patch -w financedatahoarder.services.gevent_app:app
+
+or, without uwsgi, run the gevent WSGI server of this module:
+
+    python -m financedatahoarder.services.gevent_app --port 5000
+
+Parsing is done in the greenlet of the request and blocks the loop meanwhile. Keep PARSE_PROCESSES at 0 (the
+multiprocessing pool and its handler threads are not meant for a monkeypatched process) and run a worker process per
+core instead.
+"""
+from gevent import monkey
+monkey.patch_all()
+
+import argparse
+import logging
+
+
+def create_app():
+    """Import the REST server after checking that the standard library is monkeypatched
+
+    :rtype: flask.Flask
+    """
+    if not monkey.is_module_patched('socket') or not monkey.is_module_patched('threading'):
+        raise RuntimeError('gevent monkeypatching of socket and threading is required')
+    from financedatahoarder.services import rest_server
+    if rest_server.app.config['PARSE_PROCESSES']:
+        logging.getLogger(__name__).warning('PARSE_PROCESSES={} is not supported on a gevent loop'.format(
+            rest_server.app.config['PARSE_PROCESSES']))
+    return rest_server.app
+
+
+app = create_app()
+
+
+def main(argv=None):
+    from gevent.pool import Pool
+    from gevent.pywsgi import WSGIServer
+
+    parser = argparse.ArgumentParser(description='Serve the REST server with the gevent WSGI server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=100,
+                        help='maximum number of concurrent requests (default: %(default)s)')
+    args = parser.parse_args(argv)
+    server = WSGIServer((args.host, args.port), app, spawn=Pool(args.concurrency), log=None)
+    logging.getLogger(__name__).info('Serving on http://{}:{}/'.format(args.host, args.port))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""Bounded HTTP cache for CacheControl stored in a single SQLite file
+
+Statistics and compaction of a cache file are available from the command line:
+
+    python -m financedatahoarder.services.http_cache stats .http_cache.sqlite
+    python -m financedatahoarder.services.http_cache compact .http_cache.sqlite --max-bytes 1000000000
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from cachecontrol.cache import BaseCache
+
+from financedatahoarder.services.sqlite_utils import ThreadLocalConnection
+
+
+class SqliteHttpCache(BaseCache):
+    """CacheControl cache storing all responses in a single SQLite database
+
+    The cache is bounded by total size of the cached responses (`max_bytes`) and number of entries (`max_entries`).
+    When a limit is exceeded, least recently used entries are evicted until the cache is at `evict_to` fraction of
+    the limits. Entries not accessed in `ttl` seconds are evicted regardless of the limits.
+
+    Freshness of the responses is still decided by CacheControl (e.g. with the `ExpiresAfter` heuristic), the limits
+    only bound the storage.
+    """
+
+    def __init__(self, path, max_bytes=None, max_entries=None, ttl=None, evict_to=0.9, check_every=100,
+                 touch_after=60):
+        """
+        :param path: path of the SQLite database file
+        :type path: str
+        :param max_bytes: maximum total size of the cached responses in bytes. None for unlimited
+        :type max_bytes: int | None
+        :param max_entries: maximum number of cached responses. None for unlimited
+        :type max_entries: int | None
+        :param ttl: seconds after last access after which entries are evicted. None to disable
+        :type ttl: int | None
+        :param evict_to: fraction of the limits to evict down to
+        :param check_every: number of writes between checks of the limits
+        :param touch_after: access time of an entry is updated on reads only if it is older than this many seconds,
+            to avoid a write on every cache hit
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._evict_to = evict_to
+        self._check_every = check_every
+        self._touch_after = touch_after
+        self._writes_since_check = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._connection = ThreadLocalConnection(path, [
+            'CREATE TABLE IF NOT EXISTS responses '
+            '(key TEXT PRIMARY KEY, value BLOB, size INTEGER, accessed_at REAL)',
+            'CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)']).get
+        self._logger = logging.getLogger('SqliteHttpCache')
+
+    def get(self, key):
+        now = time.time()
+        row = self._connection().execute('SELECT value, accessed_at FROM responses WHERE key = ?',
+                                          (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        value, accessed_at = row
+        if self.ttl and now - accessed_at >= self.ttl:
+            self.misses += 1
+            self.delete(key)
+            return None
+        self.hits += 1
+        if now - accessed_at >= self._touch_after:
+            self._execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+        return str(value)
+
+    def set(self, key, value):
+        self._execute('INSERT OR REPLACE INTO responses (key, value, size, accessed_at) VALUES (?, ?, ?, ?)',
+                      (key, sqlite3.Binary(value), len(value), time.time()))
+        self._writes_since_check += 1
+        if self._writes_since_check >= self._check_every:
+            self.evict()
+
+    def delete(self, key):
+        self._execute('DELETE FROM responses WHERE key = ?', (key,))
+
+    def _execute(self, statement, params=()):
+        connection = self._connection()
+        try:
+            with connection:
+                return connection.execute(statement, params)
+        except sqlite3.OperationalError:
+            # E.g. database locked by another process for too long. Caching is best effort.
+            self._logger.warning('Could not write to http cache %s', self.path, exc_info=True)
+
+    def _totals(self):
+        return self._connection().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+
+    def evict(self, now=None):
+        """Evict expired entries and least recently used entries exceeding the limits
+
+        :return: number of evicted entries
+        :rtype: int
+        """
+        now = time.time() if now is None else now
+        self._writes_since_check = 0
+        connection = self._connection()
+        num_evicted = 0
+        if self.ttl:
+            cursor = self._execute('DELETE FROM responses WHERE accessed_at <= ?', (now - self.ttl,))
+            num_evicted += cursor.rowcount if cursor is not None else 0
+        entries, total_bytes = self._totals()
+        excess_entries = entries - int(self._evict_to * self.max_entries) \
+            if self.max_entries is not None and entries > self.max_entries else 0
+        excess_bytes = total_bytes - int(self._evict_to * self.max_bytes) \
+            if self.max_bytes is not None and total_bytes > self.max_bytes else 0
+        if excess_entries > 0 or excess_bytes > 0:
+            keys = []
+            freed_bytes = 0
+            for key, size in connection.execute('SELECT key, size FROM responses ORDER BY accessed_at'):
+                if len(keys) >= excess_entries and freed_bytes >= excess_bytes:
+                    break
+                keys.append((key,))
+                freed_bytes += size
+            try:
+                with connection:
+                    connection.executemany('DELETE FROM responses WHERE key = ?', keys)
+            except sqlite3.OperationalError:
+                self._logger.warning('Could not evict from http cache %s', self.path, exc_info=True)
+                keys = []
+            num_evicted += len(keys)
+        self.evictions += num_evicted
+        return num_evicted
+
+    def compact(self):
+        """Evict entries exceeding the limits and reclaim the free space of the database file
+
+        :return: number of evicted entries
+        :rtype: int
+        """
+        num_evicted = self.evict()
+        self._connection().execute('VACUUM')
+        return num_evicted
+
+    def stats(self):
+        """Return statistics of the cache"""
+        entries, total_bytes = self._totals()
+        return {'entries': entries, 'bytes': total_bytes,
+                'file_bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Show statistics of or compact SQLite HTTP cache')
+    parser.add_argument('command', choices=['stats', 'compact'])
+    parser.add_argument('path', help='cache database file')
+    parser.add_argument('--max-bytes', type=int, default=None, help='total size of responses to compact to')
+    parser.add_argument('--max-entries', type=int, default=None, help='number of responses to compact to')
+    parser.add_argument('--ttl', type=int, default=None,
+                        help='evict responses not accessed in this many seconds')
+    args = parser.parse_args(argv)
+    cache = SqliteHttpCache(args.path, max_bytes=args.max_bytes, max_entries=args.max_entries, ttl=args.ttl,
+                            evict_to=1.0)
+    if args.command == 'compact':
+        print 'Evicted {} entries'.format(cache.compact())
+    print json.dumps(cache.stats(), indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
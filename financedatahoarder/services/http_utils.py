@@ -1,4 +1,5 @@
 import urlparse
+from urllib import urlencode
 
 from posixpath import join as urljoin
 import grequests
@@ -21,6 +22,13 @@ def split_url_and_params(url):
     return base_url, params
 
 
+def trailing_returns_url(url):
+    """Return url of the trailing returns tab (tab=1) of Morningstar.fi snapshot page url"""
+    base_url, params = split_url_and_params(url)
+    params['tab'] = '1'
+    return '{}?{}'.format(base_url, urlencode(sorted(params.items())))
+
+
 def grequest_get(url, session):
     """grequests.get wrapper for urls with params"""
     base_url, params = split_url_and_params(url)
@@ -49,7 +57,18 @@ def prepare_replay_get(replay_datetime, idx, session=None):
     return req
 
 
-def prepare_cdx_list_get(base_replay_url, url_to_replay, session=None):
+def prepare_cdx_list_get(base_replay_url, url_to_replay, session=None, from_timestamp=None, output=None):
+    """Prepare query listing the recordings of `url_to_replay`
+
+    :param from_timestamp: list only recordings at or after this pywb timestamp (e.g. 20150312190004)
+    :type from_timestamp: str | None
+    :param output: output format of the listing (e.g. json). None for the default html output
+    :type output: str | None
+    """
     full_url = urljoin(base_replay_url, 'pywb-cdx', '*', url_to_replay)
     req = grequest_get(full_url, session=session)
+    if from_timestamp is not None:
+        req.kwargs['params']['from'] = from_timestamp
+    if output is not None:
+        req.kwargs['params']['output'] = output
     return req
\ No newline at end of file
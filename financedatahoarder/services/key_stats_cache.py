@@ -0,0 +1,186 @@
+import json
+import logging
+import pickle
+import urlparse
+from urllib import urlencode
+
+import pandas as pd
+import pytz
+import redis
+
+from financedatahoarder.services.sqlite_utils import ThreadLocalConnection
+
+
+def replay_cache_key(req):
+    """Cache key of a replay request
+
+    The key is the full replay url with sorted query parameters. It does not depend on how the url was split to base
+    url and params by :func:`prepare_replay_get`.
+
+    :param req: replay request
+    :type req: grequests.AsyncRequest
+    :rtype: str
+    """
+    base_url, _, qs = req.url.partition('?')
+    params = dict(req.kwargs.get('params') or {})
+    # Decode the query string of the url, as the params are encoded by urlencode
+    for k, v in urlparse.parse_qsl(qs, keep_blank_values=True):
+        params.setdefault(k, v)
+    if not params:
+        return base_url
+    return '{}?{}'.format(base_url, urlencode(sorted(params.items())))
+
+
+class RedisKeyStatsCache(object):
+    """Key stats cache storing one pickled entry per replay request
+
+    Lookups of a batch of requests are made with a single MGET and writes with a single pipeline. Entries expire after
+    `expire` seconds (defaults to the expiration of the `redis_cache`).
+    """
+
+    metrics_name = 'redis'
+
+    def __init__(self, redis_cache, expire=None, namespace='overview_key_stats'):
+        """
+        :param redis_cache: cache with redis `connection`, e.g. `redis_cache.rediscache.SimpleCache`. Caching is
+            disabled if the connection is None.
+        :param expire: expiration in seconds. None or zero to disable expiration
+        :type expire: int | None
+        """
+        self._connection = redis_cache.connection
+        self._expire = getattr(redis_cache, 'expire', None) if expire is None else expire
+        self._prefix = 'financedatahoarder-{}:'.format(namespace)
+        self._logger = logging.getLogger('RedisKeyStatsCache')
+
+    @property
+    def enabled(self):
+        return self._connection is not None
+
+    def _redis_key(self, req):
+        return self._prefix + replay_cache_key(req)
+
+    def get_many(self, reqs):
+        """Look up cached key stats
+
+        :param reqs: replay requests
+        :return: cached key stats by index of the request in `reqs`
+        :rtype: dict[int, OverviewKeyStats]
+        """
+        if not self.enabled or not reqs:
+            return {}
+        try:
+            values = self._connection.mget([self._redis_key(req) for req in reqs])
+        except redis.RedisError:
+            self._logger.exception('Could not query redis cache')
+            return {}
+        return {i: pickle.loads(value) for i, value in enumerate(values) if value is not None}
+
+    def set_many(self, reqs, key_stats):
+        """Store key stats corresponding to the replay requests"""
+        if not self.enabled or not reqs:
+            return
+        pipe = self._connection.pipeline(transaction=False)
+        for req, key_stat in zip(reqs, key_stats):
+            value = pickle.dumps(key_stat, pickle.HIGHEST_PROTOCOL)
+            if self._expire:
+                pipe.setex(self._redis_key(req), self._expire, value)
+            else:
+                pipe.set(self._redis_key(req), value)
+        try:
+            pipe.execute()
+        except redis.RedisError:
+            self._logger.exception('Could not store to redis cache')
+
+
+def _encode_key_stats(key_stats):
+    record = dict(key_stats)
+    record['value_date'] = record['value_date'].isoformat()
+    return json.dumps(record, sort_keys=True)
+
+
+def _decode_key_stats(record):
+    key_stats = json.loads(record)
+    key_stats['value_date'] = pd.Timestamp(key_stats['value_date']).tz_convert(pytz.UTC)
+    return key_stats
+
+
+def _encode_trailing_returns(trailing_returns):
+    # NaN returns are encoded as NaN literals, which json.loads accepts
+    return json.dumps(dict(trailing_returns), sort_keys=True)
+
+
+class ParsedKeyStatsCache(object):
+    """Persistent cache of parsed key stats keyed by the (timestamped) replay url
+
+    Archived replays never change, so the parsed key stats of a replay url can be cached without expiration. Only the
+    tiny parse results are stored, in a single SQLite database. Replays that could not be parsed are not cached.
+    """
+
+    metrics_name = 'parsed'
+    # Key stats cached in the former `key_stats` table lack the fields besides the value, and are not looked up
+    _table = 'overview_key_stats'
+    _encode = staticmethod(_encode_key_stats)
+    _decode = staticmethod(_decode_key_stats)
+
+    def __init__(self, path):
+        """
+        :param path: path of the SQLite database file
+        :type path: str
+        """
+        self.path = path
+        self._connection = ThreadLocalConnection(path, [
+            'CREATE TABLE IF NOT EXISTS {} (replay_url TEXT PRIMARY KEY, record TEXT)'.format(self._table)]).get
+
+    def get_many(self, reqs):
+        """Look up parsed key stats
+
+        :param reqs: replay requests
+        :return: cached key stats by index of the request in `reqs`
+        :rtype: dict[int, dict]
+        """
+        return self.get_many_by_url([replay_cache_key(req) for req in reqs])
+
+    def get_many_by_url(self, replay_urls):
+        """Look up parsed key stats by replay url (as returned by :func:`replay_cache_key`)
+
+        :return: cached key stats by index of the url in `replay_urls`
+        :rtype: dict[int, dict]
+        """
+        found = {}
+        connection = self._connection()
+        # Stay below the default SQLite limit of 999 query parameters
+        for start in xrange(0, len(replay_urls), 500):
+            chunk = replay_urls[start:start + 500]
+            rows = connection.execute('SELECT replay_url, record FROM {} WHERE replay_url IN ({})'.format(
+                self._table, ', '.join('?' * len(chunk))), chunk).fetchall()
+            found.update(rows)
+        return {i: self._decode(found[url]) for i, url in enumerate(replay_urls) if url in found}
+
+    def set_many(self, reqs, key_stats):
+        """Store parsed key stats corresponding to the replay requests"""
+        self.set_many_by_url([replay_cache_key(req) for req in reqs], key_stats)
+
+    def set_many_by_url(self, replay_urls, key_stats):
+        """Store parsed key stats by replay url (as returned by :func:`replay_cache_key`)"""
+        rows = [(url, self._encode(key_stat)) for url, key_stat in zip(replay_urls, key_stats) if key_stat]
+        if not rows:
+            return
+        connection = self._connection()
+        with connection:
+            connection.executemany('INSERT OR REPLACE INTO {} (replay_url, record) VALUES (?, ?)'.format(self._table),
+                                   rows)
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM {}'.format(self._table)).fetchone()[0]
+
+
+class ParsedTrailingReturnsCache(ParsedKeyStatsCache):
+    """Persistent cache of parsed trailing returns tables keyed by the replay url of the tab=1 page
+
+    Can share the database file with :class:`ParsedKeyStatsCache`.
+    """
+
+    metrics_name = 'parsed_trailing_returns'
+    _table = 'trailing_returns'
+    _encode = staticmethod(_encode_trailing_returns)
+    _decode = staticmethod(json.loads)
@@ -6,7 +6,11 @@ from flask.ext.restplus import Api
 class ManyFormatApi(Api):
     FORMAT_MIMETYPE_MAP = {
         "csv": "text/csv",
-        "json": "application/json"
+        "json": "application/json",
+        "npz": "application/x-npz",
+        "arrow": "application/vnd.apache.arrow.stream",
+        "parquet": "application/vnd.apache.parquet",
+        "msgpack": "application/x-msgpack"
         # Add other mimetypes as desired here
     }
 
@@ -21,4 +25,30 @@ class ManyFormatApi(Api):
             preferred_response_type.append(mimetype)
             if not mimetype:
                 raise NotAcceptable()
-        return preferred_response_type + super(ManyFormatApi, self).mediatypes()
\ No newline at end of file
+        return preferred_response_type + super(ManyFormatApi, self).mediatypes()
+
+    def requested_mediatype(self):
+        """Return the mediatype the response will be represented in, or None if no representation is acceptable"""
+        format = request.args.get("format")
+        if format:
+            mimetype = self.FORMAT_MIMETYPE_MAP.get(format)
+            return mimetype if mimetype in self.representations else None
+        return request.accept_mimetypes.best_match(self.representations, default=self.default_mediatype)
+
+    def make_response(self, data, *args, **kwargs):
+        """Use the representation requested by the `format` URL argument, falling back to the Accept header"""
+        format = request.args.get("format")
+        if not format:
+            return super(ManyFormatApi, self).make_response(data, *args, **kwargs)
+        mimetype = self.FORMAT_MIMETYPE_MAP.get(format)
+        if mimetype not in self.representations:
+            if 'fallback_mediatype' in kwargs:
+                # Responding with an error (e.g. NotAcceptable below), fall back to the Accept header
+                return super(ManyFormatApi, self).make_response(data, *args, **kwargs)
+            raise NotAcceptable()
+        kwargs.pop('fallback_mediatype', None)
+        resp = self.representations[mimetype](data, *args, **kwargs)
+        if resp.mimetype == 'text/html':
+            # Representation did not set the content type explicitly
+            resp.headers['Content-Type'] = mimetype
+        return resp
@@ -0,0 +1,196 @@
+import json
+from collections import OrderedDict
+from itertools import izip
+from io import BytesIO
+from StringIO import StringIO
+
+import numpy as np
+import pandas as pd
+
+from financedatahoarder.services.columnar_formats import encode_npz
+from financedatahoarder.services.utils import TRAILING_RETURNS_COLUMNS
+
+
+def pivot_key_stats(df, urls, fill=False):
+    """Pivot key stats to a value date x instrument matrix
+
+    :param df: key stats as assembled by :func:`assemble_key_stats`
+    :type df: pd.DataFrame
+    :param urls: urls of the instruments, defining the order of the columns
+    :param fill: True to include every day between the first and last value date, forward-filling days without value
+    :type fill: bool
+    :return: values indexed by value date, one column for each unique url
+    :rtype: pd.DataFrame
+    """
+    unique_urls = list(OrderedDict.fromkeys(urls))
+    if not len(df):
+        return pd.DataFrame(columns=unique_urls, index=pd.DatetimeIndex([], tz='UTC', name='value_date'),
+                            dtype=np.float64)
+    matrix = df.pivot(index='value_date', columns='instrument_url', values='value').reindex(columns=unique_urls)
+    matrix.columns.name = None
+    if fill:
+        matrix = matrix.reindex(pd.date_range(matrix.index.min(), matrix.index.max(), freq='D', name='value_date'))
+        matrix = matrix.ffill()
+    return matrix
+
+
+class KeyStatsMatrix(object):
+    """Value date x instrument matrix of key stats, with encoders for the supported representations"""
+
+    def __init__(self, matrix):
+        """
+        :param matrix: matrix as returned by :func:`pivot_key_stats`
+        :type matrix: pd.DataFrame
+        """
+        self.matrix = matrix
+
+    def to_columns(self):
+        """Return `value_date` column followed by the column of each instrument url
+
+        :rtype: OrderedDict[str, np.ndarray]
+        """
+        columns = OrderedDict([('value_date', np.asarray(self.matrix.index.values, dtype='datetime64[D]'))])
+        for url in self.matrix.columns:
+            columns[url] = self.matrix[url].values.astype(np.float64)
+        return columns
+
+    def _value_dates(self):
+        return [value_date.strftime('%Y-%m-%d') for value_date in self.matrix.index]
+
+    def to_csv(self):
+        """Encode as CSV with `value_date` column followed by a column for each instrument url"""
+        buf = StringIO()
+        self.matrix.to_csv(buf, index_label='value_date', date_format='%Y-%m-%d')
+        return buf.getvalue()
+
+    def to_json(self):
+        """Encode as JSON column arrays
+
+        `values[i]` is the column of `instrument_url[i]`, missing values are null.
+        """
+        values = [[None if np.isnan(value) else value for value in self.matrix[column].values.tolist()]
+                  for column in self.matrix.columns]
+        return json.dumps(OrderedDict([('value_date', self._value_dates()),
+                                       ('instrument_url', list(self.matrix.columns)),
+                                       ('values', values)]))
+
+    def to_npz(self):
+        """Encode as NumPy npz archive
+
+        The archive contains `value_date` (datetime64[D]), `instrument_url` (unicode) and `values` (float64, value
+        dates x instruments) arrays. It can be read without pickle support, e.g. `np.load(BytesIO(content))`.
+        """
+        buf = BytesIO()
+        np.savez(buf,
+                 value_date=np.asarray(self.matrix.index.values, dtype='datetime64[D]'),
+                 instrument_url=np.array([unicode(url) for url in self.matrix.columns], dtype=np.unicode_),
+                 values=self.matrix.values.astype(np.float64))
+        return buf.getvalue()
+
+
+class KeyStatsTable(object):
+    """Key stats as assembled by :func:`assemble_key_stats`, with encoders for the representations
+
+    Rows are encoded from the columns, without converting the key stats to dicts and timestamps.
+    """
+
+    def __init__(self, key_stats):
+        """
+        :type key_stats: pd.DataFrame
+        """
+        self.key_stats = key_stats
+
+    def to_columns(self):
+        """Return `instrument_url`, `value` (if selected), `value_date` and the other key stats fields as columns
+
+        :rtype: OrderedDict[str, np.ndarray]
+        """
+        names = [name for name in ['instrument_url', 'value', 'value_date'] if name in self.key_stats]
+        names += [name for name in self.key_stats.columns if name not in names]
+        columns = OrderedDict()
+        for name in names:
+            if name == 'value_date':
+                columns[name] = np.asarray(self.key_stats[name].values, dtype='datetime64[D]')
+            else:
+                # Categorical instrument urls as an array of the (shared) url objects
+                columns[name] = np.asarray(self.key_stats[name].values)
+        return columns
+
+    def _value_dates(self, template='{}'):
+        """Return value dates formatted as YYYY-MM-DD with `template`, formatting each unique value date once"""
+        codes, value_days = pd.factorize(np.asarray(self.key_stats['value_date'].values,
+                                                    dtype='datetime64[D]').astype(np.int64))
+        return np.array([template.format(value_date) for value_date in value_days.astype('datetime64[D]')],
+                        dtype=object)[codes]
+
+    def to_csv(self):
+        """Encode as CSV with the columns in alphabetical order, value dates as YYYY-MM-DD and missing values empty"""
+        key_stats = self.key_stats[sorted(self.key_stats.columns)].copy()
+        key_stats['value_date'] = self._value_dates()
+        buf = StringIO()
+        key_stats.to_csv(buf, index=False, encoding='utf-8')
+        return buf.getvalue()
+
+    def _json_tokens(self, name):
+        """Return JSON encoded values of the column"""
+        column = self.key_stats[name]
+        if name == 'instrument_url':
+            # Each url is encoded once
+            urls = column.values
+            return np.array([json.dumps(url) for url in urls.categories], dtype=object)[urls.codes]
+        if name == 'value_date':
+            return self._value_dates('"{}"')
+        if not len(column):
+            return []
+        # NaN as NaN literal
+        return json.dumps(column.values.tolist())[1:-1].split(', ')
+
+    def to_json(self):
+        """Encode as JSON array of an object per row, value dates as YYYY-MM-DD and missing values as NaN"""
+        names = list(self.to_columns())
+        prefixes = [json.dumps(name) + ': ' for name in names]
+        rows = ('{' + ', '.join(prefix + token for prefix, token in izip(prefixes, row)) + '}'
+                for row in izip(*[self._json_tokens(name) for name in names]))
+        return '[' + ', '.join(rows) + ']'
+
+    def to_npz(self):
+        return encode_npz(self.to_columns())
+
+
+class TrailingReturnsTable(object):
+    """Trailing returns as assembled by :func:`assemble_trailing_returns`, with encoders for the representations"""
+
+    def __init__(self, trailing_returns):
+        """
+        :type trailing_returns: pd.DataFrame
+        """
+        self.trailing_returns = trailing_returns
+
+    def to_columns(self):
+        """Return :data:`TRAILING_RETURNS_COLUMNS` as columns, `date` as datetime64[D]
+
+        :rtype: OrderedDict[str, np.ndarray]
+        """
+        columns = OrderedDict((name, self.trailing_returns[name].values) for name in TRAILING_RETURNS_COLUMNS)
+        columns['date'] = np.asarray(columns['date'], dtype='datetime64[D]')
+        return columns
+
+    def to_csv(self):
+        buf = StringIO()
+        self.trailing_returns.to_csv(buf, index=False, date_format='%Y-%m-%d', encoding='utf-8')
+        return buf.getvalue()
+
+    def to_json(self):
+        """Encode as JSON column arrays, missing returns are null"""
+        columns = OrderedDict()
+        for name, column in self.to_columns().iteritems():
+            if name == 'date':
+                columns[name] = [str(day) for day in column]
+            elif column.dtype.kind == 'f':
+                columns[name] = [None if np.isnan(value) else value for value in column.tolist()]
+            else:
+                columns[name] = column.tolist()
+        return json.dumps(columns)
+
+    def to_npz(self):
+        return encode_npz(self.to_columns())
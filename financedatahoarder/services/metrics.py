@@ -0,0 +1,278 @@
+"""Lightweight latency histograms and counters of the query pipeline, exposed in the Prometheus text format
+
+Metrics are kept in the memory of the process. Under uwsgi with several worker processes each process reports its own
+metrics, so scrape a single process (or run with one process per port). Recording a sample takes about a microsecond,
+i.e. a negligible part of a query (see `benchmarks/bench_metrics.py`).
+
+Stages of the query pipeline are timed with :func:`timed` to the :data:`STAGE_SECONDS` histogram. Values kept by the
+components themselves (e.g. :meth:`CdxIndexStore.stats`) are collected only when the metrics are rendered, see
+:func:`register_client`.
+"""
+import bisect
+import threading
+import time
+from functools import wraps
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds of the latency buckets in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return unicode(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_sample(name, labelnames, labelvalues, value):
+    if labelnames:
+        name += '{' + ','.join(u'{}="{}"'.format(labelname, _escape(labelvalue))
+                               for labelname, labelvalue in zip(labelnames, labelvalues)) + '}'
+    if value == float('inf'):
+        return u'{} +Inf'.format(name)
+    return u'{} {}'.format(name, repr(float(value)))
+
+
+class _Metric(object):
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        """
+        :param labelnames: names of the labels, whose values are given as a tuple when recording
+        :type labelnames: tuple[str]
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def samples(self):
+        """
+        :return: (name, label names, label values, value) of each sample
+        :rtype: list[(str, tuple, tuple, float)]
+        """
+        raise NotImplementedError
+
+    def render(self):
+        lines = [u'# HELP {} {}'.format(self.name, self.documentation), u'# TYPE {} {}'.format(self.name, self.kind)]
+        lines.extend(_format_sample(*sample) for sample in self.samples())
+        return u'\n'.join(lines)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super(Counter, self).__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels=()):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.iteritems())
+        return [(self.name, self.labelnames, labels, value) for labels, value in values]
+
+
+class _Timer(object):
+    __slots__ = ('_histogram', '_labels', '_started')
+
+    def __init__(self, histogram, labels):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._started = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._histogram.observe(time.time() - self._started, self._labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """
+        :param buckets: sorted upper bounds of the buckets, without +Inf
+        :type buckets: tuple[float]
+        """
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # [count of each bucket (not cumulative) and +Inf, sum] by label values
+        self._values = {}
+
+    def observe(self, value, labels=()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def time(self, labels=()):
+        """Return context manager observing the time spent in the block"""
+        return _Timer(self, labels)
+
+    def count(self, labels=()):
+        counts = self._values.get(labels)
+        return 0 if counts is None else sum(counts[:-1])
+
+    def samples(self):
+        with self._lock:
+            values = sorted((labels, list(counts)) for labels, counts in self._values.iteritems())
+        labelnames = self.labelnames + ('le',)
+        samples = []
+        for labels, counts in values:
+            cumulative = 0
+            for upper_bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if upper_bound == float('inf') else repr(upper_bound)
+                samples.append((self.name + '_bucket', labelnames, labels + (le,), cumulative))
+            samples.append((self.name + '_sum', self.labelnames, labels, counts[-1]))
+            samples.append((self.name + '_count', self.labelnames, labels, cumulative))
+        return samples
+
+
+class Collected(_Metric):
+    """Metric whose values are read from a function when rendered, e.g. statistics kept by a component"""
+
+    def __init__(self, name, documentation, labelnames, collect, kind='gauge'):
+        """
+        :param collect: function returning the value of each label values tuple
+        :type collect: () -> dict[tuple, float]
+        :param kind: 'gauge' or 'counter'
+        """
+        super(Collected, self).__init__(name, documentation, labelnames)
+        self._collect = collect
+        self.kind = kind
+
+    def samples(self):
+        return [(self.name, self.labelnames, labels, value) for labels, value in sorted(self._collect().iteritems())]
+
+
+class Registry(object):
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Register the metric, replacing a metric of the same name
+
+        :type metric: _Metric
+        """
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name):
+        return self._metrics[name]
+
+    def render(self):
+        """Render the metrics in the Prometheus text format
+
+        :rtype: unicode
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.itervalues(), key=lambda metric: metric.name)
+        return u''.join(metric.render() + u'\n' for metric in metrics)
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram('financedatahoarder_stage_seconds',
+                                            'Time spent in the stages of the query pipeline', ('stage',)))
+KEY_STATS_CACHE_LOOKUPS = REGISTRY.register(Counter('financedatahoarder_key_stats_cache_lookups_total',
+                                                    'Replays looked up from the parsed key stats caches',
+                                                    ('cache', 'result')))
+
+
+def timed(stage):
+    """Decorator recording the time spent in the function to :data:`STAGE_SECONDS`"""
+    labels = (stage,)
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                STAGE_SECONDS.observe(time.time() - started, labels)
+        return wrapper
+    return decorator
+
+
+def timed_iter(stage, iterable):
+    """Iterate the iterable, recording the time from the first item requested until exhaustion or close to
+    :data:`STAGE_SECONDS`, e.g. for the body of a streamed response
+    """
+    with STAGE_SECONDS.time((stage,)):
+        for item in iterable:
+            yield item
+
+
+def _hit_ratio(hits, misses):
+    return float(hits) / (hits + misses) if hits + misses else 0.0
+
+
+def register_client(client, archive_map=None, http_caches=None, registry=REGISTRY):
+    """Register metrics collected from the caches, stores and archive requests of the client
+
+    :type client: NonCachingAsyncRequestsClient
+    :param archive_map: map function of the client. Its :meth:`stats` are collected, if it has any (see
+        :class:`FlowControlledMap` and :class:`ThreadPoolMap`).
+    :param http_caches: :class:`SqliteHttpCache` instances by name, e.g. {'replay': ..., 'list': ...}
+    :type http_caches: dict[str, SqliteHttpCache] | None
+    """
+    http_caches = {name: cache for name, cache in (http_caches or {}).iteritems() if hasattr(cache, 'hits')}
+
+    def _cache_lookups():
+        stats = client.cdx_index.stats()
+        lookups = {('cdx_index', 'hit'): stats['hits'], ('cdx_index', 'miss'): stats['misses']}
+        for name, cache in http_caches.iteritems():
+            lookups[(name + '_http', 'hit')] = cache.hits
+            lookups[(name + '_http', 'miss')] = cache.misses
+        return lookups
+
+    def _hit_ratios():
+        lookups = _cache_lookups()
+        for cache in ('parsed', 'parsed_trailing_returns', 'redis'):
+            lookups[(cache, 'hit')] = KEY_STATS_CACHE_LOOKUPS.value((cache, 'hit'))
+            lookups[(cache, 'miss')] = KEY_STATS_CACHE_LOOKUPS.value((cache, 'miss'))
+        return {(cache,): _hit_ratio(hits, lookups[(cache, 'miss')])
+                for (cache, result), hits in lookups.iteritems() if result == 'hit'}
+
+    def _coalescing():
+        values = {}
+        for name, flight in (('query', client.query_flight), ('replay', client.replay_flight)):
+            if flight is not None:
+                stats = flight.stats()
+                values[(name, 'executions')] = stats['executions']
+                values[(name, 'coalesced')] = stats['coalesced']
+        return values
+
+    def _failed_requests():
+        return {('listing',): client.failed_listings,
+                ('replay',): client.failed_requests - client.failed_listings}
+
+    registry.register(Collected('financedatahoarder_cache_lookups_total',
+                                'Lookups of the CDX index and HTTP caches', ('cache', 'result'), _cache_lookups,
+                                kind='counter'))
+    registry.register(Collected('financedatahoarder_cache_hit_ratio', 'Hit ratio of the caches since start',
+                                ('cache',), _hit_ratios))
+    registry.register(Collected('financedatahoarder_coalesced_total', 'Queries and replays run and coalesced',
+                                ('flight', 'result'), _coalescing, kind='counter'))
+    registry.register(Collected('financedatahoarder_failed_requests_total',
+                                'Failed recording listings and replays (after retries)', ('request',),
+                                _failed_requests, kind='counter'))
+    if hasattr(archive_map, 'stats'):
+        registry.register(Collected('financedatahoarder_archive_requests',
+                                    'Concurrency limit, retries and rejections of archive requests', ('stat',),
+                                    lambda: {(name,): value for name, value in archive_map.stats().iteritems()}))
@@ -0,0 +1,55 @@
+import logging
+import multiprocessing
+
+from financedatahoarder.services.parse_utils import read_ok_content, parse_overview_key_stats_or_empty, response_url
+
+
+def _parse_page(args):
+    """Parse key stats of a single page in a worker process"""
+    content, url = args
+    return dict(parse_overview_key_stats_or_empty(content, url))
+
+
+class ProcessPoolParseExecutor(object):
+    """Parse responses in a pool of worker processes
+
+    Raw response bodies are sent to the workers, which return the parsed key stats as dicts. Parsing of a chunk of
+    responses proceeds while the next chunk is downloaded.
+
+    The pool is created lazily on first use so that the executor can be created before the (uwsgi) worker processes
+    are forked.
+    """
+
+    def __init__(self, processes, chunk_size=64):
+        """
+        :param processes: number of worker processes
+        :type processes: int
+        :param chunk_size: number of responses to download before submitting them for parsing
+        :type chunk_size: int
+        """
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self._pool = None
+        self._logger = logging.getLogger('ProcessPoolParseExecutor')
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._logger.info('Starting %d parser processes', self.processes)
+            self._pool = multiprocessing.Pool(self.processes)
+        return self._pool
+
+    def submit(self, responses):
+        """Submit responses for parsing
+
+        The responses are read and closed immediately.
+
+        :return: result with `get()` method returning the key stats corresponding to the responses
+        """
+        pages = [(read_ok_content(response), response_url(response)) for response in responses]
+        return self._get_pool().map_async(_parse_page, pages)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
@@ -1,12 +1,52 @@
+import json
 import logging
+from StringIO import StringIO
+from xml.sax.saxutils import unescape
 
-from financedatahoarder.scraper.scrapers.parsers.morningstar_overview import parse_overview_key_stats
+from financedatahoarder.scraper.scrapers.parsers.morningstar_overview import parse_overview_key_stats_or_empty
+from financedatahoarder.scraper.scrapers.parsers.morningstar_tab_1 import parse_trailing_returns, \
+    parse_trailing_returns_fast
 import re
+from financedatahoarder.services.metrics import timed
 import requests
+import numpy as np
 import pandas as pd
 from scrapy import Selector
 
 
+def _responses_logger():
+    return logging.getLogger('parse_overview_key_stats_from_responses')
+
+
+def read_ok_content(response):
+    """Return content of the response, or None if the request failed or the HTTP status is not 200
+
+    Closes the response.
+
+    :param response: the response, or None if the request failed (e.g. timed out)
+    :type response: requests.Response | None
+    """
+    if response is None:
+        _responses_logger().warning('Request failed -- ignoring entry')
+        return None
+    if response.status_code == requests.codes.ok:
+        content = response.content
+    else:
+        _responses_logger().warning('HTTP status not 200 (was {response.status_code}) for {response.url} '
+                                    '-- ignoring entry'.format(response=response))
+        content = None
+    # Close the response to save number of connections
+    # See http://stackoverflow.com/questions/23632794/in-requests-library-how-can-i-avoid-httpconnectionpool-is-full-discarding-con
+    response.close()
+    return content
+
+
+def response_url(response):
+    """Return url of the response, or None if the request failed"""
+    return None if response is None else response.url
+
+
+@timed('parse')
 def parse_overview_key_stats_from_responses(responses):
     """Parse overview key stats from responses
 
@@ -17,36 +57,169 @@ def parse_overview_key_stats_from_responses(responses):
     :return: list of overview stats corresponding to responses
     :rtype: list[OverviewKeyStats]
     """
+    stats = []
+    for response in responses:
+        content = read_ok_content(response)
+        stats.append(parse_overview_key_stats_or_empty(content, response_url(response)))
+    return stats
 
-    def logger():
-        return logging.getLogger('parse_overview_key_stats_from_responses')
 
-    stats = []
+def parse_trailing_returns_from_content(content):
+    """Parse trailing returns from tab=1 page content
+
+    Uses the fast lxml based parser, falling back to the `pd.read_html` based parser on pages the fast parser does not
+    recognize.
+
+    :type content: str
+    :rtype: list[TrailingReturns]
+    """
+    try:
+        return parse_trailing_returns_fast(content)
+    except ValueError:
+        logging.getLogger('parse_trailing_returns_from_content').debug('Fast parse failed', exc_info=True)
+    return parse_trailing_returns(Selector(text=content))
+
+
+@timed('parse_trailing_returns')
+def parse_trailing_returns_from_responses(responses):
+    """Parse trailing returns from responses of tab=1 pages
+
+    Closes the response as soon as the response is parsed.
+
+    :return: trailing returns table (dict of columns) corresponding to each response, empty dict if the request failed
+        or the page could not be parsed
+    :rtype: list[dict]
+    """
+    tables = []
     for response in responses:
-        if response.status_code == requests.codes.ok:
-            try:
-                key_stats, = parse_overview_key_stats(Selector(text=response.content))
-            except:
-                logger().warning('Parse failed for {} -- ignoring entry'.format(response.url),
-                                 exc_info=True)
-                key_stats = {}
+        content = read_ok_content(response)
+        if content is None:
+            tables.append({})
+            continue
+        try:
+            trailing_returns, = parse_trailing_returns_from_content(content)
+        except:
+            _responses_logger().warning('Parse failed for {} -- ignoring entry'.format(response_url(response)),
+                                        exc_info=True)
+            tables.append({})
         else:
-            logger().warning('HTTP status not 200 (was {response.status_code}) for {response.url} '
-                             '-- ignoring entry'.format(response=response))
-            key_stats = {}
-        # Close the response to save number of connections
-        # See http://stackoverflow.com/questions/23632794/in-requests-library-how-can-i-avoid-httpconnectionpool-is-full-discarding-con
-        response.close()
-        stats.append(key_stats)
-    return stats
+            tables.append(dict(trailing_returns))
+    return tables
 
 
-def parse_idx_list(response):
-    """Parse pywb index page
+# Data row of pywb html index, e.g.
+# <tr style="font-weight: bold">
+#   <td><a href="http://host.com/replay/20150307083453/http://url">
+#   <script>document.write(ts_to_date("20150307083453", true))</script>
+#   </a></td>
+#   <td>200</td>
+_HTML_IDX_ROW_RE = re.compile(r'<tr[^>]*>\s*<td>\s*<a href="([^"]*)">\s*'
+                              r'<script>document\.write\(ts_to_date\("([^"]*)"[^<]*</script>\s*</a>\s*</td>\s*'
+                              r'<td>([^<]*)</td>')
+_CDX_TEXT_TIMESTAMP_COL, _CDX_TEXT_ORIGINAL_COL, _CDX_TEXT_STATUS_COL = 1, 2, 4
 
-    :return: Series indexed by query time. The value of the Series contains the replay URL corresponding to that time.
-        Only the last successfull query (http 200) of each day is returned.
-    :type: pd.Series
+
+def parse_timestamps(timestamps):
+    """Parse pywb timestamps (e.g. 20150312190004)
+
+    Timestamps are converted by vectorized digit arithmetic instead of per-string datetime parsing.
+
+    :param timestamps: timestamps as strings
+    :return: datetimes
+    :rtype: np.ndarray[datetime64[s]]
+    """
+    timestamps = np.asarray(timestamps, dtype=np.unicode_)
+    if not len(timestamps):
+        return np.array([], dtype='datetime64[s]')
+    if timestamps.dtype.itemsize != 14 * np.dtype('U1').itemsize or (np.char.str_len(timestamps) != 14).any():
+        raise ValueError('Unexpected timestamp format')
+    digits = timestamps.view(np.uint32).reshape(-1, 14).astype(np.int64) - ord('0')
+    if ((digits < 0) | (digits > 9)).any():
+        raise ValueError('Unexpected timestamp format')
+    numbers = digits * np.array([1000, 100, 10, 1, 10, 1, 10, 1, 10, 1, 10, 1, 10, 1])
+    year, month, day = numbers[:, 0:4].sum(axis=1), numbers[:, 4:6].sum(axis=1), numbers[:, 6:8].sum(axis=1)
+    hour, minute, second = numbers[:, 8:10].sum(axis=1), numbers[:, 10:12].sum(axis=1), numbers[:, 12:14].sum(axis=1)
+    if ((month < 1) | (month > 12) | (day < 1) | (day > 31) | (hour > 23) | (minute > 59) | (second > 60)).any():
+        raise ValueError('Unexpected timestamp format')
+    months = (year - 1970).astype('datetime64[Y]').astype('datetime64[M]') + (month - 1).astype('timedelta64[M]')
+    days = months.astype('datetime64[D]') + (day - 1).astype('timedelta64[D]')
+    if (days.astype('datetime64[M]') != months).any():
+        # Day past the end of the month, e.g. 20150231
+        raise ValueError('Unexpected timestamp format')
+    return (days + hour.astype('timedelta64[h]') + minute.astype('timedelta64[m]') +
+            second.astype('timedelta64[s]'))
+
+
+def _last_of_each_day(timestamps, links):
+    """Pick the last link of each day
+
+    :param timestamps: pywb timestamps (e.g. 20150312190004) of the recordings
+    :param links: replay urls of the recordings
+    :rtype: pd.Series
+    """
+    days = pd.DatetimeIndex(parse_timestamps(timestamps).astype('datetime64[D]'))
+    last = ~days.duplicated(keep='last')
+    links_daily = pd.Series(np.asarray(links, dtype=object)[last], index=days[last])
+    return links_daily.sort_index(kind='mergesort')
+
+
+def _replay_base_url(response, replay_base_url):
+    if replay_base_url is not None:
+        return replay_base_url.rstrip('/')
+    return response.url.partition('/pywb-cdx')[0]
+
+
+def _parse_idx_list_html(content):
+    rows = _HTML_IDX_ROW_RE.findall(content)
+    if not rows and '<td>' in content:
+        # Unknown html layout
+        return None
+    num_recordings = content.count('document.write(ts_to_date(')
+    if len(rows) < num_recordings:
+        logging.getLogger('parse_idx_list').warning('Only {} of {} recordings matched the html layout, '
+                                                    'parsing with selector'.format(len(rows), num_recordings))
+        return None
+    rows = [row for row in rows if row[2].strip() in ('', '200')]
+    links = [unescape(link, {'&quot;': '"'}) if '&' in link else link for link, _, _ in rows]
+    return _last_of_each_day([timestamp for _, timestamp, _ in rows], links)
+
+
+def _parse_idx_list_json(content, replay_base_url):
+    if content.lstrip().startswith('['):
+        records = json.loads(content)
+        if records and isinstance(records[0], list):
+            # Header row followed by value rows
+            records = pd.DataFrame(records[1:], columns=records[0])
+        else:
+            records = pd.DataFrame(records)
+    else:
+        records = pd.read_json(StringIO(content), lines=True, dtype=False, convert_dates=False)
+    if not len(records):
+        return _last_of_each_day([], [])
+    status_col = 'status' if 'status' in records else 'statuscode'
+    if status_col in records:
+        records = records[records[status_col].fillna('').astype(unicode).isin(['', '200'])]
+    url_col = 'original' if 'original' in records else 'url'
+    timestamps = records['timestamp'].astype(unicode)
+    links = replay_base_url + '/' + timestamps + '/' + records[url_col]
+    return _last_of_each_day(timestamps.values, links.values)
+
+
+def _parse_idx_list_text(content, replay_base_url):
+    if not content.strip():
+        return _last_of_each_day([], [])
+    records = pd.read_csv(StringIO(content), sep=' ', header=None, dtype=unicode,
+                          usecols=[_CDX_TEXT_TIMESTAMP_COL, _CDX_TEXT_ORIGINAL_COL, _CDX_TEXT_STATUS_COL])
+    records = records[records[_CDX_TEXT_STATUS_COL] == '200']
+    timestamps = records[_CDX_TEXT_TIMESTAMP_COL]
+    links = replay_base_url + '/' + timestamps + '/' + records[_CDX_TEXT_ORIGINAL_COL]
+    return _last_of_each_day(timestamps.values, links.values)
+
+
+def _parse_idx_list_selector(response):
+    """Parse pywb html index page using scrapy selector
+
+    Slow reference implementation of :func:`parse_idx_list` for html index pages.
     """
     selector = Selector(text=response.content)
     rows = selector.xpath('//tr[position() > 1 and (not(td[2]/text()) or td[2]/text() = "200")]')
@@ -62,4 +235,31 @@ def parse_idx_list(response):
     # Pick last of each day
     links_daily = links.groupby(by=links.index.map(lambda dt: dt.date())).last()
     links_daily.index = pd.DatetimeIndex(links_daily.index)
-    return links_daily
\ No newline at end of file
+    return links_daily
+
+
+def parse_idx_list(response, replay_base_url=None):
+    """Parse pywb index page
+
+    Supports the html index page, and the CDX server plain text and json (`output=json`) outputs.
+
+    :param replay_base_url: Base url of replays, used to form replay urls from CDX server outputs. Defaults to part of
+        the response url preceding `/pywb-cdx`.
+    :type replay_base_url: str | None
+    :return: Series indexed by query time. The value of the Series contains the replay URL corresponding to that time.
+        Only the last successfull query (http 200) of each day is returned.
+    :type: pd.Series
+    """
+    content = response.content
+    if isinstance(content, str):
+        content = content.decode('utf-8', 'replace')
+    first_char = content.lstrip()[:1]
+    if first_char == '<':
+        links_daily = _parse_idx_list_html(content)
+        if links_daily is None:
+            links_daily = _parse_idx_list_selector(response)
+        return links_daily
+    elif first_char in ('{', '['):
+        return _parse_idx_list_json(content, _replay_base_url(response, replay_base_url))
+    else:
+        return _parse_idx_list_text(content, _replay_base_url(response, replay_base_url))
@@ -0,0 +1,190 @@
+"""Prefetch key stats of a predefined set of instruments to the caches of the service
+
+New days of each instrument are queried through the archive client configured as for the REST server (`config.py`
+overridden by APP_CONFIG_FILE), which stores the replays and parsed key stats to the HTTP, parsed key stats and redis
+caches and to the time series store shared with the service. Running workers of the service read the days stored by
+the job from disk and keep them when updating the store (see :class:`KeyStatsTimeSeriesStore`). Days whose recordings
+could not be listed or fetched are not stored, and are queried again by the next job.
+
+The job is meant to be run from cron while the service is serving traffic:
+
+- Only one job runs at a time (lock file, released also if the job crashes).
+- Progress is checkpointed after every batch: a restarted job continues from the last prefetched day of each
+  instrument.
+- Instruments are queried in batches at most `rate` instruments per second.
+
+Usage:
+
+    python -m financedatahoarder.services.prefetch instruments.txt --days 30 --rate 2
+"""
+import argparse
+import errno
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import pytz
+
+from financedatahoarder.scraper.scrapers.instruments import read_instruments
+
+
+class AlreadyRunning(Exception):
+    pass
+
+
+class JobLock(object):
+    """Exclusive lock of a lock file, released when the process exits"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        """
+        :raise AlreadyRunning: if another process holds the lock
+        """
+        f = open(self.path, 'a')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError as e:
+            f.close()
+            if e.errno in (errno.EAGAIN, errno.EACCES):
+                raise AlreadyRunning('{} is locked by another job'.format(self.path))
+            raise
+        self._file = f
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class Checkpoint(object):
+    """Last prefetched day of each instrument, persisted as JSON"""
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path) as f:
+                self._days = json.load(f)
+        except IOError:
+            self._days = {}
+
+    def last_day(self, url):
+        """
+        :rtype: datetime.date | None
+        """
+        day = self._days.get(url)
+        return None if day is None else datetime.strptime(day, '%Y-%m-%d').date()
+
+    def update(self, urls, day):
+        for url in urls:
+            self._days[url] = day.isoformat()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self._days, f, indent=0, sort_keys=True)
+        os.rename(tmp_path, self.path)
+
+
+def plan_batches(urls, checkpoint, first_day, last_day, batch_size):
+    """Group instruments with new days to batches
+
+    :param first_day: first day to prefetch for instruments not in the checkpoint
+    :param last_day: last day to prefetch
+    :return: (first day, last day, urls) of each batch. Instruments of a batch have the same first day.
+    :rtype: list[(datetime.date, datetime.date, list[str])]
+    """
+    urls_by_first_day = OrderedDict()
+    for url in urls:
+        prefetched_day = checkpoint.last_day(url)
+        url_first_day = first_day if prefetched_day is None else max(first_day, prefetched_day + timedelta(days=1))
+        if url_first_day <= last_day:
+            urls_by_first_day.setdefault(url_first_day, []).append(url)
+    return [(batch_first_day, last_day, day_urls[start:start + batch_size])
+            for batch_first_day, day_urls in sorted(urls_by_first_day.iteritems())
+            for start in xrange(0, len(day_urls), batch_size)]
+
+
+def prefetch(client, urls, checkpoint, first_day, last_day, batch_size=20, rate=None, sleep=time.sleep):
+    """Query new days of the instruments, checkpointing after every batch without failed requests
+
+    :type client: NonCachingAsyncRequestsClient
+    :type checkpoint: Checkpoint
+    :param rate: maximum number of instruments per second. None for no limit
+    :type rate: float | None
+    :return: tuple of (number of instruments prefetched without failures, seconds taken)
+    :rtype: (int, float)
+    """
+    logger = logging.getLogger('prefetch')
+    batches = plan_batches(urls, checkpoint, first_day, last_day, batch_size)
+    logger.info('Prefetching %d of %d instruments in %d batches', sum(len(batch_urls) for _, _, batch_urls in batches),
+                len(urls), len(batches))
+    started = time.time()
+    num_prefetched = 0
+    for batch_first_day, batch_last_day, batch_urls in batches:
+        batch_started = time.time()
+        failed_before = client.failed_requests
+        client.query_key_stats_frame((batch_first_day, batch_last_day), batch_urls)
+        elapsed = time.time() - batch_started
+        num_failed = client.failed_requests - failed_before
+        if num_failed:
+            # Not checkpointed, so that the next job fetches the failed days again
+            logger.warning('%d requests failed prefetching %d instruments (%s - %s)', num_failed, len(batch_urls),
+                           batch_first_day, batch_last_day)
+        else:
+            checkpoint.update(batch_urls, batch_last_day)
+            num_prefetched += len(batch_urls)
+            logger.info('Prefetched %d instruments (%s - %s) in %.1f s', len(batch_urls), batch_first_day,
+                        batch_last_day, elapsed)
+        if rate:
+            sleep(max(0.0, len(batch_urls) / float(rate) - elapsed))
+    return num_prefetched, time.time() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('instruments', type=argparse.FileType('r'), help='file with an instrument url on each line')
+    parser.add_argument('--days', type=int, default=30,
+                        help='number of days to prefetch for instruments not prefetched before')
+    parser.add_argument('--batch-size', type=int, default=20, help='instruments per query')
+    parser.add_argument('--rate', type=float, default=None, help='maximum instruments per second')
+    parser.add_argument('--checkpoint', default='.prefetch_checkpoint.json', help='checkpoint file')
+    parser.add_argument('--lock', default='.prefetch.lock', help='lock file')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    # Only settled days are prefetched, recordings of the current day may still change
+    last_day = datetime.now(pytz.UTC).date() - timedelta(days=1)
+    first_day = last_day - timedelta(days=args.days - 1)
+    urls = read_instruments(args.instruments)
+    try:
+        with JobLock(args.lock):
+            # Imported here, as creating the client opens the caches
+            from financedatahoarder.services.client_factory import create_client, load_config
+            client = create_client(load_config())
+            num_prefetched, seconds = prefetch(client, urls, Checkpoint(args.checkpoint), first_day, last_day,
+                                               batch_size=args.batch_size, rate=args.rate)
+    except AlreadyRunning as e:
+        logging.getLogger('prefetch').warning('Not prefetching: %s', e)
+        return 1
+    print '{} of {} instruments prefetched in {:.1f} s ({:.2f} instruments/s)'.format(
+        num_prefetched, len(urls), seconds, num_prefetched / seconds if seconds else 0.0)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -4,8 +4,6 @@ import logging
 import logging.config
 
 # Configure logging with uwsgi
-from redis_cache.rediscache import SimpleCache
-
 logging_cfg_path = os.environ.get('LOGGING_INI', None)
 if logging_cfg_path:
     logging.config.fileConfig(logging_cfg_path)
@@ -18,13 +16,15 @@ from cStringIO import StringIO
 import json
 import sys
 
-from financedatahoarder.services.fields import ISO8601DateField
-from financedatahoarder.services.data_access_api import NonCachingAsyncRequestsClient
+from financedatahoarder.services import metrics
+from financedatahoarder.services.client_factory import create_client
+from financedatahoarder.services.columnar_formats import available_encoders, NPZ_MIMETYPE
 from financedatahoarder.services.many_format_api import ManyFormatApi
-import numpy as np
+from financedatahoarder.services.matrix import KeyStatsMatrix, KeyStatsTable, TrailingReturnsTable, pivot_key_stats
+from financedatahoarder.services.streaming import iter_csv, iter_json, peek_first_nonempty
 import pandas as pd
-from flask import Flask, make_response
-from flask.ext.restplus import Api, Resource, fields, marshal_with
+from flask import Flask, Response, make_response, request
+from flask.ext.restplus import Api, Resource
 from flask_restful import inputs
 
 
@@ -41,16 +41,14 @@ from flask_restful import inputs
 # date_json = x.xpath('//tr[td[2]/text() = "200"]//script')
 # link = x.xpath('//tr[td[2]/text() = "200"]//a/@href')
 
-# TODO: support predefined, configurable set of URLs
+# Predefined set of URLs can be prefetched to the caches with scripts/run_prefetch
 
 # curl -H "Accept: application/json" "http://127.0.0.1:5000/instruments/?date_interval=2015-03-01%2F2015-03-15&url=http%3A%2F%2Fwww.morningstar.fi%2Ffi%2Ffunds%2Fsnapshot%2Fsnapshot.aspx%3Fid%3DF00000UF2B&url=http%3A%2F%2Fwww.morningstar.fi%2Ffi%2Ffunds%2Fsnapshot%2Fsnapshot.aspx%3Fid%3D0P0000GGNP"
 # curl -H "Accept: text/csv" "http://127.0.0.1:5000/instruments/?date_interval=2015-03-01%2F2015-03-15&url=http%3A%2F%2Fwww.morningstar.fi%2Ffi%2Ffunds%2Fsnapshot%2Fsnapshot.aspx%3Fid%3DF00000UF2B&url=http%3A%2F%2Fwww.morningstar.fi%2Ffi%2Ffunds%2Fsnapshot%2Fsnapshot.aspx%3Fid%3D0P0000GGNP"
 # curl "http://127.0.0.1:5000/instruments/?date_interval=2015-03-01%2F2015-03-22&url=http%3A%2F%2Fwww.morningstar.fi%2Ffi%2Ffunds%2Fsnapshot%2Fsnapshot.aspx%3Fid%3DF00000UF2B&url=http%3A%2F%2Fwww.morningstar.fi%2Ffi%2Ffunds%2Fsnapshot%2Fsnapshot.aspx%3Fid%3D0P0000GGNP&url=http%3a%2f%2ftools.morningstar.fi%2ffi%2fstockreport%2fdefault.aspx%3fSecurityToken%3d0P0000A5Z8%255D3%255D0%255DE0WWE%24%24ALL&url=http%3a%2f%2ftools.morningstar.fi%2ffi%2fstockreport%2fdefault.aspx%3fSecurityToken%3d0P0000A5Z8%255D3%255D0%255DE0WWE%24%24ALL"
-from financedatahoarder.services.utils import dataframe_from_list_of_dicts
-
+from financedatahoarder.services.utils import dataframe_from_list_of_dicts, key_stats_fields, \
+    DEFAULT_KEY_STATS_FIELDS, KEY_STATS_FIELD_NAMES
 
-class DummyCache(object):
-    connection = None
 
 app = Flask(__name__)
 # Load the configuration from the instance folder
@@ -60,39 +58,37 @@ app.config.from_envvar('APP_CONFIG_FILE', silent=True)
 
 logging.getLogger(__name__).info('Config: {}'.format(app.config))
 
-if app.config['REDIS_CACHING_ENABLED']:
-    logging.getLogger(__name__).info('Using redis cache {}:{}'.format(app.config['REDIS_HOST'],
-                                                                      app.config['REDIS_PORT']))
-    redis_cache = SimpleCache(expire=app.config['CACHE_EXPIRE_AFTER'],
-                              host=app.config['REDIS_HOST'] , port=app.config['REDIS_PORT'],
-                                  db=app.config['REDIS_DB'])
-else:
-    logging.getLogger(__name__).info('Not using redis cache')
-    redis_cache = DummyCache
-
-class ErrorHandlingApi(Api):
+class ErrorHandlingApi(ManyFormatApi):
     def handle_error(self, e):
         logging.getLogger(__name__).error('Error occurred in the service: {}'.format(e), exc_info=True)
         return super(ErrorHandlingApi, self).handle_error(e)
 
 
-#api = ManyFormatApi(app)
 api = ErrorHandlingApi(app)
 
-client = NonCachingAsyncRequestsClient(app.config['BASE_REPLAY_URL'], app.config['GREQUESTS_POOL_SIZE'], redis_cache,
-                                       expire_after=app.config['CACHE_EXPIRE_AFTER'], expire_list_after=0)
+client = create_client(app.config)
 
 
 @api.representation('application/json')
+@metrics.timed('serialize_json')
 def output_json(data, code, headers=None):
     """Makes a Flask response with a JSON encoded body"""
-    resp = make_response(json.dumps(data), code)
+    if isinstance(data, (KeyStatsTable, KeyStatsMatrix, TrailingReturnsTable)):
+        data = data.to_json()
+    else:
+        data = json.dumps(data)
+    resp = make_response(data, code)
     resp.headers.extend(headers or {})
     return resp
 
 
 @api.representation('text/csv')
+@metrics.timed('serialize_csv')
 def output_csv(data, code, headers=None):
+    if isinstance(data, (KeyStatsTable, KeyStatsMatrix, TrailingReturnsTable)):
+        resp = make_response(data.to_csv(), code)
+        resp.headers.extend(headers or {})
+        return resp
     # Handle swagger metadata
     if 'message' in data:
         # E.g. Bad requests
@@ -114,40 +110,159 @@ def output_csv(data, code, headers=None):
     return resp
 
 
+def _columnar_representation(mimetype, encode, format_name):
+    @api.representation(mimetype)
+    @metrics.timed('serialize_' + format_name)
+    def output_columnar(data, code, headers=None):
+        if isinstance(data, KeyStatsMatrix) and mimetype == NPZ_MIMETYPE:
+            body = data.to_npz()
+        elif isinstance(data, (KeyStatsTable, KeyStatsMatrix, TrailingReturnsTable)):
+            body = encode(data.to_columns())
+        else:
+            # E.g. errors
+            resp = output_json(data, code, headers)
+            resp.mimetype = 'application/json'
+            return resp
+        resp = make_response(body, code)
+        resp.headers.extend(headers or {})
+        return resp
+    return output_columnar
+
+
+COLUMNAR_MIMETYPES = available_encoders()
+MIMETYPE_FORMATS = {mimetype: format_name for format_name, mimetype in ManyFormatApi.FORMAT_MIMETYPE_MAP.iteritems()}
+for columnar_mimetype, columnar_encode in COLUMNAR_MIMETYPES.iteritems():
+    _columnar_representation(columnar_mimetype, columnar_encode, MIMETYPE_FORMATS[columnar_mimetype])
+
+
 parser = api.parser()
 parser.add_argument('format', type=str, default='csv')
 parser.add_argument('url', type=inputs.url, action='append', default=[], help='Url of instruments', dest='urls')
 parser.add_argument('date_interval', type=inputs.iso8601interval, help='Date or date interval to query for',
                     required=True)
 
-InstrumentValueEntry = api.model('InstrumentValueEntry', {
-    'instrument_url': fields.String,
-    'value': fields.Float(np.nan),
-    'value_date': ISO8601DateField  #fields.DateTime('iso8601')
-})
+
+def comma_separated_fields(value):
+    """Parse comma separated key stats fields, e.g. `value,ongoing_charges`"""
+    return key_stats_fields([field.strip() for field in value.split(',') if field.strip()])
+
+
+instruments_parser = parser.copy()
+instruments_parser.add_argument('fields', type=comma_separated_fields, default=DEFAULT_KEY_STATS_FIELDS,
+                                help='Comma separated key stats fields to get, of: {} (default: value)'.format(
+                                    ', '.join(KEY_STATS_FIELD_NAMES)))
 
 
 @api.route('/instruments/')
 class SingleInstrumentResource(Resource):
 
+    @api.doc(parser=instruments_parser)
+    def get(self):
+        """Get instruments, as specified by the urls, for a given date interval
+
+        Besides the value, other key stats fields parsed from the same pages (e.g. ongoing charges or fund size) can be
+        selected with `fields`. Besides CSV and JSON, available in binary columnar formats (format=arrow, parquet,
+        msgpack or npz) if the dependencies of the format are installed.
+        """
+        args = instruments_parser.parse_args()
+        if not len(args.urls):
+            api.abort(404, message='No instruments given as input')
+        key_stats = client.query_key_stats_frame(args.date_interval, args.urls, args.fields)
+        if not len(key_stats):
+            api.abort(404, message='Could not find instrument(s)')
+        return KeyStatsTable(key_stats)
+
+
+matrix_parser = parser.copy()
+matrix_parser.add_argument('fill', type=inputs.boolean, default=False,
+                           help='Forward-fill days without value between the first and last value date')
+
+
+@api.route('/instruments/matrix')
+class InstrumentMatrixResource(Resource):
+
+    @api.doc(parser=matrix_parser)
+    def get(self):
+        """Get values of instruments, as specified by the urls, as value date x instrument matrix
+
+        Available as CSV, JSON column arrays and NumPy npz archive (format=npz).
+        """
+        args = matrix_parser.parse_args()
+        if not len(args.urls):
+            api.abort(404, message='No instruments given as input')
+        key_stats = client.query_key_stats_frame(args.date_interval, args.urls)
+        if not len(key_stats):
+            api.abort(404, message='Could not find instrument(s)')
+        return KeyStatsMatrix(pivot_key_stats(key_stats, args.urls, fill=args.fill))
+
+
+@api.route('/trailing_returns/')
+class TrailingReturnsResource(Resource):
+
     @api.doc(parser=parser)
-    @marshal_with(InstrumentValueEntry)
     def get(self):
-        """Get instruments, as specified by the urls, for a given date interval"""
+        """Get trailing returns tables of instruments, as specified by the urls, for a given date interval
+
+        Returns are read from the tab=1 pages of the instruments, one row per time interval of each instrument and date
+        with a recording. Available as CSV, JSON column arrays and the binary columnar formats.
+        """
         args = parser.parse_args()
-        val = client.query_key_stats(args.date_interval, args.urls)
-        if not val:
-            if len(args.urls):
-                api.abort(404, message='Could not find instrument(s)')
-            else:
-                api.abort(404, message='No instruments given as input')
+        if not len(args.urls):
+            api.abort(404, message='No instruments given as input')
+        trailing_returns = client.query_trailing_returns(args.date_interval, args.urls)
+        if not len(trailing_returns):
+            api.abort(404, message='Could not find trailing returns of the instrument(s)')
+        return TrailingReturnsTable(trailing_returns)
+
+
+@api.route('/instruments/stream/')
+class StreamingInstrumentResource(Resource):
+
+    STREAM_MIMETYPES = ['text/csv', 'application/json']
+
+    @api.doc(parser=parser)
+    def get(self):
+        """Stream instruments, as specified by the urls, for a given date interval
+
+        Rows of each instrument are sent as soon as the instrument is resolved, i.e. rows are ordered by instrument and
+        then by date. Format is selected with the `format` argument (csv or json) or the Accept header.
+        """
+        format_name = request.args.get('format')
+        if format_name:
+            mimetype = ManyFormatApi.FORMAT_MIMETYPE_MAP.get(format_name)
+            if mimetype not in self.STREAM_MIMETYPES:
+                api.abort(406, message='Streaming is available as csv and json only')
+        else:
+            mimetype = request.accept_mimetypes.best_match(self.STREAM_MIMETYPES, default='text/csv')
+        args = parser.parse_args()
+        if not len(args.urls):
+            api.abort(404, message='No instruments given as input')
+        chunks = peek_first_nonempty(client.iter_key_stats(args.date_interval, args.urls))
+        if chunks is None:
+            api.abort(404, message='Could not find instrument(s)')
+        if mimetype == 'application/json':
+            body = metrics.timed_iter('stream_json', iter_json(chunks))
         else:
-            return val
+            body = metrics.timed_iter('stream_csv', iter_csv(chunks))
+        return Response(body, mimetype=mimetype)
+
+
+@api.route('/metrics')
+class MetricsResource(Resource):
+
+    def get(self):
+        """Latencies of the query pipeline stages, cache hit ratios and archive request statistics of this process
+
+        In the Prometheus text format.
+        """
+        return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
 
 
 def main_test():
     import tempfile
-    PROFILE=True
+    # Per-stage latencies are available from /metrics. Set PROFILE environment variable for a cProfile dump of each
+    # request to /tmp/ (werkzeug ProfilerMiddleware, development server only)
+    PROFILE = bool(os.environ.get('PROFILE'))
 
     f = tempfile.NamedTemporaryFile(prefix='rest_server_logging_', delete=False)
     f.write(dedent("""
@@ -0,0 +1,154 @@
+import logging
+import threading
+import time
+from StringIO import StringIO
+
+import numpy as np
+import pandas as pd
+import requests
+
+# Number of already known bytes requested again when appending the tail of a CSV, to verify that the CSV was only
+# appended to
+_TAIL_OVERLAP = 64
+
+
+def parse_seligson_csv(content):
+    """Parse Seligson price history CSV (`date;value` rows, day first dates)
+
+    :type content: str
+    :return: values indexed by date, sorted by date
+    :rtype: pd.Series
+    """
+    if not content.strip():
+        return pd.Series([], index=pd.DatetimeIndex([]), name='value', dtype=np.float64)
+    data = pd.read_csv(StringIO(content), sep=';', names=['date', 'value'], dtype={'date': str})
+    try:
+        dates = pd.to_datetime(data['date'], format='%d.%m.%Y')
+    except ValueError:
+        dates = pd.to_datetime(data['date'], dayfirst=True)
+    values = pd.Series(data['value'].values, index=pd.DatetimeIndex(dates), name='value')
+    values = values[~values.index.duplicated(keep='last')]
+    return values.sort_index(kind='mergesort')
+
+
+class _CachedCSV(object):
+    __slots__ = ('values', 'content_length', 'tail', 'etag', 'last_modified', 'checked_at')
+
+    def __init__(self, values, content_length, tail, etag, last_modified, checked_at):
+        self.values = values
+        self.content_length = content_length
+        self.tail = tail[-_TAIL_OVERLAP:]
+        self.etag = etag
+        self.last_modified = last_modified
+        self.checked_at = checked_at
+
+
+class SeligsonCSVCache(object):
+    """Process-wide cache of parsed Seligson price history CSVs
+
+    A cached CSV is revalidated at most once per `refresh_after` seconds. Revalidation is a conditional request
+    (`If-None-Match`/`If-Modified-Since`) which also asks for the bytes after the cached part of the CSV, so that only
+    new rows appended to the CSV are downloaded and parsed. The whole CSV is downloaded again if the server does not
+    support ranges or if the CSV changed otherwise.
+
+    CSVs of different urls are downloaded and revalidated concurrently, concurrent gets of the same url wait for a
+    single request.
+    """
+
+    def __init__(self, refresh_after=3600, session=None):
+        """
+        :param refresh_after: seconds between revalidations of a CSV
+        :type refresh_after: int
+        :param session: session to make the requests with, e.g. `requests.Session()`
+        """
+        self.refresh_after = refresh_after
+        self.session = requests.Session() if session is None else session
+        self.downloads = 0
+        self.revalidations = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._url_locks = {}
+        self._logger = logging.getLogger('SeligsonCSVCache')
+
+    def get(self, url, now=None):
+        """Return values of the CSV, downloading or revalidating it if needed
+
+        :rtype: pd.Series
+        """
+        now = time.time() if now is None else now
+        with self._url_lock(url):
+            entry = self._entries.get(url)
+            if entry is None:
+                entry = self._download(url, now)
+            elif now - entry.checked_at >= self.refresh_after:
+                entry = self._revalidate(url, entry, now)
+            self._entries[url] = entry
+        return entry.values
+
+    def _url_lock(self, url):
+        with self._lock:
+            return self._url_locks.setdefault(url, threading.Lock())
+
+    def _download(self, url, now):
+        self._logger.debug('Downloading {}'.format(url))
+        self.downloads += 1
+        response = self.session.get(url)
+        response.raise_for_status()
+        content = response.content
+        return _CachedCSV(parse_seligson_csv(content), len(content), content, response.headers.get('ETag'),
+                          response.headers.get('Last-Modified'), now)
+
+    def _revalidate(self, url, entry, now):
+        self._logger.debug('Revalidating {}'.format(url))
+        self.revalidations += 1
+        headers = {'Range': 'bytes={}-'.format(max(entry.content_length - len(entry.tail), 0))}
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        response = self.session.get(url, headers=headers)
+        if response.status_code == requests.codes.not_modified:
+            entry.checked_at = now
+            return entry
+        if response.status_code == requests.codes.requested_range_not_satisfiable:
+            # CSV is shorter than the cached part, i.e. it was rewritten
+            return self._download(url, now)
+        response.raise_for_status()
+        etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+        content = response.content
+        if response.status_code == requests.codes.partial_content:
+            new_rows = self._appended_rows(entry, content)
+            if new_rows is None:
+                return self._download(url, now)
+            new_values = parse_seligson_csv(new_rows)
+            values = entry.values
+            if len(new_values):
+                values = pd.concat([values[~values.index.isin(new_values.index)], new_values])
+                values = values.sort_index(kind='mergesort')
+            new_content = content[len(entry.tail):]
+            return _CachedCSV(values, entry.content_length + len(new_content), entry.tail + new_content, etag,
+                              last_modified, now)
+        self.downloads += 1
+        return _CachedCSV(parse_seligson_csv(content), len(content), content, etag, last_modified, now)
+
+    @staticmethod
+    def _appended_rows(entry, content):
+        """Return rows appended to the CSV, starting from the last cached row
+
+        :param content: CSV starting from the cached tail
+        :return: the rows, or None if the CSV was changed otherwise than by appending
+        """
+        if not content.startswith(entry.tail):
+            return None
+        last_row_start = entry.tail.rstrip('\n').rfind('\n') + 1
+        if last_row_start == 0 and len(entry.tail) < entry.content_length:
+            # Start of the last row is not within the tail
+            return None
+        # Last cached row is parsed again, in case it was incomplete
+        return content[last_row_start:]
+
+    def stats(self):
+        return {'entries': len(self._entries), 'downloads': self.downloads, 'revalidations': self.revalidations}
+
+
+default_cache = SeligsonCSVCache()
@@ -0,0 +1,80 @@
+"""Coalescing of identical concurrent work (single-flight)
+
+Under gevent, the threading module must be monkey patched for the waiters to yield to the other greenlets.
+"""
+import sys
+import threading
+
+
+class _Call(object):
+    __slots__ = ('done', 'result', 'exc_info')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+    def wait(self):
+        self.done.wait()
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.result
+
+
+class SingleFlight(object):
+    """Run work of a key at most once at a time, sharing the result with all callers waiting for the same key
+
+    Results are not cached: a call made after the work of the key has finished runs the work again. Results are shared
+    between the callers as such and must not be modified.
+    """
+
+    def __init__(self):
+        self.executions = 0
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def begin(self, key):
+        """Begin work of the key, unless it is already in flight
+
+        :return: tuple of (True if the caller is responsible for the work and must call :meth:`finish`, call to wait
+            for otherwise)
+        :rtype: (bool, _Call)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                return False, call
+            call = self._calls[key] = _Call()
+            self.executions += 1
+            return True, call
+
+    def finish(self, key, call, result=None, exc_info=None):
+        """Finish work of the key begun with :meth:`begin`, waking up the waiting callers
+
+        :param exc_info: `sys.exc_info()` of the failed work, raised to the waiting callers
+        """
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.result = result
+        call.exc_info = exc_info
+        call.done.set()
+
+    def do(self, key, func, *args, **kwargs):
+        """Return `func(*args, **kwargs)`, or the result of the identical call already in flight"""
+        leader, call = self.begin(key)
+        if not leader:
+            return call.wait()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException:
+            self.finish(key, call, exc_info=sys.exc_info())
+            raise
+        self.finish(key, call, result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {'in_flight': len(self._calls), 'executions': self.executions, 'coalesced': self.coalesced}
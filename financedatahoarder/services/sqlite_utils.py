@@ -0,0 +1,35 @@
+import os
+import sqlite3
+
+from gevent.monkey import get_original
+
+# threading.local of the standard library, even if gevent has monkeypatched threading
+_ThreadLocal = get_original('threading', 'local')
+
+
+class ThreadLocalConnection(object):
+    """SQLite connection opened lazily for each thread and process
+
+    SQLite connections can not be shared between threads or forked processes (e.g. uwsgi workers). Greenlets of a
+    thread share its connection (see `gevent_app.py`): SQLite calls do not switch greenlets, so a connection per
+    greenlet would only add connections waiting for the write lock of the database while blocking the event loop.
+    """
+
+    def __init__(self, path, init_statements=()):
+        """
+        :param path: path of the SQLite database file
+        :param init_statements: statements executed on each new connection, e.g. CREATE TABLE IF NOT EXISTS
+        """
+        self.path = path
+        self._init_statements = init_statements
+        self._local = _ThreadLocal()
+
+    def get(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            for statement in self._init_statements:
+                connection.execute(statement)
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
@@ -0,0 +1,72 @@
+"""Streaming CSV and JSON encoding of key stats
+
+Key stats are encoded chunk by chunk (e.g. instrument by instrument, see
+:meth:`NonCachingAsyncRequestsClient.iter_key_stats`), so that the first rows can be sent before all instruments are
+resolved and the whole result is never materialized.
+"""
+import csv
+import json
+from itertools import chain
+from StringIO import StringIO
+
+# Same columns as in the non-streaming CSV output
+CSV_COLUMNS = ['instrument_url', 'value', 'value_date']
+
+
+def _format_value_date(value_date):
+    # As formatted by ISO8601DateField
+    return value_date.strftime('%Y-%m-%d')
+
+
+def iter_csv(key_stats_chunks):
+    """Encode chunks of key stats as CSV
+
+    :param key_stats_chunks: chunks of key stats, as returned by :meth:`NonCachingAsyncRequestsClient.query_key_stats`
+    :type key_stats_chunks: iterable[list[dict]]
+    :return: CSV header followed by the rows of each chunk
+    :rtype: iterable[str]
+    """
+    buf = StringIO()
+    writer = csv.writer(buf, lineterminator='\n')
+    writer.writerow(CSV_COLUMNS)
+    yield buf.getvalue()
+    for key_stats in key_stats_chunks:
+        if not key_stats:
+            continue
+        buf = StringIO()
+        writer = csv.writer(buf, lineterminator='\n')
+        writer.writerows((key_stat['instrument_url'], key_stat.get('value', ''),
+                          _format_value_date(key_stat['value_date'])) for key_stat in key_stats)
+        yield buf.getvalue()
+
+
+def iter_json(key_stats_chunks):
+    """Encode chunks of key stats as elements of a single JSON array
+
+    :type key_stats_chunks: iterable[list[dict]]
+    :rtype: iterable[str]
+    """
+    yield '['
+    separator = ''
+    for key_stats in key_stats_chunks:
+        if not key_stats:
+            continue
+        yield separator + ', '.join(json.dumps({'instrument_url': key_stat['instrument_url'],
+                                                'value': key_stat.get('value', float('nan')),
+                                                'value_date': _format_value_date(key_stat['value_date'])})
+                                    for key_stat in key_stats)
+        separator = ', '
+    yield ']'
+
+
+def peek_first_nonempty(key_stats_chunks):
+    """Consume chunks until the first non-empty one
+
+    :return: iterable of the remaining chunks, starting from the first non-empty one, or None if all chunks were empty
+    :rtype: iterable[list[dict]] | None
+    """
+    key_stats_chunks = iter(key_stats_chunks)
+    for key_stats in key_stats_chunks:
+        if key_stats:
+            return chain([key_stats], key_stats_chunks)
+    return None
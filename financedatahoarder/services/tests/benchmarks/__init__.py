@@ -0,0 +1,51 @@
+"""Benchmarks of the services
+
+Benchmark modules can be run directly, e.g.
+
+    python -m financedatahoarder.services.tests.benchmarks.bench_parse_idx_list
+
+or all at once, storing the results as JSON, with `benchmarks.run`.
+"""
+import timeit
+
+import pkg_resources
+
+# Results reported since the last call to take_results()
+_results = []
+
+
+def read_testdata(filename):
+    return pkg_resources.resource_stream('financedatahoarder.services.tests', 'testdata/{}'.format(filename)).read()
+
+
+def best_of(func, repeat=3, number=1):
+    """Return the best time (in seconds) of a single call to `func`"""
+    return min(timeit.repeat(func, repeat=repeat, number=number)) / number
+
+
+def report(name, seconds, baseline_seconds=None, items=None, peak_rss_mb=None):
+    """Print a single benchmark result and keep it for :func:`take_results`
+
+    :param peak_rss_mb: growth of the peak resident set size during the benchmark, in megabytes
+    """
+    result = {'name': name, 'seconds': seconds, 'items_per_second': items / seconds if items else None}
+    line = '{:<45} {:>10.4f} ms'.format(name, seconds * 1000)
+    if items:
+        line += ' {:>12.0f} items/s'.format(items / seconds)
+    if baseline_seconds:
+        line += ' {:>7.1f}x'.format(baseline_seconds / seconds)
+    if peak_rss_mb is not None:
+        result['peak_rss_mb'] = peak_rss_mb
+        line += ' {:>8.1f} MB peak RSS'.format(peak_rss_mb)
+    _results.append(result)
+    print line
+
+
+def take_results():
+    """Return the results reported since the last call
+
+    :rtype: list[dict]
+    """
+    results = list(_results)
+    del _results[:]
+    return results
@@ -0,0 +1,39 @@
+"""Benchmark archive clients against the local stub pywb: 20 urls x 60 days, 20 ms latency per response
+
+Compares the gevent based :class:`NonCachingAsyncRequestsClient` to :class:`ThreadPoolRequestsClient` with the same
+concurrency.
+"""
+from datetime import date
+
+from cachecontrol.cache import DictCache
+
+from financedatahoarder.services.data_access_api import NonCachingAsyncRequestsClient
+from financedatahoarder.services.tests.benchmarks import best_of, report
+from financedatahoarder.services.tests.stub_pywb import StubPyWbServer
+from financedatahoarder.services.threadpool_client import ThreadPoolRequestsClient
+
+
+def _query(client_class, stub, concurrency, date_interval, urls, **kwargs):
+    # Fresh caches, so that every listing and replay is requested from the stub
+    client = client_class(stub.base_url, concurrency, cdx_output='json', coalesce=False, http_cache=DictCache(),
+                          list_http_cache=DictCache(), expire_list_after=0, **kwargs)
+    client.query_key_stats(date_interval, urls)
+
+
+def main(num_urls=20, num_days=60, latency=0.02, concurrency=16):
+    urls = ['http://www.morningstar.fi/fi/funds/snapshot/snapshot.aspx?id=F0000{:05d}'.format(i)
+            for i in xrange(num_urls)]
+    first_day = date(2015, 1, 1)
+    date_interval = (first_day, date.fromordinal(first_day.toordinal() + num_days - 1))
+    num_requests = num_urls * (num_days + 1)
+    with StubPyWbServer(first_day, num_days, latency=latency) as stub:
+        baseline = best_of(lambda: _query(NonCachingAsyncRequestsClient, stub, concurrency, date_interval, urls))
+        report('NonCachingAsyncRequestsClient ({} requests)'.format(num_requests), baseline, items=num_requests)
+        # Stub is a single host
+        seconds = best_of(lambda: _query(ThreadPoolRequestsClient, stub, concurrency, date_interval, urls,
+                                         per_host_limit=concurrency))
+        report('ThreadPoolRequestsClient', seconds, baseline, items=num_requests)
+
+
+if __name__ == '__main__':
+    main()
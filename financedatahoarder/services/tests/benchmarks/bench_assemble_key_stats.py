@@ -0,0 +1,47 @@
+"""Benchmark assembly of query results: 500 urls x 365 days
+
+Compares the columnar :func:`assemble_key_stats` to the former per-dict post-processing followed by
+:func:`iter_sort_uniq`.
+"""
+import numpy as np
+import pandas as pd
+import pytz
+
+from financedatahoarder.scraper.scrapers.items import OverviewKeyStats
+from financedatahoarder.services.utils import assemble_key_stats, key_stats_records, iter_sort_uniq
+from financedatahoarder.services.tests.benchmarks import best_of, report
+
+
+def _per_dict(urls, key_stats_by_url):
+    all_key_stats = []
+    for url in urls:
+        key_stats = map(dict, key_stats_by_url[url])
+        for ks in key_stats:
+            ks['instrument_url'] = url
+        key_stats = [key_stat for key_stat in key_stats if len(key_stat) > 1]
+        for key_stat in key_stats:
+            key_stat['value_date'] = pd.Timestamp(key_stat['value_date'].date(), tz=pytz.UTC)
+        all_key_stats.extend(key_stats)
+    sort_key_fun = lambda item: (item['value_date'], urls.index(item['instrument_url']))
+    return list(iter_sort_uniq(all_key_stats, sort_key_fun))
+
+
+def main(num_urls=500, num_days=365):
+    urls = ['http://www.morningstar.fi/fi/funds/snapshot/snapshot.aspx?id=F0000{:05d}'.format(i)
+            for i in xrange(num_urls)]
+    value_dates = pd.date_range('2014-01-01 18:00', periods=num_days, tz='UTC')
+    values = np.random.RandomState(0).rand(num_days).tolist()
+    key_stats_by_url = {url: [OverviewKeyStats(value=value, value_date=value_date)
+                              for value, value_date in zip(values, value_dates)] for url in urls}
+    num_items = num_urls * num_days
+
+    baseline = best_of(lambda: _per_dict(urls, key_stats_by_url), repeat=1)
+    report('per-dict post-processing ({} key stats)'.format(num_items), baseline, items=num_items)
+    columnar = best_of(lambda: assemble_key_stats(urls, key_stats_by_url))
+    report('assemble_key_stats', columnar, baseline, items=num_items)
+    with_records = best_of(lambda: key_stats_records(assemble_key_stats(urls, key_stats_by_url)))
+    report('assemble_key_stats + key_stats_records', with_records, baseline, items=num_items)
+
+
+if __name__ == '__main__':
+    main()
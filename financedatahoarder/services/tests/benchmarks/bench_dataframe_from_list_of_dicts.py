@@ -0,0 +1,21 @@
+"""Benchmark conversion of query records to a frame, as done by the CSV representation: 500 urls x 365 days"""
+import numpy as np
+import pandas as pd
+
+from financedatahoarder.services.utils import dataframe_from_list_of_dicts
+from financedatahoarder.services.tests.benchmarks import best_of, report
+
+
+def main(num_urls=500, num_days=365):
+    value_dates = pd.date_range('2014-01-01', periods=num_days, tz='UTC')
+    values = np.random.RandomState(0).rand(num_days).tolist()
+    records = [{'instrument_url': 'http://www.morningstar.fi/fi/funds/snapshot/snapshot.aspx?id=F0000{:05d}'.format(i),
+                'value': value, 'value_date': value_date.isoformat()}
+               for i in xrange(num_urls) for value, value_date in zip(values, value_dates)]
+    report('dataframe_from_list_of_dicts ({} records)'.format(len(records)),
+           best_of(lambda: dataframe_from_list_of_dicts(records)), items=len(records))
+    report('pd.DataFrame.from_records', best_of(lambda: pd.DataFrame.from_records(records)), items=len(records))
+
+
+if __name__ == '__main__':
+    main()
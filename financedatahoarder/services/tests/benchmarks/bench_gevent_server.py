@@ -0,0 +1,82 @@
+"""Load test of a synchronous and a gevent REST server process against the local stub pywb (200 ms latency)
+
+Concurrent clients send cold /instruments/ queries (2 urls x 5 days, not queried before) to a single server process.
+Queries are small and the latency high so that the queries wait for pywb, and the stub (in this process) keeps up:
+
+- sync: one request at a time, as a synchronous uwsgi worker (`scripts/run_uwsgi`), here the werkzeug server
+- gevent: concurrent requests as greenlets sharing the client of the process (`gevent_app.py`), here the gevent WSGI
+  server instead of uwsgi --gevent
+
+Reported are the seconds per request (requests per second as items/s) and the 99th percentile latency.
+"""
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date
+
+import numpy as np
+import requests
+
+from financedatahoarder.services.tests.benchmarks import report
+from financedatahoarder.services.tests.server_process import free_port, start_server, write_config
+from financedatahoarder.services.tests.stub_pywb import StubPyWbServer
+
+
+def _load(port, num_clients, num_requests, num_urls, date_interval):
+    """Send `num_requests` queries from each of `num_clients` threads
+
+    :return: seconds from the first request to the last response, latencies of the requests in seconds
+    :rtype: (float, list[float])
+    """
+    latencies = []
+
+    def _client(client_id):
+        session = requests.Session()
+        for i in xrange(num_requests):
+            urls = ['http://www.morningstar.fi/fi/funds/snapshot/snapshot.aspx?id=F{:03d}{:03d}{:03d}'.format(
+                client_id, i, j) for j in xrange(num_urls)]
+            started = time.time()
+            response = session.get('http://127.0.0.1:{}/instruments/'.format(port),
+                                   params=[('format', 'csv'), ('date_interval', date_interval)] +
+                                   [('url', url) for url in urls])
+            latencies.append(time.time() - started)
+            assert response.status_code == 200, response.text
+
+    # Client 0 warms up the server, e.g. creates the stores
+    _client(0)
+    del latencies[:]
+    clients = [threading.Thread(target=_client, args=(client_id,)) for client_id in xrange(1, num_clients + 1)]
+    started = time.time()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    return time.time() - started, latencies
+
+
+def main(num_clients=8, num_requests=4, num_urls=2, num_days=5, latency=0.2):
+    first_day = date(2015, 1, 1)
+    date_interval = '{}/{}'.format(first_day, date.fromordinal(first_day.toordinal() + num_days - 1))
+    total = num_clients * num_requests
+    baseline = {}
+    with StubPyWbServer(first_day, num_days, latency=latency) as stub:
+        for mode in ('sync', 'gevent'):
+            directory = tempfile.mkdtemp(prefix='bench_gevent_server_')
+            port = free_port()
+            process = start_server(mode, port, write_config(directory, stub.base_url))
+            try:
+                elapsed, latencies = _load(port, num_clients, num_requests, num_urls, date_interval)
+            finally:
+                process.terminate()
+                process.wait()
+                shutil.rmtree(directory)
+            p99 = np.percentile(latencies, 99)
+            report('{} /instruments/ ({} clients)'.format(mode, num_clients), elapsed / total,
+                   baseline.get('seconds'), items=1)
+            report('{} /instruments/ p99 latency'.format(mode), p99, baseline.get('p99'))
+            baseline = baseline or {'seconds': elapsed / total, 'p99': p99}
+
+
+if __name__ == '__main__':
+    main()
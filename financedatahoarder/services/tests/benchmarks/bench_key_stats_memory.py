@@ -0,0 +1,92 @@
+"""Benchmark peak memory of a large /instruments/ export: 200 urls x 5 years from the time series store
+
+Compares the former per-row path (a dict and a `pd.Timestamp` per key stats, marshalled to dicts once more before
+encoding) to the columnar path (structured arrays of epoch days and values, categorical urls, encoded from the
+columns). Each path is run in its own process, and the growth of the peak resident set size of the process is
+reported.
+"""
+import json
+import resource
+import subprocess
+import sys
+import time
+from StringIO import StringIO
+
+import numpy as np
+import pandas as pd
+from flask_restplus import fields, marshal
+
+from financedatahoarder.services.fields import ISO8601DateField
+from financedatahoarder.services.matrix import KeyStatsTable
+from financedatahoarder.services.timeseries_store import KeyStatsTimeSeries, KeyStatsTimeSeriesStore, to_days
+from financedatahoarder.services.utils import assemble_key_stats, dataframe_from_list_of_dicts, key_stats_records
+from financedatahoarder.services.tests.benchmarks import report
+
+# Marshalling model of /instruments/ before the columnar representation
+_INSTRUMENT_VALUE_ENTRY = {'instrument_url': fields.String, 'value': fields.Float(np.nan),
+                           'value_date': ISO8601DateField}
+
+
+def _per_row(store, urls, dates, format_name):
+    frame = assemble_key_stats(urls, {url: store.lookup(url, dates)[0] for url in urls})
+    records = marshal(key_stats_records(frame), _INSTRUMENT_VALUE_ENTRY)
+    if format_name == 'json':
+        return json.dumps(records)
+    buf = StringIO()
+    dataframe_from_list_of_dicts(records).to_csv(buf, index=False)
+    return buf.getvalue()
+
+
+def _columnar(store, urls, dates, format_name):
+    table = KeyStatsTable(assemble_key_stats(urls, {url: store.lookup_array(url, dates)[0] for url in urls}))
+    return table.to_json() if format_name == 'json' else table.to_csv()
+
+
+PATHS = {'per-row': _per_row, 'columnar': _columnar}
+_MODULE = 'financedatahoarder.services.tests.benchmarks.bench_key_stats_memory'
+
+
+def _max_rss_mb():
+    # Kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+def run_path(path, format_name, num_urls, num_days):
+    """Run the path in this process
+
+    :return: seconds and growth of the peak resident set size in megabytes
+    :rtype: (float, float)
+    """
+    dates = pd.date_range('2010-01-01', periods=num_days, tz='UTC')
+    urls = ['http://www.morningstar.fi/fi/funds/snapshot/snapshot.aspx?id=F0000{:05d}'.format(i)
+            for i in xrange(num_urls)]
+    days = to_days(dates)
+    time_series = KeyStatsTimeSeries(days, days - 1, np.random.RandomState(0).rand(num_days))
+    store = KeyStatsTimeSeriesStore()
+    for url in urls:
+        # Stored directly, as the store would keep time series read from disk
+        store._time_series[url] = (None, time_series)
+    rss_before = _max_rss_mb()
+    started = time.time()
+    PATHS[path](store, urls, dates, format_name)
+    return time.time() - started, _max_rss_mb() - rss_before
+
+
+def main(num_urls=200, num_days=5 * 365):
+    num_items = num_urls * num_days
+    for format_name in ('csv', 'json'):
+        baseline = None
+        for path in ('per-row', 'columnar'):
+            output = subprocess.check_output([sys.executable, '-m', _MODULE, path, format_name, str(num_urls),
+                                              str(num_days)])
+            seconds, peak_rss_mb = json.loads(output.splitlines()[-1])
+            report('{} {} ({} key stats)'.format(path, format_name, num_items), seconds, baseline, items=num_items,
+                   peak_rss_mb=peak_rss_mb)
+            baseline = baseline or seconds
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        print json.dumps(run_path(sys.argv[1], sys.argv[2], int(sys.argv[3]), int(sys.argv[4])))
+    else:
+        main()
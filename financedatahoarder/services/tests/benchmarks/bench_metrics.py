@@ -0,0 +1,66 @@
+"""Overhead of the query pipeline metrics on the hot path: query of 20 urls x 30 days answered from the caches
+
+Reports the time of recording a single stage timing, the time of the cached query, and the share of the query spent
+recording the stage timings.
+"""
+from datetime import date
+
+import pandas as pd
+import requests
+from mock import patch
+
+from financedatahoarder.scraper.scrapers.parsers.morningstar_overview import OverviewKeyStats
+from financedatahoarder.services import data_access_api
+from financedatahoarder.services.data_access_api import NonCachingAsyncRequestsClient
+from financedatahoarder.services.key_stats_cache import ParsedKeyStatsCache
+from financedatahoarder.services.metrics import STAGE_SECONDS, timed
+from financedatahoarder.services.tests.benchmarks import best_of, report
+
+STAGES = ('query', 'cdx_list', 'cache_lookup', 'fetch', 'replay', 'parse')
+
+
+def _ok_response():
+    response = requests.Response()
+    response.status_code = 200
+    return response
+
+
+def _num_observations(stages):
+    return sum(STAGE_SECONDS.count((stage,)) for stage in stages)
+
+
+def main(num_urls=20, number=100):
+    urls = ['http://www.morningstar.fi/fi/funds/snapshot/snapshot.aspx?id=F0000{:05d}'.format(i)
+            for i in xrange(num_urls)]
+    date_interval = (date(2015, 1, 1), date(2015, 1, 30))
+    dates = pd.date_range(*date_interval)
+    idx = {url: pd.Series(['http://dummybaseurl.com/{}/{}'.format(day.strftime('%Y%m%d'), url) for day in dates],
+                          index=dates) for url in urls}
+    client = NonCachingAsyncRequestsClient('http://dummybaseurl.com', 16, http_cache={}, list_http_cache={},
+                                           parsed_cache=ParsedKeyStatsCache(':memory:'),
+                                           map_func=lambda reqs, size: [_ok_response() for _ in reqs])
+
+    @timed('bench')
+    def _noop():
+        pass
+
+    observe_seconds = best_of(lambda: _noop(), number=100000)
+    report('record stage timing', observe_seconds)
+
+    key_stat = OverviewKeyStats(value=1.0, value_date=pd.Timestamp('2015-01-01', tz='UTC'))
+    with patch.object(client, '_cdx_list', new=timed('cdx_list')(lambda list_urls: idx)), \
+            patch.object(data_access_api, 'parse_overview_key_stats_from_responses',
+                         new=timed('parse')(lambda responses: [key_stat] * len(responses))):
+        # Fill the parsed cache
+        client.query_key_stats(date_interval, urls)
+        observations_before = _num_observations(STAGES)
+        query_seconds = best_of(lambda: client.query_key_stats(date_interval, urls), repeat=3, number=number)
+        observations = _num_observations(STAGES) - observations_before
+    report('cached query of {} urls x {} days'.format(num_urls, len(dates)), query_seconds)
+    observations_per_query = observations / (3.0 * number)
+    print '    {:.0f} stage timings per query, {:.3f}% of the query time'.format(
+        observations_per_query, 100 * observations_per_query * observe_seconds / query_seconds)
+
+
+if __name__ == '__main__':
+    main()
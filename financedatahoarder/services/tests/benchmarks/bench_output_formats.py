@@ -0,0 +1,59 @@
+"""Benchmark output formats of /instruments/: 500 urls x 365 days
+
+Compares payload size, server side encoding time and client side decoding time of the CSV representation to the
+binary columnar representations. Formats whose optional dependency is not installed are skipped.
+"""
+from io import BytesIO
+from StringIO import StringIO
+
+import numpy as np
+import pandas as pd
+
+from financedatahoarder.scraper.scrapers.items import OverviewKeyStats
+from financedatahoarder.services import columnar_formats
+from financedatahoarder.services.columnar_formats import encode_arrow_stream, encode_parquet, encode_msgpack, \
+    encode_npz
+from financedatahoarder.services.matrix import KeyStatsTable
+from financedatahoarder.services.utils import assemble_key_stats
+from financedatahoarder.services.tests.benchmarks import best_of, report
+
+
+def _formats():
+    formats = [('csv', lambda frame: KeyStatsTable(frame).to_csv(), lambda content: pd.read_csv(StringIO(content))),
+               ('npz', lambda frame: encode_npz(KeyStatsTable(frame).to_columns()),
+                lambda content: dict(np.load(BytesIO(content))))]
+    pyarrow, msgpack = columnar_formats.pyarrow, columnar_formats.msgpack
+    if pyarrow is not None:
+        formats.append(('arrow', lambda frame: encode_arrow_stream(KeyStatsTable(frame).to_columns()),
+                        lambda content: pyarrow.ipc.open_stream(content).read_all().to_pandas()))
+        formats.append(('parquet', lambda frame: encode_parquet(KeyStatsTable(frame).to_columns()),
+                        lambda content: pyarrow.parquet.read_table(pyarrow.BufferReader(content)).to_pandas()))
+    if msgpack is not None:
+        formats.append(('msgpack', lambda frame: encode_msgpack(KeyStatsTable(frame).to_columns()),
+                        lambda content: pd.DataFrame(msgpack.unpackb(content, raw=False))))
+    return formats
+
+
+def main(num_urls=500, num_days=365):
+    urls = ['http://www.morningstar.fi/fi/funds/snapshot/snapshot.aspx?id=F0000{:05d}'.format(i)
+            for i in xrange(num_urls)]
+    value_dates = pd.date_range('2014-01-01 18:00', periods=num_days, tz='UTC')
+    values = np.random.RandomState(0).rand(num_days).tolist()
+    frame = assemble_key_stats(urls, {url: [OverviewKeyStats(value=value, value_date=value_date)
+                                            for value, value_date in zip(values, value_dates)] for url in urls})
+    num_items = num_urls * num_days
+
+    baseline_encode = baseline_decode = None
+    for name, encode, decode in _formats():
+        content = encode(frame)
+        encode_seconds = best_of(lambda: encode(frame))
+        decode_seconds = best_of(lambda: decode(content))
+        report('encode {} ({} key stats, {} kB)'.format(name, num_items, len(content) // 1024), encode_seconds,
+               baseline_encode, items=num_items)
+        report('decode {}'.format(name), decode_seconds, baseline_decode, items=num_items)
+        if baseline_encode is None:
+            baseline_encode, baseline_decode = encode_seconds, decode_seconds
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Benchmark throughput of inline and process pool parsing on a 1000 page replay set
+
+Downloads are simulated by sleeping `download_seconds` per batch of `grequests_pool_size` pages.
+"""
+import multiprocessing
+import time
+from itertools import cycle, islice
+
+import grequests
+from mock import patch
+
+from financedatahoarder.services import data_access_api
+from financedatahoarder.services.data_access_api import BatchKeyStatsFetcher, DummyCache
+from financedatahoarder.services.parse_executor import ProcessPoolParseExecutor
+from financedatahoarder.services.tests.benchmarks import read_testdata, best_of, report
+
+FIXTURES = ['funds_snapshot_20150310_F0GBR04O2R.html', 'etf_snapshot_20150312_0P0000M7ZP.html',
+            'stock_20150320_knebv.html', 'funds_snapshot_20150311_F0GBR04O2J.html']
+
+
+class _Response(object):
+    status_code = 200
+    url = 'http://host.com/replay'
+
+    def __init__(self, content):
+        self.content = content
+
+    def close(self):
+        pass
+
+
+def _fetch(fetcher, reqs, contents, grequests_pool_size, download_seconds):
+    def _map(chunk, size):
+        time.sleep(download_seconds * len(chunk) / float(grequests_pool_size))
+        return [_Response(content) for content in islice(contents, len(chunk))]
+
+    with patch.object(data_access_api.grequests, 'map', side_effect=_map):
+        fetcher.fetch(reqs)
+
+
+def main(num_pages=1000, grequests_pool_size=64, download_seconds=0.05):
+    contents = cycle([read_testdata(filename) for filename in FIXTURES])
+    reqs = [grequests.get('http://host.com/replay/{}/http://url.com'.format(i), params={}) for i in xrange(num_pages)]
+    inline = best_of(lambda: _fetch(BatchKeyStatsFetcher(grequests_pool_size, DummyCache), reqs, contents,
+                                    grequests_pool_size, download_seconds))
+    report('inline parse ({} pages)'.format(num_pages), inline, items=num_pages)
+    executor = ProcessPoolParseExecutor(multiprocessing.cpu_count(), chunk_size=grequests_pool_size)
+    try:
+        fetcher = BatchKeyStatsFetcher(grequests_pool_size, DummyCache, parse_executor=executor)
+        pool = best_of(lambda: _fetch(fetcher, reqs, contents, grequests_pool_size, download_seconds))
+        report('process pool parse ({} processes, {} pages)'.format(executor.processes, num_pages), pool,
+               inline, items=num_pages)
+    finally:
+        executor.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Benchmark parsing of pywb index listings scaled up to 100k recordings"""
+import json
+import re
+
+import pandas as pd
+
+from financedatahoarder.services.parse_utils import parse_idx_list, _parse_idx_list_selector
+from financedatahoarder.services.tests.benchmarks import read_testdata, best_of, report
+
+_ROW_RE = re.compile(r'(\s*<tr style="font-weight: bold">.*?</tr>)', re.S)
+_TIMESTAMP_RE = re.compile(r'(?<!\d)\d{14}(?!\d)')
+
+
+class _Response(object):
+    def __init__(self, content):
+        self.content = content
+        self.url = 'http://host.com/replay/pywb-cdx/*/http://url.com'
+
+
+def scaled_timestamps(num_rows):
+    """Recordings every three hours"""
+    return pd.date_range('2000-01-01', periods=num_rows, freq='3H').strftime('%Y%m%d%H%M%S')
+
+
+def scaled_html_listing(num_rows):
+    """Repeat the rows of testdata/cdx_list.html to `num_rows` rows with increasing timestamps"""
+    html = read_testdata('cdx_list.html')
+    rows = _ROW_RE.findall(html)
+    head, tail = html[:html.index(rows[0])], html[html.index(rows[-1]) + len(rows[-1]):]
+    templates = [_TIMESTAMP_RE.sub('{ts}', row) for row in rows]
+    scaled_rows = [templates[i % len(templates)].format(ts=ts) for i, ts in enumerate(scaled_timestamps(num_rows))]
+    return head + ''.join(scaled_rows) + tail
+
+
+def scaled_json_listing(num_rows):
+    return '\n'.join(json.dumps({'urlkey': 'fi,morningstar)/', 'timestamp': ts, 'url': 'http://url.com/?id=1',
+                                 'status': '200'})
+                     for ts in scaled_timestamps(num_rows))
+
+
+def main(num_rows=100000):
+    html = _Response(scaled_html_listing(num_rows))
+    json_lines = _Response(scaled_json_listing(num_rows))
+    baseline = best_of(lambda: _parse_idx_list_selector(html), repeat=1)
+    report('parse_idx_list selector html ({} rows)'.format(num_rows), baseline, items=num_rows)
+    report('parse_idx_list html ({} rows)'.format(num_rows), best_of(lambda: parse_idx_list(html)),
+           baseline, items=num_rows)
+    report('parse_idx_list json ({} rows)'.format(num_rows), best_of(lambda: parse_idx_list(json_lines)),
+           baseline, items=num_rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""Benchmark parsing of key stats from the fund, ETF and stock page fixtures, one by one and as 3000 replays"""
+from itertools import cycle, islice
+
+from scrapy import Selector
+
+from financedatahoarder.scraper.scrapers.parsers.morningstar_overview import parse_overview_key_stats, \
+    parse_overview_key_stats_fast
+from financedatahoarder.services.parse_utils import parse_overview_key_stats_from_responses
+from financedatahoarder.services.tests.benchmarks import read_testdata, best_of, report
+
+FIXTURES = ['funds_snapshot_20150310_F0GBR04O2R.html', 'etf_snapshot_20150312_0P0000M7ZP.html',
+            'stock_20150320_knebv.html']
+
+
+class _Response(object):
+    status_code = 200
+
+    def __init__(self, content):
+        self.content = content
+        self.url = 'http://host.com/replay/20150310120000/http://url.com'
+
+    def close(self):
+        pass
+
+
+def main(number=20, num_pages=3000):
+    for filename in FIXTURES:
+        content = read_testdata(filename)
+        baseline = best_of(lambda: parse_overview_key_stats(Selector(text=content)), number=number)
+        report('parse_overview_key_stats {}'.format(filename), baseline)
+        report('parse_overview_key_stats_fast {}'.format(filename),
+               best_of(lambda: parse_overview_key_stats_fast(content), number=number), baseline)
+    pages = list(islice(cycle(read_testdata(filename) for filename in FIXTURES), num_pages))
+    report('parse_overview_key_stats_from_responses ({} pages)'.format(num_pages),
+           best_of(lambda: parse_overview_key_stats_from_responses(_Response(page) for page in pages), repeat=1),
+           items=num_pages)
+
+
+if __name__ == '__main__':
+    main()
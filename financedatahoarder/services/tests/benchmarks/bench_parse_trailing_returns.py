@@ -0,0 +1,20 @@
+"""Benchmark parsing of the trailing returns table from the tab=1 page fixture"""
+from scrapy import Selector
+
+from financedatahoarder.scraper.scrapers.parsers.morningstar_tab_1 import parse_trailing_returns, \
+    parse_trailing_returns_fast
+from financedatahoarder.services.tests.benchmarks import read_testdata, best_of, report
+
+FIXTURE = 'funds_snapshot_tab1_20150310_F0GBR04O2R.html'
+
+
+def main(number=20):
+    content = read_testdata(FIXTURE)
+    baseline = best_of(lambda: parse_trailing_returns(Selector(text=content.decode('utf-8'))), number=number)
+    report('parse_trailing_returns {}'.format(FIXTURE), baseline)
+    report('parse_trailing_returns_fast {}'.format(FIXTURE),
+           best_of(lambda: parse_trailing_returns_fast(content), number=number), baseline)
+
+
+if __name__ == '__main__':
+    main()
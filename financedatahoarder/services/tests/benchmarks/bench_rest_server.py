@@ -0,0 +1,56 @@
+"""End-to-end latency of /instruments/ against the local stub pywb: 20 urls x 30 days, 5 ms latency per response
+
+The REST server is configured as in production (`config.py`), with the caches and stores in a temporary directory.
+Cold queries are of urls not queried before, so every listing and replay is requested from the stub and parsed. Warm
+queries repeat a query, and are answered from the time series store.
+"""
+import os
+import shutil
+import tempfile
+from datetime import date
+from itertools import count
+from urllib import urlencode
+
+from mock import patch
+
+from financedatahoarder.services.client_factory import create_client, load_config
+from financedatahoarder.services.tests.benchmarks import best_of, report
+from financedatahoarder.services.tests.server_process import write_config
+from financedatahoarder.services.tests.stub_pywb import StubPyWbServer
+
+
+def main(num_urls=20, num_days=30, latency=0.005):
+    first_day = date(2015, 1, 1)
+    date_interval = '{}/{}'.format(first_day, date.fromordinal(first_day.toordinal() + num_days - 1))
+    num_items = num_urls * num_days
+    directory = tempfile.mkdtemp(prefix='bench_rest_server_')
+    try:
+        with StubPyWbServer(first_day, num_days, latency=latency) as stub, \
+                patch.dict(os.environ, {'APP_CONFIG_FILE': write_config(directory, stub.base_url)}):
+            from financedatahoarder.services import rest_server
+            queries = count()
+
+            def _query(query_id, format_name='csv'):
+                urls = ['http://www.morningstar.fi/fi/funds/snapshot/snapshot.aspx?id=F{:04d}{:05d}'.format(
+                    query_id, i) for i in xrange(num_urls)]
+                response = app.get('/instruments/?' + urlencode([('format', format_name),
+                                                                 ('date_interval', date_interval)] +
+                                                                [('url', url) for url in urls]))
+                assert response.status_code == 200, response.data
+
+            # The module level client of the REST server was possibly created with another configuration
+            with patch.object(rest_server, 'client', create_client(load_config())):
+                app = rest_server.app.test_client()
+                cold = best_of(lambda: _query(next(queries)))
+                report('/instruments/ cold csv ({} key stats)'.format(num_items), cold, items=num_items)
+                warm_query = next(queries)
+                _query(warm_query)
+                for format_name in ('csv', 'json'):
+                    report('/instruments/ warm {}'.format(format_name),
+                           best_of(lambda: _query(warm_query, format_name), number=10), cold, items=num_items)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Load test of request coalescing: burst of 100 identical concurrent queries of 20 urls x 30 days
+
+The archive is simulated: listing recordings and each batch of replays takes 50 ms. Reports the number of listed urls
+and replay requests sent to the archive with and without coalescing.
+"""
+import threading
+import time
+from collections import Counter
+from datetime import date
+
+import pandas as pd
+from mock import patch
+
+from financedatahoarder.services import data_access_api
+from financedatahoarder.services.data_access_api import NonCachingAsyncRequestsClient
+from financedatahoarder.services.tests.benchmarks import report
+
+ARCHIVE_LATENCY = 0.05
+
+
+def _burst(client, num_requests, date_interval, urls):
+    start = threading.Event()
+
+    def _query():
+        start.wait()
+        client.query_key_stats(date_interval, urls)
+
+    threads = [threading.Thread(target=_query) for _ in xrange(num_requests)]
+    for thread in threads:
+        thread.start()
+    started_at = time.time()
+    start.set()
+    for thread in threads:
+        thread.join()
+    return time.time() - started_at
+
+
+def _run(coalesce, num_requests, date_interval, urls):
+    client = NonCachingAsyncRequestsClient('http://dummybaseurl.com', 16, coalesce=coalesce,
+                                           http_cache={}, list_http_cache={})
+    dates = pd.date_range(*date_interval)
+    archive_traffic = Counter()
+
+    def _cdx_list(list_urls):
+        archive_traffic['listed urls'] += len(list_urls)
+        time.sleep(ARCHIVE_LATENCY)
+        return {url: pd.Series(['http://dummybaseurl.com/{}/{}'.format(day.strftime('%Y%m%d'), url) for day in dates],
+                               index=dates) for url in list_urls}
+
+    def _map(reqs, **kwargs):
+        archive_traffic['replay requests'] += len(reqs)
+        time.sleep(ARCHIVE_LATENCY)
+        return [None] * len(reqs)
+
+    with patch.object(client, '_cdx_list', side_effect=_cdx_list), \
+            patch.object(data_access_api.grequests, 'map', side_effect=_map), \
+            patch.object(data_access_api, 'parse_overview_key_stats_from_responses',
+                         side_effect=lambda responses: [{}] * len(responses)):
+        seconds = _burst(client, num_requests, date_interval, urls)
+    return seconds, archive_traffic, client
+
+
+def main(num_requests=100, num_urls=20):
+    urls = ['http://www.morningstar.fi/fi/funds/snapshot/snapshot.aspx?id=F0000{:05d}'.format(i)
+            for i in xrange(num_urls)]
+    date_interval = (date(2015, 1, 1), date(2015, 1, 30))
+
+    baseline, baseline_traffic, _ = _run(False, num_requests, date_interval, urls)
+    report('{} queries without coalescing'.format(num_requests), baseline)
+    print '    archive traffic: {}'.format(dict(baseline_traffic))
+    seconds, traffic, client = _run(True, num_requests, date_interval, urls)
+    report('{} queries with coalescing'.format(num_requests), seconds, baseline)
+    print '    archive traffic: {}'.format(dict(traffic))
+    print '    queries: {}, replays: {}'.format(client.query_flight.stats(), client.replay_flight.stats())
+
+
+if __name__ == '__main__':
+    main()
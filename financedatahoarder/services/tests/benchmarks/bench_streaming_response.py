@@ -0,0 +1,89 @@
+"""Benchmark time to first byte and peak memory of buffered and streaming CSV/JSON responses
+
+200 instruments with a year of daily key stats each are encoded. Resolving an instrument is simulated by sleeping
+`resolve_seconds`. The buffered responses follow `/instruments/` (whole result marshalled, then converted to a
+DataFrame or dumped to JSON), the streaming responses follow `/instruments/stream/`. Each variant is run in a separate
+process to measure its peak RSS.
+"""
+import json
+import multiprocessing
+import resource
+import time
+from StringIO import StringIO
+
+import numpy as np
+import pandas as pd
+from flask_restplus import fields, marshal
+
+from financedatahoarder.services.fields import ISO8601DateField
+from financedatahoarder.services.streaming import iter_csv, iter_json, peek_first_nonempty
+from financedatahoarder.services.utils import dataframe_from_list_of_dicts
+
+INSTRUMENT_VALUE_ENTRY = {
+    'instrument_url': fields.String,
+    'value': fields.Float(np.nan),
+    'value_date': ISO8601DateField
+}
+
+
+def _iter_chunks(num_urls, num_days, resolve_seconds):
+    dates = pd.date_range('2014-01-01', periods=num_days, tz='UTC')
+    for i in xrange(num_urls):
+        time.sleep(resolve_seconds)
+        url = 'http://www.morningstar.fi/fi/funds/snapshot/snapshot.aspx?id=F0000{:05d}'.format(i)
+        yield [{'instrument_url': url, 'value': 10.0 + day * 0.01, 'value_date': value_date}
+               for day, value_date in enumerate(dates)]
+
+
+def _buffered_csv(chunks):
+    data = marshal([key_stat for chunk in chunks for key_stat in chunk], INSTRUMENT_VALUE_ENTRY)
+    buf = StringIO()
+    dataframe_from_list_of_dicts(data).to_csv(buf, index=False)
+    yield buf.getvalue()
+
+
+def _buffered_json(chunks):
+    yield json.dumps(marshal([key_stat for chunk in chunks for key_stat in chunk], INSTRUMENT_VALUE_ENTRY))
+
+
+def _streaming_csv(chunks):
+    # As in StreamingInstrumentResource, first instrument is resolved before the response is started
+    return iter_csv(peek_first_nonempty(chunks))
+
+
+def _streaming_json(chunks):
+    return iter_json(peek_first_nonempty(chunks))
+
+
+def _rss_kb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / 1024
+
+
+def _run(encode, num_urls, num_days, resolve_seconds, results):
+    start_rss = _rss_kb()
+    start = time.time()
+    ttfb = None
+    num_bytes = 0
+    for part in encode(_iter_chunks(num_urls, num_days, resolve_seconds)):
+        if ttfb is None:
+            ttfb = time.time() - start
+        num_bytes += len(part)
+    results.put((ttfb, time.time() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss,
+                 num_bytes))
+
+
+def main(num_urls=200, num_days=365, resolve_seconds=0.005):
+    for name, encode in [('buffered csv', _buffered_csv), ('streaming csv', _streaming_csv),
+                         ('buffered json', _buffered_json), ('streaming json', _streaming_json)]:
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_run, args=(encode, num_urls, num_days, resolve_seconds, results))
+        process.start()
+        ttfb, total, peak_rss_kb, num_bytes = results.get()
+        process.join()
+        print '{:<16} ttfb {:>9.1f} ms  total {:>9.1f} ms  peak rss +{:>7.1f} MB  ({:.1f} MB body)'.format(
+            name, ttfb * 1000, total * 1000, peak_rss_kb / 1024., num_bytes / 1024. / 1024)
+
+
+if __name__ == '__main__':
+    main()
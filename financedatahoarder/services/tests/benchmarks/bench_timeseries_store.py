@@ -0,0 +1,38 @@
+"""Benchmark date interval queries of the time series store: 3 years of daily data of 200 instruments
+
+The stored query is compared to resolving the same key stats from the parsed key stats cache, which is the fastest
+path through pywb (no HTML work, but CDX index lookup and a cache query per replay).
+"""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from financedatahoarder.services.key_stats_cache import ParsedKeyStatsCache
+from financedatahoarder.services.timeseries_store import KeyStatsTimeSeriesStore
+from financedatahoarder.services.tests.benchmarks import best_of, report
+
+
+def main(num_urls=200, num_days=3 * 365):
+    dates = pd.date_range('2013-01-01', periods=num_days)
+    urls = ['http://url.com/?id={}'.format(i) for i in xrange(num_urls)]
+    store = KeyStatsTimeSeriesStore()
+    parsed_cache = ParsedKeyStatsCache(':memory:')
+    values = np.random.RandomState(0).rand(num_days)
+    for url in urls:
+        key_stats = [{'value_date': pd.Timestamp(d, tz='UTC'), 'value': v} for d, v in zip(dates, values)]
+        store.update(url, dates, zip(dates, key_stats), today=date(2020, 1, 1))
+        parsed_cache.set_many_by_url(['{}/{:%Y%m%d}'.format(url, d) for d in dates], key_stats)
+    num_items = num_urls * num_days
+
+    cached = best_of(lambda: [parsed_cache.get_many_by_url(['{}/{:%Y%m%d}'.format(url, d) for d in dates])
+                              for url in urls])
+    report('parsed cache lookup ({} key stats)'.format(num_items), cached, items=num_items)
+    stored = best_of(lambda: [store.lookup(url, dates) for url in urls])
+    report('time series store lookup ({} key stats)'.format(num_items), stored, cached, items=num_items)
+    arrays = best_of(lambda: [store.lookup_array(url, dates) for url in urls])
+    report('time series store lookup_array', arrays, cached, items=num_items)
+
+
+if __name__ == '__main__':
+    main()
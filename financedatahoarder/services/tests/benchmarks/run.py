@@ -0,0 +1,117 @@
+"""Run the benchmarks, store the results as JSON and compare them to the results of another run
+
+    python -m financedatahoarder.services.tests.benchmarks.run --output bench_before.json
+    (upgrade pandas, check out another commit, ...)
+    python -m financedatahoarder.services.tests.benchmarks.run --output bench_after.json --compare bench_before.json
+
+Exits with status 1 if a benchmark is slower than in the compared results by more than `--threshold`. Results are
+comparable only between runs on the same machine with the same benchmark parameters.
+"""
+import argparse
+import importlib
+import json
+import pkgutil
+import platform
+import subprocess
+import sys
+import time
+from collections import OrderedDict
+
+from financedatahoarder.services.tests import benchmarks
+
+VERSIONED_PACKAGES = ['numpy', 'pandas', 'scrapy', 'lxml', 'requests', 'gevent', 'flask']
+
+
+def benchmark_names():
+    """Return names of the benchmark modules, e.g. bench_parse_idx_list"""
+    return sorted(name for _, name, _ in pkgutil.iter_modules(benchmarks.__path__) if name.startswith('bench_'))
+
+
+def environment():
+    """Return the commit and the versions of the interpreter and the main dependencies"""
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.STDOUT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    versions = OrderedDict([('python', platform.python_version())])
+    for package in VERSIONED_PACKAGES:
+        try:
+            versions[package] = importlib.import_module(package).__version__
+        except (ImportError, AttributeError):
+            versions[package] = None
+    return OrderedDict([('commit', commit), ('machine', platform.node()), ('time', time.time()),
+                        ('versions', versions)])
+
+
+def run(names):
+    """Run the benchmark modules
+
+    :return: results reported by each benchmark module, see :func:`benchmarks.report`
+    :rtype: OrderedDict[str, list[dict]]
+    """
+    results = OrderedDict()
+    for name in names:
+        print '## {}'.format(name)
+        benchmarks.take_results()
+        importlib.import_module('{}.{}'.format(benchmarks.__name__, name)).main()
+        results[name] = benchmarks.take_results()
+    return results
+
+
+def compare(baseline, current, threshold):
+    """Compare results of the benchmarks found in both runs
+
+    :param baseline: results of the earlier run, as returned by :func:`run`
+    :param threshold: relative slowdown regarded as a regression, e.g. 0.25 for 25 % slower
+    :return: (benchmark, result name, baseline seconds, current seconds, True if regression) of each common result
+    :rtype: list[(str, str, float, float, bool)]
+    """
+    comparison = []
+    for benchmark, results in current.iteritems():
+        baseline_seconds = {result['name']: result['seconds'] for result in baseline.get(benchmark, [])}
+        for result in results:
+            if result['name'] in baseline_seconds:
+                before = baseline_seconds[result['name']]
+                comparison.append((benchmark, result['name'], before, result['seconds'],
+                                   result['seconds'] > before * (1 + threshold)))
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the benchmarks of the services')
+    parser.add_argument('benchmarks', nargs='*', help='benchmarks to run, e.g. bench_parse_idx_list. Defaults to all')
+    parser.add_argument('--output', help='JSON file to store the results to')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare the results to')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='relative slowdown regarded as a regression (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    names = args.benchmarks or benchmark_names()
+    unknown = sorted(set(names) - set(benchmark_names()))
+    if unknown:
+        parser.error('unknown benchmarks: {}'.format(', '.join(unknown)))
+    output = OrderedDict([('environment', environment()), ('results', run(names))])
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+    if not args.compare:
+        return 0
+
+    with open(args.compare) as f:
+        baseline = json.load(f)
+    print '## Compared to {} ({})'.format(args.compare, baseline['environment'].get('commit'))
+    regressions = 0
+    for benchmark, name, before, after, regression in compare(baseline['results'], output['results'],
+                                                              args.threshold):
+        regressions += regression
+        print '{:<70} {:>10.4f} ms {:>10.4f} ms {:>+7.1%}{}'.format(
+            '{}: {}'.format(benchmark, name), before * 1000, after * 1000, after / before - 1,
+            '  REGRESSION' if regression else '')
+    if regressions:
+        print '{} regressions (threshold {:.0%})'.format(regressions, args.threshold)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""REST server processes for tests and benchmarks, configured against the local stub pywb (see `stub_pywb.py`)"""
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import requests
+
+# Synchronous server handling one request at a time, as a synchronous uwsgi worker (`scripts/run_uwsgi`)
+SYNC_SERVER = ("import sys; from werkzeug.serving import run_simple; "
+               "from financedatahoarder.services.rest_server import app; "
+               "run_simple('127.0.0.1', int(sys.argv[1]), app)")
+
+
+def write_config(directory, base_url):
+    """Write configuration of the REST server querying pywb at `base_url`, with the caches and stores in `directory`
+
+    :return: path of the configuration file, to be set to APP_CONFIG_FILE
+    :rtype: str
+    """
+    path = os.path.join(directory, 'server_config.py')
+    settings = {'BASE_REPLAY_URL': base_url, 'CDX_LIST_OUTPUT': 'json',
+                'CDX_INDEX_DIR': os.path.join(directory, 'cdx_index'),
+                'PARSED_CACHE_PATH': os.path.join(directory, 'parsed_cache.sqlite'),
+                'HTTP_CACHE_PATH': os.path.join(directory, 'http_cache.sqlite'),
+                'LIST_HTTP_CACHE_PATH': os.path.join(directory, 'list_http_cache.sqlite'),
+                'TIMESERIES_DIR': os.path.join(directory, 'timeseries'),
+                # Listings of the stub change between the queries
+                'TIMESERIES_SETTLE_DAYS': 0}
+    with open(path, 'w') as f:
+        f.writelines('{} = {!r}\n'.format(key, value) for key, value in sorted(settings.iteritems()))
+    return path
+
+
+def free_port():
+    """Return a free local TCP port"""
+    sock = socket.socket()
+    try:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+    finally:
+        sock.close()
+
+
+def start_server(mode, port, config_path):
+    """Start REST server process and wait until it serves requests
+
+    :param mode: 'gevent' for the gevent WSGI server of `gevent_app.py`, 'sync' for :data:`SYNC_SERVER`
+    :param config_path: configuration file, e.g. written by :func:`write_config`
+    :rtype: subprocess.Popen
+    """
+    if mode == 'gevent':
+        command = [sys.executable, '-m', 'financedatahoarder.services.gevent_app', '--port', str(port)]
+    else:
+        command = [sys.executable, '-c', SYNC_SERVER, str(port)]
+    with open(os.devnull, 'w') as devnull:
+        process = subprocess.Popen(command, env=dict(os.environ, APP_CONFIG_FILE=config_path), stdout=devnull,
+                                   stderr=devnull)
+    for _ in xrange(300):
+        try:
+            requests.get('http://127.0.0.1:{}/metrics'.format(port))
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('{} server did not start'.format(mode))
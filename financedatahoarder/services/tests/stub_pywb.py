@@ -0,0 +1,133 @@
+"""Local stub of pywb for tests and benchmarks
+
+Serves the CDX server listing (`output=json`) of any url, with one recording per day, and the same replay page for
+every recording. Faults can be injected to the replays, see :meth:`StubPyWbServer.inject_faults`.
+"""
+import json
+import threading
+import time
+import urllib
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from datetime import timedelta
+from SocketServer import ThreadingMixIn
+
+import pkg_resources
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class _StubPyWbHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        stub = self.server.stub
+        with stub.lock:
+            stub.requests += 1
+        if stub.latency:
+            time.sleep(stub.latency)
+        path, _, qs = self.path.partition('?')
+        if path.startswith('/pywb-cdx/*/'):
+            params = urlparse.parse_qs(qs)
+            original_qs = urllib.urlencode([(k, v[0]) for k, v in sorted(params.iteritems())
+                                            if k not in ('from', 'output')])
+            original_url = path[len('/pywb-cdx/*/'):] + ('?' + original_qs if original_qs else '')
+            self._send(200, '\n'.join(json.dumps({'timestamp': timestamp, 'url': original_url, 'status': '200'})
+                                      for timestamp in stub.timestamps()), 'text/plain')
+            return
+        fault = stub.next_fault()
+        if fault == StubPyWbServer.DROP:
+            # Connection closed without response
+            self.close_connection = True
+        elif fault is not None:
+            self._send(fault, 'Injected fault', 'text/plain')
+        else:
+            self._send(200, stub.replay_content, 'text/html')
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StubPyWbServer(object):
+    """Stub pywb serving in a background thread, e.g.
+
+        with StubPyWbServer(first_day, num_days) as stub:
+            client = NonCachingAsyncRequestsClient(stub.base_url, 4, cdx_output='json')
+    """
+
+    DROP = 'drop'
+
+    def __init__(self, first_day, num_days, latency=0.0,
+                 replay_filename='funds_snapshot_20150310_F0GBR04O2R.html'):
+        """
+        :param first_day: day of the first recording
+        :type first_day: datetime.date
+        :param num_days: number of days with recording
+        :param latency: delay of each response in seconds
+        :type latency: float
+        """
+        self.first_day = first_day
+        self.num_days = num_days
+        self.latency = latency
+        self.replay_content = pkg_resources.resource_string('financedatahoarder.services.tests',
+                                                            'testdata/{}'.format(replay_filename))
+        self.requests = 0
+        self.lock = threading.Lock()
+        self._faults = []
+        self._fault_status = None
+        self._server = None
+        self._thread = None
+
+    def inject_faults(self, faults=(), status=None):
+        """Inject faults to the next replay requests
+
+        :param faults: fault of each of the next replay requests: HTTP status, or :attr:`DROP` to close the connection
+            without response
+        :type faults: list[int | str]
+        :param status: HTTP status of all replay requests after `faults`. None to serve the replays normally
+        :type status: int | None
+        """
+        with self.lock:
+            self._faults = list(faults)
+            self._fault_status = status
+
+    def next_fault(self):
+        with self.lock:
+            return self._faults.pop(0) if self._faults else self._fault_status
+
+    def timestamps(self):
+        return [(self.first_day + timedelta(days=i)).strftime('%Y%m%d120000') for i in xrange(self.num_days)]
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return 'http://{}:{}/'.format(host, port)
+
+    def start(self):
+        self._server = _ThreadingHTTPServer(('127.0.0.1', 0), _StubPyWbHandler)
+        self._server.stub = self
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
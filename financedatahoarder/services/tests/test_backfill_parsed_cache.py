@@ -0,0 +1,39 @@
+from cachecontrol.cache import DictCache
+from cachecontrol.controller import CacheController
+from cachecontrol.serialize import Serializer
+import pandas as pd
+import pkg_resources
+from requests import Request, Session
+from requests.packages.urllib3 import HTTPResponse
+from io import BytesIO
+from nose.tools import eq_
+
+from financedatahoarder.services.backfill_parsed_cache import backfill
+from financedatahoarder.services.cdx_index import CdxIndexStore
+from financedatahoarder.services.key_stats_cache import ParsedKeyStatsCache
+
+
+def _cache_response(http_cache, url, content):
+    prepared = Session().prepare_request(Request('GET', url))
+    response = HTTPResponse(body=BytesIO(content), headers={'content-type': 'text/html'}, status=200,
+                            preload_content=False)
+    http_cache.set(CacheController.cache_url(prepared.url), Serializer().dumps(prepared, response, body=content))
+
+
+def test_backfill():
+    http_cache = DictCache()
+    cdx_index = CdxIndexStore()
+    parsed_cache = ParsedKeyStatsCache(':memory:')
+    replay_url = 'http://host.com/replay/20150313120000/http://www.morningstar.fi/fi/funds/snapshot/snapshot.aspx?id=F0GBR04O2J'
+    content = pkg_resources.resource_string('financedatahoarder.services.tests',
+                                            'testdata/funds_snapshot_20150313_F0GBR04O2J.html')
+    _cache_response(http_cache, replay_url, content)
+    not_cached_url = replay_url.replace('20150313120000', '20150314120000')
+    cdx_index.update('http://url', pd.Series([replay_url, not_cached_url],
+                                             index=pd.DatetimeIndex(['2015-03-13', '2015-03-14'])))
+
+    eq_((2, 1), backfill(http_cache, cdx_index, parsed_cache))
+    eq_(1, len(parsed_cache))
+    eq_([0], parsed_cache.get_many_by_url([replay_url, not_cached_url]).keys())
+    # Already parsed replays are skipped
+    eq_((2, 0), backfill(http_cache, cdx_index, parsed_cache))
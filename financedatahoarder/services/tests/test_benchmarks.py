@@ -0,0 +1,13 @@
+from collections import OrderedDict
+
+from nose.tools import eq_
+
+from financedatahoarder.services.tests.benchmarks.run import compare
+
+
+def test_compare_flags_slowdowns_above_threshold():
+    baseline = {'bench_a': [{'name': 'parse', 'seconds': 1.0}, {'name': 'removed', 'seconds': 1.0}]}
+    current = OrderedDict([('bench_a', [{'name': 'parse', 'seconds': 1.3}, {'name': 'added', 'seconds': 1.0}]),
+                           ('bench_b', [{'name': 'serialize', 'seconds': 1.0}])])
+    eq_(compare(baseline, current, 0.25), [('bench_a', 'parse', 1.0, 1.3, True)])
+    eq_(compare(baseline, current, 0.5), [('bench_a', 'parse', 1.0, 1.3, False)])
@@ -0,0 +1,76 @@
+import shutil
+import tempfile
+from financedatahoarder.services import data_access_api
+from financedatahoarder.services.cdx_index import CdxIndexStore, last_replay_timestamp
+from financedatahoarder.services.data_access_api import NonCachingAsyncRequestsClient
+from nose.tools import eq_
+from mock import Mock, patch
+import pandas as pd
+from pandas.util.testing import assert_series_equal
+
+
+def _idx(*timestamps):
+    return pd.Series(['http://host.com/replay/{}/http://url.com'.format(ts) for ts in timestamps],
+                     index=pd.DatetimeIndex([pd.Timestamp(ts[:8]) for ts in timestamps]))
+
+
+def test_last_replay_timestamp():
+    eq_('20150310220004', last_replay_timestamp(_idx('20150309220004', '20150310220004')))
+    eq_(None, last_replay_timestamp(pd.Series()))
+
+
+def test_update_merges_newer_recordings():
+    store = CdxIndexStore()
+    store.update('http://url.com', _idx('20150309220004', '20150310100004'), now=0)
+    # Refresh lists recordings starting from the last known one
+    actual = store.update('http://url.com', _idx('20150310220004', '20150311220004'), now=1)
+    assert_series_equal(_idx('20150309220004', '20150310220004', '20150311220004'), actual)
+    eq_('20150311220004', store.get('http://url.com').last_timestamp)
+
+
+def test_lookup_stats():
+    store = CdxIndexStore(refresh_after=10)
+    eq_((None, True), store.lookup('http://url.com', now=0))
+    store.update('http://url.com', _idx('20150309220004'), now=0)
+    entry, needs_refresh = store.lookup('http://url.com', now=5)
+    eq_(False, needs_refresh)
+    entry, needs_refresh = store.lookup('http://url.com', now=10)
+    eq_(True, needs_refresh)
+    eq_({'hits': 1, 'misses': 1, 'refreshes': 1, 'entries': 1}, store.stats())
+
+
+def test_store_persisted_on_disk():
+    directory = tempfile.mkdtemp()
+    try:
+        CdxIndexStore(directory).update('http://url.com', _idx('20150309220004'), now=0)
+        entry = CdxIndexStore(directory).get('http://url.com')
+        assert_series_equal(_idx('20150309220004'), entry.idx)
+        eq_('20150309220004', entry.last_timestamp)
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_cdx_list_queries_only_newer_recordings():
+    client = NonCachingAsyncRequestsClient('http://host.com/replay', 4,
+                                           cdx_index=CdxIndexStore(refresh_after=0))
+    client.cdx_index.update('http://url.com', _idx('20150309220004'))
+    with patch.object(data_access_api.grequests, 'map',
+                      side_effect=lambda reqs, size: [Mock(status_code=200) for _ in reqs]) as grequests_map, \
+            patch.object(data_access_api, 'parse_idx_list', return_value=_idx('20150310220004')):
+        actual = client._cdx_list(['http://url.com'])
+
+        (reqs, ), _ = grequests_map.call_args
+        eq_('http://host.com/replay/pywb-cdx/*/http://url.com', reqs[0].url)
+        eq_({'from': '20150309220004'}, reqs[0].kwargs['params'])
+        assert_series_equal(_idx('20150309220004', '20150310220004'), actual['http://url.com'])
+
+
+def test_cdx_list_failed_listing_uses_listed_recordings():
+    client = NonCachingAsyncRequestsClient('http://host.com/replay', 4, cdx_index=CdxIndexStore(refresh_after=0))
+    client.cdx_index.update('http://url.com', _idx('20150309220004'))
+    with patch.object(data_access_api.grequests, 'map', side_effect=lambda reqs, size: [None] * len(reqs)):
+        actual = client._cdx_list(['http://url.com', 'http://url2.com'])
+
+        assert_series_equal(_idx('20150309220004'), actual['http://url.com'])
+        eq_(0, len(actual['http://url2.com']))
+        eq_(2, client.failed_requests)
@@ -0,0 +1,56 @@
+from collections import OrderedDict
+from io import BytesIO
+
+import numpy as np
+from nose.plugins.skip import SkipTest
+from nose.tools import eq_
+
+from financedatahoarder.services import columnar_formats
+from financedatahoarder.services.columnar_formats import encode_arrow_stream, encode_parquet, encode_msgpack, \
+    encode_npz
+
+COLUMNS = OrderedDict([
+    ('instrument_url', np.array(['http://url1.com', 'http://url2.com', 'http://url1.com'], dtype=object)),
+    ('value', np.array([1.5, np.nan, 2.5])),
+    ('value_date', np.array(['2015-03-06', '2015-03-09', '2015-03-09'], dtype='datetime64[D]')),
+])
+
+
+def _require(module):
+    if module is None:
+        raise SkipTest('Optional dependency not installed')
+
+
+def _assert_arrow_table(table):
+    eq_(['instrument_url', 'value', 'value_date'], table.schema.names)
+    eq_('date32[day]', str(table.schema.field_by_name('value_date').type))
+    eq_(['http://url1.com', 'http://url2.com', 'http://url1.com'],
+        [str(url) for url in table.column(0).to_pylist()])
+    eq_([1.5, None, 2.5], table.column(1).to_pylist())
+    eq_(['2015-03-06', '2015-03-09', '2015-03-09'], [str(day) for day in table.column(2).to_pylist()])
+
+
+def test_encode_arrow_stream():
+    _require(columnar_formats.pyarrow)
+    _assert_arrow_table(columnar_formats.pyarrow.ipc.open_stream(encode_arrow_stream(COLUMNS)).read_all())
+
+
+def test_encode_parquet():
+    _require(columnar_formats.pyarrow)
+    content = encode_parquet(COLUMNS)
+    _assert_arrow_table(columnar_formats.pyarrow.parquet.read_table(columnar_formats.pyarrow.BufferReader(content)))
+
+
+def test_encode_msgpack():
+    _require(columnar_formats.msgpack)
+    eq_({'instrument_url': ['http://url1.com', 'http://url2.com', 'http://url1.com'],
+         'value': [1.5, None, 2.5],
+         'value_date': [16500, 16503, 16503]},
+        columnar_formats.msgpack.unpackb(encode_msgpack(COLUMNS)))
+
+
+def test_encode_npz():
+    data = np.load(BytesIO(encode_npz(COLUMNS)))
+    eq_([u'http://url1.com', u'http://url2.com', u'http://url1.com'], list(data['instrument_url']))
+    np.testing.assert_array_equal(COLUMNS['value'], data['value'])
+    np.testing.assert_array_equal(COLUMNS['value_date'], data['value_date'])
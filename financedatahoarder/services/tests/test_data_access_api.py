@@ -1,19 +1,25 @@
 from functools import partial
-from itertools import chain
+from itertools import chain, count
 import pkg_resources
 import grequests
 from financedatahoarder.services import data_access_api
 from financedatahoarder.services.data_access_api import NonCachingAsyncRequestsClient
+from financedatahoarder.services.key_stats_cache import RedisKeyStatsCache, ParsedKeyStatsCache
+from financedatahoarder.services.tests.test_key_stats_cache import DummyRedisCache
+from financedatahoarder.services.timeseries_store import KeyStatsTimeSeriesStore
 from nose.tools import eq_
 from nose_parameterized import parameterized
 from datetime import datetime, date, timedelta
 from mock import call, patch
+import numpy as np
 import pandas as pd
 import logging
+import threading
+import time
 
 
 def dummy_map(reqs, *args, **kwargs):
-    return [object()] * len(reqs)
+    return [DummyResponse('', 200) for _ in reqs]
 
 
 def _assert_equal_url_method_params_same(asyncresult_expected, asyncresult_actual):
@@ -61,7 +67,8 @@ def test_query_key_stats_correct_http_requests(date_interval, urls, base_replay_
     client = NonCachingAsyncRequestsClient(base_replay_url, grequests_pool_size)
     with patch.object(data_access_api.grequests, 'map', side_effect=dummy_map) as grequests_map, \
             patch.object(client, '_cdx_list') as cdx_list, \
-            patch.object(data_access_api, 'parse_overview_key_stats_from_responses'):
+            patch.object(data_access_api, 'parse_overview_key_stats_from_responses',
+                         side_effect=lambda responses: [{}] * len(responses)):
         cdx_list.return_value = {
             url: pd.Series(['http://basehost.com/basepath/{}/{}'.format(date.strftime('%Y%m%d'), url)
                             for date in pd.date_range(*date_interval)],
@@ -71,10 +78,11 @@ def test_query_key_stats_correct_http_requests(date_interval, urls, base_replay_
 
         _ = client.query_key_stats(date_interval, urls)
 
-        cdx_list.assert_has_calls([call([url]) for url in urls])
-
-        # eq_(len(grequests_map.call_args_list), len(urls))
+        # All urls are listed at once
+        cdx_list.assert_called_once_with(urls, failed_urls=None)
 
+        # All (url, date) replays are fetched in a single batch
+        eq_(len(grequests_map.call_args_list), 1)
         for map_args, _ in grequests_map.call_args_list:
             eq_(len(map_args), 1)
 
@@ -244,9 +252,13 @@ def _yield_test_query_key_stats_parsing_funds_http_200_data():
 def test_query_key_stats_parsing_parsing_errors_but_all_http_200(urls, response_filenames, expected_key_stats):
     logger = logging.getLogger('test_query_key_stats_parsing_http_200')
     client = NonCachingAsyncRequestsClient('http://dummybaseurl.com', 4)
+    # Distinct replay request for every (date, url)
+    replay_ids = count()
     with patch.object(data_access_api.grequests, 'map') as grequests_map, \
             patch.object(client, '_cdx_list'), \
-            patch.object(data_access_api, 'prepare_replay_get'):
+            patch.object(data_access_api, 'prepare_replay_get',
+                         side_effect=lambda *args, **kwargs: grequests.get(
+                             'http://dummybaseurl.com/{}'.format(next(replay_ids)))):
         responses = [pkg_resources.resource_stream(
             'financedatahoarder.services.tests', 'testdata/{}'.format(filename)).read() for filename in response_filenames]
 
@@ -256,11 +268,10 @@ def test_query_key_stats_parsing_parsing_errors_but_all_http_200(urls, response_
 
         # Mock responses by the url
         grequest_map_return_values = [resp for resp in responses]
-        dummy_responses = iter([[DummyResponse(ret, status_code=200)]
-                                     for ret in grequest_map_return_values])
+        dummy_responses = iter([DummyResponse(ret, status_code=200)
+                                for ret in grequest_map_return_values])
         def _map_side_effect(reqs, *args, **kwargs):
-            assert len(reqs) == 1
-            return next(dummy_responses)
+            return [next(dummy_responses) for _ in reqs]
         grequests_map.side_effect = _map_side_effect
         
         # We should have num_requests should be evenly divisible by num_funds
@@ -270,10 +281,186 @@ def test_query_key_stats_parsing_parsing_errors_but_all_http_200(urls, response_
                                  urls)
 
         # Basic assertion that input test data is correct
+        eq_(len(grequests_map.call_args_list), 1)
         actual_args, actual_kwargs = grequests_map.call_args_list[0]
         eq_(actual_kwargs, {'size': 4})
         eq_(sum(len(map_args[0]) for map_args, _ in grequests_map.call_args_list),
             len(response_filenames))
 
         eq_(expected_key_stats, actual)
-        print actual
\ No newline at end of file
+
+
+def test_batch_key_stats_fetcher_fetches_only_cache_misses():
+    cache = DummyRedisCache()
+    fetcher = data_access_api.BatchKeyStatsFetcher(4, cache)
+    reqs = [grequests.get('http://basehost.com/basepath/2015010{}/http://url1.com'.format(i), params={})
+            for i in range(1, 4)]
+    RedisKeyStatsCache(cache).set_many([reqs[1]], [{'value': 1.0}])
+    with patch.object(data_access_api.grequests, 'map', side_effect=dummy_map) as grequests_map, \
+            patch.object(data_access_api, 'parse_overview_key_stats_from_responses',
+                         side_effect=lambda responses: [{'value': 2.0}] * len(responses)):
+        actual = fetcher.fetch(reqs)
+
+        grequests_map.assert_called_once_with([reqs[0], reqs[2]], size=4)
+        eq_([{'value': 2.0}, {'value': 1.0}, {'value': 2.0}], actual)
+        # Misses are written back
+        eq_(3, len(cache.connection.data))
+
+
+def test_batch_key_stats_fetcher_does_not_cache_failed_requests():
+    cache = DummyRedisCache()
+    fetcher = data_access_api.BatchKeyStatsFetcher(4, cache)
+    reqs = [grequests.get('http://basehost.com/basepath/2015010{}/http://url1.com'.format(i), params={})
+            for i in range(1, 4)]
+    with patch.object(data_access_api.grequests, 'map',
+                      side_effect=lambda reqs, **kwargs: [None, DummyResponse('', 503), DummyResponse('', 404)]), \
+            patch.object(data_access_api, 'parse_overview_key_stats_from_responses',
+                         side_effect=lambda responses: [{}] * len(responses)):
+        eq_([{}, {}, {}], fetcher.fetch(reqs))
+
+        # Only the request not found from pywb is cached
+        eq_([None, None, {}], [RedisKeyStatsCache(cache).get_many([req]).get(0) for req in reqs])
+
+
+def test_batch_key_stats_fetcher_looks_up_parsed_cache_first():
+    cache = DummyRedisCache()
+    parsed_cache = ParsedKeyStatsCache(':memory:')
+    fetcher = data_access_api.BatchKeyStatsFetcher(4, cache, parsed_cache=parsed_cache)
+    reqs = [grequests.get('http://basehost.com/basepath/2015010{}/http://url1.com'.format(i), params={})
+            for i in range(1, 4)]
+    value_date = pd.Timestamp('2015-01-01', tz='UTC')
+    parsed_cache.set_many([reqs[0]], [{'value': 1.0, 'value_date': value_date}])
+    RedisKeyStatsCache(cache).set_many([reqs[1]], [{'value': 2.0, 'value_date': value_date}])
+    with patch.object(data_access_api.grequests, 'map', side_effect=dummy_map) as grequests_map, \
+            patch.object(data_access_api, 'parse_overview_key_stats_from_responses',
+                         side_effect=lambda responses: [{'value': 3.0, 'value_date': value_date}] * len(responses)):
+        actual = fetcher.fetch(reqs)
+
+        grequests_map.assert_called_once_with([reqs[2]], size=4)
+        eq_([1.0, 2.0, 3.0], [key_stats['value'] for key_stats in actual])
+        # Redis hits and fetched entries are stored to the parsed cache
+        eq_(3, len(parsed_cache))
+
+
+def test_batch_key_stats_fetcher_waits_for_replays_in_flight():
+    fetcher = data_access_api.BatchKeyStatsFetcher(4, DummyRedisCache())
+    reqs = [grequests.get('http://basehost.com/basepath/2015010{}/http://url1.com'.format(i), params={})
+            for i in range(1, 4)]
+    first_batch_started, release_first_batch = threading.Event(), threading.Event()
+
+    def _blocking_map(map_reqs, **kwargs):
+        if not first_batch_started.is_set():
+            first_batch_started.set()
+            release_first_batch.wait()
+        return dummy_map(map_reqs)
+
+    with patch.object(data_access_api.grequests, 'map', side_effect=_blocking_map) as grequests_map, \
+            patch.object(data_access_api, 'parse_overview_key_stats_from_responses',
+                         side_effect=lambda responses: [{'value': 1.0}] * len(responses)):
+        first = threading.Thread(target=fetcher.fetch, args=(reqs[:2],))
+        first.start()
+        first_batch_started.wait()
+        # Release the first batch once the second one waits for it
+        threading.Timer(0.05, release_first_batch.set).start()
+        actual = fetcher.fetch([reqs[1], reqs[2], reqs[2]])
+        first.join()
+
+        eq_([call([reqs[0], reqs[1]], size=4), call([reqs[2]], size=4)], grequests_map.call_args_list)
+        eq_([{'value': 1.0}] * 3, actual)
+        eq_({'in_flight': 0, 'executions': 3, 'coalesced': 1}, fetcher.replay_flight.stats())
+
+
+def test_query_key_stats_coalesces_identical_concurrent_queries():
+    client = NonCachingAsyncRequestsClient('http://dummybaseurl.com', 4)
+    query_started, release_query = threading.Event(), threading.Event()
+    expected = pd.DataFrame({'value': [1.0]})
+
+    def _blocking_query(date_interval, urls, fields):
+        query_started.set()
+        release_query.wait()
+        return expected
+
+    with patch.object(client, '_query_key_stats_frame', side_effect=_blocking_query) as query:
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            client.query_key_stats_frame((date(2015, 1, 1), date(2015, 1, 2)), ['http://url1.com'])))
+            for _ in range(3)]
+        threads[0].start()
+        query_started.wait()
+        for thread in threads[1:]:
+            thread.start()
+        while client.query_flight.coalesced < 2:
+            time.sleep(0.001)
+        release_query.set()
+        for thread in threads:
+            thread.join()
+
+        eq_(1, query.call_count)
+        eq_([expected] * 3, results)
+
+
+def test_query_key_stats_answers_stored_dates_from_timeseries_store():
+    url = 'http://www.morningstar.fi/fi/funds/snapshot/snapshot.aspx?id=F0GBR04O2Q'
+    client = NonCachingAsyncRequestsClient('http://dummybaseurl.com', 4, timeseries_store=KeyStatsTimeSeriesStore())
+    idx = pd.Series(['http://dummybaseurl.com/20150310120000/' + url], index=pd.DatetimeIndex(['2015-03-10']))
+    content = pkg_resources.resource_string('financedatahoarder.services.tests',
+                                            'testdata/funds_snapshot_20150310_F0GBR04O2R.html')
+    expected = [{'value_date': pd.Timestamp('2015-03-09', tz='UTC'), 'value': 6.65, 'instrument_url': url}]
+    with patch.object(data_access_api.grequests, 'map',
+                      side_effect=lambda reqs, **kwargs: [DummyResponse(content, 200) for _ in reqs]) as grequests_map, \
+            patch.object(client, '_cdx_list', return_value={url: idx}) as cdx_list:
+        eq_(expected, client.query_key_stats((date(2015, 3, 10), date(2015, 3, 11)), [url]))
+        eq_(1, grequests_map.call_count)
+
+        # Both the recorded day and the day without recording are answered from the store
+        eq_(expected, client.query_key_stats((date(2015, 3, 10), date(2015, 3, 11)), [url]))
+        eq_(1, grequests_map.call_count)
+        eq_(1, cdx_list.call_count)
+
+        # Only the missing day is resolved
+        eq_(expected, client.query_key_stats((date(2015, 3, 10), date(2015, 3, 12)), [url]))
+        cdx_list.assert_called_with([url], failed_urls=set())
+        eq_(1, grequests_map.call_count)
+
+
+def test_query_key_stats_does_not_store_dates_of_failed_listing():
+    url = 'http://www.morningstar.fi/fi/funds/snapshot/snapshot.aspx?id=F0GBR04O2Q'
+    store = KeyStatsTimeSeriesStore()
+    client = NonCachingAsyncRequestsClient('http://dummybaseurl.com', 4, timeseries_store=store)
+    idx = pd.Series(['http://dummybaseurl.com/20150310120000/' + url], index=pd.DatetimeIndex(['2015-03-10']))
+    content = pkg_resources.resource_string('financedatahoarder.services.tests',
+                                            'testdata/funds_snapshot_20150310_F0GBR04O2R.html')
+    dates = pd.date_range(date(2015, 3, 10), date(2015, 3, 11))
+    # Listing of the recordings times out
+    with patch.object(data_access_api.grequests, 'map', side_effect=lambda reqs, **kwargs: [None] * len(reqs)):
+        eq_([], client.query_key_stats((date(2015, 3, 10), date(2015, 3, 11)), [url]))
+    eq_(list(dates), list(store.lookup(url, dates)[1]))
+
+    with patch.object(data_access_api.grequests, 'map',
+                      side_effect=lambda reqs, **kwargs: [DummyResponse(content, 200) for _ in reqs]), \
+            patch.object(client, '_cdx_list', return_value={url: idx}):
+        eq_([{'value_date': pd.Timestamp('2015-03-09', tz='UTC'), 'value': 6.65, 'instrument_url': url}],
+            client.query_key_stats((date(2015, 3, 10), date(2015, 3, 11)), [url]))
+    eq_(0, len(store.lookup(url, dates)[1]))
+
+
+def test_query_key_stats_fields_answered_from_parsed_cache():
+    url = 'http://www.morningstar.fi/fi/funds/snapshot/snapshot.aspx?id=F0GBR04O2Q'
+    client = NonCachingAsyncRequestsClient('http://dummybaseurl.com', 4, parsed_cache=ParsedKeyStatsCache(':memory:'),
+                                           timeseries_store=KeyStatsTimeSeriesStore())
+    idx = pd.Series(['http://dummybaseurl.com/20150310120000/' + url], index=pd.DatetimeIndex(['2015-03-10']))
+    content = pkg_resources.resource_string('financedatahoarder.services.tests',
+                                            'testdata/funds_snapshot_20150310_F0GBR04O2R.html')
+    with patch.object(data_access_api.grequests, 'map',
+                      side_effect=lambda reqs, **kwargs: [DummyResponse(content, 200) for _ in reqs]) as grequests_map, \
+            patch.object(client, '_cdx_list', return_value={url: idx}):
+        eq_([{'value_date': pd.Timestamp('2015-03-09', tz='UTC'), 'value': 6.65, 'instrument_url': url}],
+            client.query_key_stats((date(2015, 3, 10), date(2015, 3, 10)), [url]))
+        actual = client.query_key_stats((date(2015, 3, 10), date(2015, 3, 10)), [url],
+                                        fields=['ongoing_charges', 'yield_12m'])
+
+        # All fields were parsed from the page fetched by the first query
+        eq_(1, grequests_map.call_count)
+        eq_(['instrument_url', 'ongoing_charges', 'value_date', 'yield_12m'], sorted(actual[0]))
+        eq_(0.6, actual[0]['ongoing_charges'])
+        assert np.isnan(actual[0]['yield_12m'])
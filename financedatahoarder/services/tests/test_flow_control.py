@@ -0,0 +1,159 @@
+from datetime import date, timedelta
+import threading
+import time
+
+import gevent.event
+import grequests
+import requests
+from mock import Mock, patch
+from nose.tools import eq_
+from nose_parameterized import parameterized
+
+from financedatahoarder.services.data_access_api import grequests_map
+from financedatahoarder.services.flow_control import AIMDLimiter, CircuitBreaker, RetryPolicy, FlowControlledMap
+from financedatahoarder.services.tests.stub_pywb import StubPyWbServer
+
+
+class DummyClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_aimd_limiter_increases_additively_and_decreases_multiplicatively():
+    limiter = AIMDLimiter(min_limit=2, max_limit=16, initial_limit=4, latency_target=1.0)
+    for _ in xrange(4):
+        limiter.record(0.1, failed=False)
+    eq_(4, limiter.limit)
+    limiter.record(0.1, failed=False)
+    eq_(5, limiter.limit)
+
+    # Single decrease for a wave of failures
+    for _ in xrange(5):
+        limiter.record(0.1, failed=True)
+    eq_(2, limiter.limit)
+    limiter.record(2.0, failed=False)
+    limiter.record(2.0, failed=False)
+    eq_(2, limiter.limit)
+
+    for _ in xrange(1000):
+        limiter.record(0.1, failed=False)
+    eq_(16, limiter.limit)
+
+
+def test_circuit_breaker_opens_after_consecutive_failures():
+    clock = DummyClock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_after=10, clock=clock)
+    breaker.record(failed=True)
+    breaker.record(failed=True)
+    breaker.record(failed=False)
+    breaker.record(failed=True)
+    breaker.record(failed=True)
+    eq_(True, breaker.allow())
+    breaker.record(failed=True)
+    eq_(False, breaker.allow())
+
+    # Single trial after reset_after
+    clock.now = 10
+    eq_(True, breaker.allow())
+    eq_(False, breaker.allow())
+    breaker.record(failed=True)
+    eq_(CircuitBreaker.OPEN, breaker.state)
+    clock.now = 20
+    eq_(True, breaker.allow())
+    breaker.record(failed=False)
+    eq_(True, breaker.allow())
+    eq_(CircuitBreaker.CLOSED, breaker.state)
+
+
+def test_retry_policy():
+    policy = RetryPolicy(retries=2, backoff=0.5)
+    response = requests.Response()
+    response.status_code = 503
+    eq_(True, policy.should_retry(response, 0))
+    eq_(True, policy.should_retry(None, 1))
+    eq_(False, policy.should_retry(None, 2))
+    response.status_code = 404
+    eq_(False, policy.should_retry(response, 0))
+    for _ in xrange(100):
+        assert 0 <= policy.delay(2) <= 1.0
+
+
+def _replay_requests(stub, num, session):
+    return [grequests.get(stub.base_url + '2015030{}120000/http://url1.com'.format(i), session=session)
+            for i in xrange(num)]
+
+
+def test_flow_controlled_map_retries_faults_of_stub_pywb():
+    with StubPyWbServer(date(2015, 3, 1), 1) as stub, requests.Session() as session:
+        stub.inject_faults([503, StubPyWbServer.DROP, 502])
+        flow_controlled_map = FlowControlledMap(grequests_map, AIMDLimiter(max_limit=4),
+                                                RetryPolicy(retries=2, backoff=0), timeout=1)
+        responses = flow_controlled_map(_replay_requests(stub, 4, session))
+
+        eq_([200] * 4, [response.status_code for response in responses])
+        eq_(7, stub.requests)
+        # Limit was halved once by the failed requests
+        eq_({'limit': 3, 'retried': 3, 'rejected': 0, 'open_circuits': 0}, flow_controlled_map.stats())
+
+
+def test_flow_controlled_map_fails_fast_on_open_circuit():
+    with StubPyWbServer(date(2015, 3, 1), 1) as stub, requests.Session() as session:
+        stub.inject_faults(status=503)
+        flow_controlled_map = FlowControlledMap(grequests_map, AIMDLimiter(max_limit=2), RetryPolicy(retries=1, backoff=0),
+                                                timeout=1, failure_threshold=3)
+        responses = flow_controlled_map(_replay_requests(stub, 8, session))
+
+        # Retry of one of the first two requests opens the circuit, rest of the requests are rejected
+        eq_(sorted([503] + [None] * 7),
+            sorted(None if response is None else response.status_code for response in responses))
+        eq_(3, stub.requests)
+        eq_(7, flow_controlled_map.stats()['rejected'])
+        eq_(1, flow_controlled_map.stats()['open_circuits'])
+
+
+@parameterized.expand([('greenlets', False, gevent.event.Event), ('threads', True, threading.Event)])
+def test_flow_controlled_map_does_not_wait_for_slow_request(_, threaded, event_type):
+    slow_url = 'http://url1.com/slow'
+    completed = []
+    fast_completed = event_type()
+
+    def map_func(reqs, size):
+        req, = reqs
+        if req.url == slow_url:
+            fast_completed.wait(5)
+        completed.append(req.url)
+        if len(completed) == 2:
+            fast_completed.set()
+        return [Mock(status_code=200, elapsed=timedelta(seconds=0.1))]
+
+    urls = [slow_url, 'http://url1.com/fast1', 'http://url1.com/fast2']
+    flow_controlled_map = FlowControlledMap(map_func, AIMDLimiter(max_limit=2), threaded=threaded)
+    responses = flow_controlled_map([Mock(url=url, kwargs={}) for url in urls])
+
+    eq_([200] * 3, [response.status_code for response in responses])
+    # Third request was sent as soon as the second one completed, while the first one was in flight
+    eq_(['http://url1.com/fast1', 'http://url1.com/fast2', slow_url], completed)
+
+
+def test_flow_controlled_map_retries_without_holding_back_other_requests():
+    sent = []
+
+    def map_func(reqs, size):
+        req, = reqs
+        sent.append(req.url)
+        status_code = 503 if sent.count(req.url) == 1 and req.url.endswith('failing') else 200
+        return [Mock(status_code=status_code, elapsed=timedelta(seconds=0.1))]
+
+    urls = ['http://url1.com/failing', 'http://url1.com/1', 'http://url1.com/2', 'http://url1.com/3']
+    flow_controlled_map = FlowControlledMap(map_func, AIMDLimiter(max_limit=1), RetryPolicy(retries=1, backoff=0))
+    with patch.object(flow_controlled_map.retry_policy, 'delay', return_value=0.2):
+        started = time.time()
+        responses = flow_controlled_map([Mock(url=url, kwargs={}) for url in urls])
+
+    eq_([200] * 4, [response.status_code for response in responses])
+    # Other requests were sent during the retry delay of the failed request
+    eq_(urls + ['http://url1.com/failing'], sent)
+    assert time.time() - started < 0.5
@@ -0,0 +1,35 @@
+import shutil
+import tempfile
+from datetime import date
+
+import grequests
+import requests
+from nose.tools import eq_
+
+from financedatahoarder.services.tests.server_process import free_port, start_server, write_config
+from financedatahoarder.services.tests.stub_pywb import StubPyWbServer
+
+
+def test_concurrent_queries_to_gevent_server():
+    directory = tempfile.mkdtemp()
+    try:
+        with StubPyWbServer(date(2015, 3, 10), 2, latency=0.05) as stub:
+            port = free_port()
+            process = start_server('gevent', port, write_config(directory, stub.base_url))
+            try:
+                session = requests.Session()
+                reqs = [grequests.get('http://127.0.0.1:{}/instruments/'.format(port), session=session,
+                                      params={'format': 'csv', 'date_interval': '2015-03-10/2015-03-11',
+                                              'url': 'http://www.morningstar.fi/fi/funds/snapshot/snapshot.aspx'
+                                                     '?id=F{}'.format(i)})
+                        for i in xrange(8)]
+                responses = grequests.map(reqs, size=8)
+            finally:
+                process.terminate()
+                process.wait()
+        eq_([response.status_code for response in responses], [200] * 8)
+        for i, response in enumerate(responses):
+            eq_(response.text.splitlines()[1:],
+                ['http://www.morningstar.fi/fi/funds/snapshot/snapshot.aspx?id=F{},6.65,2015-03-09'.format(i)])
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,55 @@
+import os
+import shutil
+import tempfile
+
+from nose.tools import eq_
+
+from financedatahoarder.services.http_cache import SqliteHttpCache
+
+
+class TestSqliteHttpCache(object):
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'http_cache.sqlite')
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def test_roundtrip(self):
+        cache = SqliteHttpCache(self.path)
+        eq_(None, cache.get('url'))
+        cache.set('url', b'response\x00bytes')
+        eq_(b'response\x00bytes', cache.get('url'))
+        cache.delete('url')
+        eq_(None, cache.get('url'))
+        eq_({'hits': 1, 'misses': 2}, {k: cache.stats()[k] for k in ('hits', 'misses')})
+
+    def test_evicts_least_recently_used_over_max_entries(self):
+        cache = SqliteHttpCache(self.path, max_entries=4, evict_to=0.5, check_every=1, touch_after=0)
+        for i in range(4):
+            cache.set('url{}'.format(i), b'x')
+        # Access makes url0 most recently used
+        cache.get('url0')
+        cache.set('url4', b'x')
+        eq_([True, False, False, False, True], [cache.get('url{}'.format(i)) is not None for i in range(5)])
+        eq_(3, cache.stats()['evictions'])
+
+    def test_evicts_over_max_bytes(self):
+        cache = SqliteHttpCache(self.path, max_bytes=10, evict_to=1.0, check_every=1)
+        for i in range(3):
+            cache.set('url{}'.format(i), b'x' * 4)
+        eq_(2, cache.stats()['entries'])
+        eq_(8, cache.stats()['bytes'])
+
+    def test_evicts_expired(self):
+        cache = SqliteHttpCache(self.path, ttl=60, check_every=1000)
+        cache.set('url', b'x')
+        eq_(1, cache.evict(now=1e10))
+        eq_(None, cache.get('url'))
+
+    def test_compact(self):
+        cache = SqliteHttpCache(self.path, max_entries=1, evict_to=1.0, check_every=1000)
+        for i in range(3):
+            cache.set('url{}'.format(i), b'x' * 1000)
+        eq_(2, cache.compact())
+        eq_(1, cache.stats()['entries'])
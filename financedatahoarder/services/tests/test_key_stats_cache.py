@@ -0,0 +1,101 @@
+from financedatahoarder.services.key_stats_cache import replay_cache_key, RedisKeyStatsCache, ParsedKeyStatsCache, \
+    ParsedTrailingReturnsCache
+import grequests
+import numpy as np
+import pandas as pd
+from nose.tools import eq_
+from nose_parameterized import parameterized
+
+
+class DummyRedisConnection(object):
+    def __init__(self):
+        self.data = {}
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def pipeline(self, transaction=True):
+        return DummyRedisPipeline(self)
+
+
+class DummyRedisPipeline(object):
+    def __init__(self, connection):
+        self.connection = connection
+        self.commands = []
+
+    def setex(self, key, expire, value):
+        self.commands.append((key, value))
+
+    def set(self, key, value):
+        self.commands.append((key, value))
+
+    def execute(self):
+        self.connection.data.update(self.commands)
+
+
+class DummyRedisCache(object):
+    expire = 60
+
+    def __init__(self):
+        self.connection = DummyRedisConnection()
+
+
+@parameterized([
+    (grequests.get('http://host.com/replay/20150101/http://url.com', params={}),
+     'http://host.com/replay/20150101/http://url.com'),
+    (grequests.get('http://host.com/replay/20150101/http://url.com', params={'id': '2', 'a': '1'}),
+     'http://host.com/replay/20150101/http://url.com?a=1&id=2'),
+    # Key does not depend on how url and params are split
+    (grequests.get('http://host.com/replay/20150101/http://url.com?id=2', params={'a': '1'}),
+     'http://host.com/replay/20150101/http://url.com?a=1&id=2'),
+])
+def test_replay_cache_key(req, expected):
+    eq_(expected, replay_cache_key(req))
+
+
+def test_replay_cache_key_of_percent_encoded_query_string():
+    url = 'http://host.com/replay/20150101/http://tools.morningstar.fi/fi/stockreport/default.aspx'
+    key = replay_cache_key(grequests.get(url, params={'SecurityToken': '0P0000A5Z8]3]0'}))
+    eq_(url + '?SecurityToken=0P0000A5Z8%5D3%5D0', key)
+    eq_(key, replay_cache_key(grequests.get(url + '?SecurityToken=0P0000A5Z8%5D3%5D0', params={})))
+
+
+def test_redis_key_stats_cache_roundtrip():
+    cache = RedisKeyStatsCache(DummyRedisCache())
+    reqs = [grequests.get('http://host.com/replay/2015010{}/http://url.com'.format(i), params={'id': '2'})
+            for i in range(3)]
+    cache.set_many(reqs[:2], [{'value': 1.0}, {}])
+    eq_({0: {'value': 1.0}, 1: {}}, cache.get_many(reqs))
+
+
+def test_redis_key_stats_cache_disabled_without_connection():
+    class _NoConnection(object):
+        connection = None
+
+    cache = RedisKeyStatsCache(_NoConnection)
+    req = grequests.get('http://host.com/replay/20150101/http://url.com', params={})
+    cache.set_many([req], [{'value': 1.0}])
+    eq_({}, cache.get_many([req]))
+
+
+def test_parsed_key_stats_cache_roundtrip():
+    cache = ParsedKeyStatsCache(':memory:')
+    reqs = [grequests.get('http://host.com/replay/2015010{}/http://url.com'.format(i), params={'id': '2'})
+            for i in range(3)]
+    value_date = pd.Timestamp('2015-01-01', tz='UTC')
+    cache.set_many(reqs[:2], [{'value': 1.0, 'value_date': value_date}, {}])
+    # Failed parses are not cached
+    eq_({0: {'value': 1.0, 'value_date': value_date}}, cache.get_many(reqs))
+    eq_(1, len(cache))
+
+
+def test_parsed_trailing_returns_cache_shares_database_with_key_stats():
+    key_stats_cache = ParsedKeyStatsCache(':memory:')
+    cache = ParsedTrailingReturnsCache(':memory:')
+    req = grequests.get('http://host.com/replay/20150101/http://url.com', params={'id': '2', 'tab': '1'})
+    cache.set_many([req], [{'time_interval': [u'YTD'], 'returns_total': [1.5], 'returns_class': [float('nan')],
+                            'returns_index': [0.5]}])
+    cached = cache.get_many([req])[0]
+    eq_([u'YTD'], cached['time_interval'])
+    assert np.isnan(cached['returns_class'][0])
+    eq_(0, len(key_stats_cache))
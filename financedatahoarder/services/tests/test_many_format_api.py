@@ -0,0 +1,32 @@
+from flask import Flask, make_response
+from flask.ext.restplus import Resource
+from nose.tools import eq_
+
+from financedatahoarder.services.many_format_api import ManyFormatApi
+
+
+def _test_client():
+    app = Flask(__name__)
+    api = ManyFormatApi(app)
+
+    @api.representation('text/csv')
+    def output_csv(data, code, headers=None):
+        return make_response('csv', code)
+
+    @api.route('/resource')
+    class DummyResource(Resource):
+        def get(self):
+            return {'value': 1}
+
+    return app.test_client()
+
+
+def test_format_argument_overrides_accept_header():
+    client = _test_client()
+    response = client.get('/resource?format=csv', headers={'Accept': 'application/json'})
+    eq_(('text/csv', 'csv'), (response.mimetype, response.data))
+    eq_('application/json', client.get('/resource', headers={'Accept': 'application/json'}).mimetype)
+
+
+def test_unknown_format_is_not_acceptable():
+    eq_(406, _test_client().get('/resource?format=xml').status_code)
@@ -0,0 +1,62 @@
+from io import BytesIO
+import json
+
+import numpy as np
+from nose.tools import eq_
+import pandas as pd
+
+from financedatahoarder.services.matrix import KeyStatsMatrix, KeyStatsTable, pivot_key_stats
+from financedatahoarder.services.utils import assemble_key_stats
+
+KEY_STATS_BY_URL = {
+    'url1': [{'value': 1.5, 'value_date': pd.Timestamp('2015-03-06', tz='UTC')},
+             {'value': 2.5, 'value_date': pd.Timestamp('2015-03-09', tz='UTC')}],
+    'url2': [{'value': 3.0, 'value_date': pd.Timestamp('2015-03-09', tz='UTC')}],
+}
+URLS = ['url2', 'url1']
+
+
+def _matrix(fill=False):
+    return KeyStatsMatrix(pivot_key_stats(assemble_key_stats(URLS, KEY_STATS_BY_URL), URLS, fill=fill))
+
+
+def test_to_csv():
+    eq_('value_date,url2,url1\n'
+        '2015-03-06,,1.5\n'
+        '2015-03-09,3.0,2.5\n', _matrix().to_csv())
+
+
+def test_to_csv_forward_filled():
+    eq_('value_date,url2,url1\n'
+        '2015-03-06,,1.5\n'
+        '2015-03-07,,1.5\n'
+        '2015-03-08,,1.5\n'
+        '2015-03-09,3.0,2.5\n', _matrix(fill=True).to_csv())
+
+
+def test_to_json():
+    eq_({'value_date': ['2015-03-06', '2015-03-09'], 'instrument_url': ['url2', 'url1'],
+         'values': [[None, 3.0], [1.5, 2.5]]}, json.loads(_matrix().to_json()))
+
+
+def test_to_npz():
+    data = np.load(BytesIO(_matrix().to_npz()))
+    eq_(['2015-03-06', '2015-03-09'], [str(value_date) for value_date in data['value_date']])
+    eq_([u'url2', u'url1'], list(data['instrument_url']))
+    np.testing.assert_array_equal([[np.nan, 1.5], [3.0, 2.5]], data['values'])
+
+
+def test_empty_matrix():
+    matrix = KeyStatsMatrix(pivot_key_stats(assemble_key_stats(['url1'], {'url1': []}), ['url1'], fill=True))
+    eq_('value_date,url1\n', matrix.to_csv())
+    eq_({'value_date': [], 'instrument_url': ['url1'], 'values': [[]]}, json.loads(matrix.to_json()))
+
+
+def test_key_stats_table_to_csv_and_json():
+    table = KeyStatsTable(assemble_key_stats(URLS, dict(KEY_STATS_BY_URL, url2=[{}]), fields=('value', 'fund_size')))
+    eq_('fund_size,instrument_url,value,value_date\n'
+        ',url1,1.5,2015-03-06\n'
+        ',url1,2.5,2015-03-09\n', table.to_csv())
+    eq_('[{"instrument_url": "url1", "value": 1.5, "value_date": "2015-03-06", "fund_size": NaN}, '
+        '{"instrument_url": "url1", "value": 2.5, "value_date": "2015-03-09", "fund_size": NaN}]', table.to_json())
+    eq_('[]', KeyStatsTable(assemble_key_stats(['url1'], {'url1': []})).to_json())
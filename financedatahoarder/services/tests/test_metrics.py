@@ -0,0 +1,81 @@
+from datetime import date
+
+import pandas as pd
+from mock import patch
+from nose.tools import eq_, assert_raises, assert_in
+
+from financedatahoarder.scraper.scrapers.parsers.morningstar_overview import OverviewKeyStats
+from financedatahoarder.services import data_access_api
+from financedatahoarder.services.data_access_api import NonCachingAsyncRequestsClient
+from financedatahoarder.services.key_stats_cache import ParsedKeyStatsCache
+from financedatahoarder.services.metrics import Counter, Histogram, Collected, Registry, STAGE_SECONDS, \
+    KEY_STATS_CACHE_LOOKUPS, timed, register_client
+from financedatahoarder.services.tests.test_data_access_api import dummy_map
+
+
+def test_histogram_render_cumulative_buckets():
+    histogram = Histogram('latency_seconds', 'Latency', ('stage',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value, ('parse',))
+    eq_(histogram.render(), '\n'.join([
+        '# HELP latency_seconds Latency',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{stage="parse",le="0.1"} 2.0',
+        'latency_seconds_bucket{stage="parse",le="1.0"} 3.0',
+        'latency_seconds_bucket{stage="parse",le="+Inf"} 4.0',
+        'latency_seconds_sum{stage="parse"} 2.65',
+        'latency_seconds_count{stage="parse"} 4.0']))
+
+
+def test_registry_render():
+    registry = Registry()
+    counter = registry.register(Counter('lookups_total', 'Lookups', ('cache', 'result')))
+    counter.inc(('parsed', 'hit'), 3)
+    counter.inc(('parsed', 'hit'))
+    registry.register(Collected('entries', 'Entries', ('path',), lambda: {('a"b',): 2}))
+    eq_(registry.render(), '\n'.join([
+        '# HELP entries Entries',
+        '# TYPE entries gauge',
+        'entries{path="a\\"b"} 2.0',
+        '# HELP lookups_total Lookups',
+        '# TYPE lookups_total counter',
+        'lookups_total{cache="parsed",result="hit"} 4.0', '']))
+
+
+def test_timed_records_also_failed_calls():
+    @timed('test_stage')
+    def _fail():
+        raise ValueError()
+
+    count_before = STAGE_SECONDS.count(('test_stage',))
+    with assert_raises(ValueError):
+        _fail()
+    eq_(STAGE_SECONDS.count(('test_stage',)), count_before + 1)
+
+
+def test_query_records_stages_and_cache_lookups():
+    client = NonCachingAsyncRequestsClient('http://basehost.com/', 4, http_cache={}, list_http_cache={},
+                                           parsed_cache=ParsedKeyStatsCache(':memory:'), map_func=dummy_map)
+    registry = Registry()
+    register_client(client, registry=registry)
+    dates = pd.date_range('2015-01-01', '2015-01-02')
+    idx = {'http://url1.com': pd.Series(['http://basehost.com/{}/http://url1.com'.format(day.strftime('%Y%m%d'))
+                                         for day in dates], index=dates)}
+    stages = ('query', 'cdx_list', 'cache_lookup', 'fetch', 'replay', 'parse')
+    counts_before = [STAGE_SECONDS.count((stage,)) for stage in stages]
+    hits_before = KEY_STATS_CACHE_LOOKUPS.value(('parsed', 'hit'))
+    misses_before = KEY_STATS_CACHE_LOOKUPS.value(('parsed', 'miss'))
+    with patch.object(data_access_api, 'parse_idx_list', return_value=idx['http://url1.com']), \
+            patch('financedatahoarder.services.parse_utils.parse_overview_key_stats_or_empty',
+                  return_value=OverviewKeyStats(value=1.0, value_date=pd.Timestamp('2015-01-01', tz='UTC'))):
+        client.query_key_stats((date(2015, 1, 1), date(2015, 1, 2)), ['http://url1.com'])
+        # Second query is answered from the parsed cache
+        client.query_key_stats((date(2015, 1, 1), date(2015, 1, 2)), ['http://url1.com'])
+
+    eq_([STAGE_SECONDS.count((stage,)) - before for stage, before in zip(stages, counts_before)],
+        [2, 2, 2, 1, 1, 1])
+    eq_(KEY_STATS_CACHE_LOOKUPS.value(('parsed', 'hit')) - hits_before, 2)
+    eq_(KEY_STATS_CACHE_LOOKUPS.value(('parsed', 'miss')) - misses_before, 2)
+    rendered = registry.render()
+    assert_in('financedatahoarder_cache_lookups_total{cache="cdx_index",result="hit"} 1.0', rendered)
+    assert_in('financedatahoarder_coalesced_total{flight="query",result="executions"} 2.0', rendered)
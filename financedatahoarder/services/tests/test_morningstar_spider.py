@@ -0,0 +1,69 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import date
+
+import pandas as pd
+import pkg_resources
+import pytz
+from mock import Mock
+from nose.tools import eq_
+from scrapy.http import HtmlResponse, Request
+
+from financedatahoarder.scraper.scrapers.items import InstrumentKeyStats
+from financedatahoarder.scraper.scrapers.pipelines import TimeSeriesStorePipeline
+from financedatahoarder.scraper.scrapers.spiders.morningstar_overview import MorningstarOverviewSpider
+from financedatahoarder.services.tests.stub_pywb import StubPyWbServer
+from financedatahoarder.services.timeseries_store import KeyStatsTimeSeriesStore
+
+
+def _fixture_response(url, filename):
+    body = pkg_resources.resource_string('financedatahoarder.services.tests', 'testdata/{}'.format(filename))
+    return HtmlResponse(url, body=body, request=Request(url, meta={'instrument_url': url}))
+
+
+def test_spider_parse():
+    spider = MorningstarOverviewSpider(urls=['http://fund.com/?id=1'])
+    items = list(spider.parse(_fixture_response('http://fund.com/?id=1', 'funds_snapshot_20150310_F0GBR04O2R.html')))
+    eq_(items, [InstrumentKeyStats(instrument_url='http://fund.com/?id=1', query_date=spider.query_date, value=6.65,
+                                   value_date=pd.Timestamp('2015-03-09', tz=pytz.UTC))])
+    eq_(list(spider.parse(_fixture_response('http://fund.com/?id=1', 'invalid.html'))), [])
+
+
+def test_pipeline_writes_batches_per_instrument():
+    store = Mock()
+    pipeline = TimeSeriesStorePipeline(store, batch_size=3)
+    items = [InstrumentKeyStats(instrument_url=url, query_date=pd.Timestamp(query_date, tz=pytz.UTC), value=1.0,
+                                value_date=pd.Timestamp(query_date, tz=pytz.UTC))
+             for url, query_date in [('http://a.com', '2015-01-01'), ('http://b.com', '2015-01-01'),
+                                     ('http://a.com', '2015-01-02'), ('http://a.com', '2015-01-03')]]
+    for item in items:
+        pipeline.process_item(item, None)
+    eq_([call[0][0] for call in store.update.call_args_list], ['http://a.com', 'http://b.com'])
+    eq_(len(store.update.call_args_list[0][0][2]), 2)
+    pipeline.close_spider(None)
+    eq_(len(store.update.call_args_list), 3)
+
+
+def test_crawl_to_timeseries_store():
+    directory = tempfile.mkdtemp()
+    try:
+        with StubPyWbServer(date(2015, 3, 10), 1) as stub:
+            urls = [stub.base_url + 'fi/funds/snapshot/snapshot.aspx?id=F{}'.format(i) for i in xrange(5)]
+            instruments_path = os.path.join(directory, 'instruments.txt')
+            with open(instruments_path, 'w') as f:
+                f.write('\n'.join(urls))
+            timeseries_dir = os.path.join(directory, 'timeseries')
+            subprocess.check_output([sys.executable, '-m', 'financedatahoarder.scraper.scrapers.crawl',
+                                     instruments_path, '--timeseries-dir', timeseries_dir,
+                                     '-s', 'AUTOTHROTTLE_START_DELAY=0'], stderr=subprocess.STDOUT)
+
+        store = KeyStatsTimeSeriesStore(timeseries_dir, settle_days=0)
+        today = pd.DatetimeIndex([pd.Timestamp.utcnow().date()], tz=pytz.UTC)
+        for url in urls:
+            key_stats, missing = store.lookup(url, today)
+            eq_(key_stats, [{'value': 6.65, 'value_date': pd.Timestamp('2015-03-09', tz=pytz.UTC)}])
+    finally:
+        shutil.rmtree(directory)
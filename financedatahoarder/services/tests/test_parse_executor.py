@@ -0,0 +1,46 @@
+import pkg_resources
+from financedatahoarder.services import data_access_api
+from financedatahoarder.services.data_access_api import BatchKeyStatsFetcher, DummyCache
+from financedatahoarder.services.metrics import STAGE_SECONDS
+from financedatahoarder.services.parse_executor import ProcessPoolParseExecutor
+from financedatahoarder.services.parse_utils import parse_overview_key_stats_from_responses
+from financedatahoarder.services.tests.test_data_access_api import DummyResponse
+import grequests
+from mock import patch
+from nose.tools import eq_
+
+FILENAMES = ['funds_snapshot_20150310_F0GBR04O2R.html', 'invalid.html', 'etf_snapshot_20150312_0P0000M7ZP.html',
+             'stock_20150320_knebv.html']
+
+
+def _responses(filenames):
+    return [DummyResponse(pkg_resources.resource_stream('financedatahoarder.services.tests',
+                                                        'testdata/{}'.format(filename)).read(), status_code=200)
+            for filename in filenames]
+
+
+def test_process_pool_parse_executor_same_as_inline():
+    executor = ProcessPoolParseExecutor(2)
+    try:
+        responses = _responses(FILENAMES) + [DummyResponse('', status_code=404)]
+        eq_(map(dict, parse_overview_key_stats_from_responses(responses)), executor.submit(responses).get())
+    finally:
+        executor.close()
+
+
+def test_batch_key_stats_fetcher_downloads_in_chunks():
+    executor = ProcessPoolParseExecutor(2, chunk_size=3)
+    fetcher = BatchKeyStatsFetcher(4, DummyCache, parse_executor=executor)
+    reqs = [grequests.get('http://host.com/replay/2015010{}/http://url1.com'.format(i), params={})
+            for i in range(len(FILENAMES))]
+    parse_count_before = STAGE_SECONDS.count(('parse',))
+    try:
+        with patch.object(data_access_api.grequests, 'map',
+                          side_effect=lambda reqs, size: _responses(FILENAMES[:len(reqs)])) as grequests_map:
+            actual = fetcher.fetch(reqs)
+            eq_([len(args[0]) for args, _ in grequests_map.call_args_list], [3, 1])
+            eq_(parse_count_before + 1, STAGE_SECONDS.count(('parse',)))
+            eq_(map(dict, parse_overview_key_stats_from_responses(_responses(FILENAMES[:3] + FILENAMES[:1]))),
+                actual)
+    finally:
+        executor.close()
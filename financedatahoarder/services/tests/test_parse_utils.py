@@ -3,10 +3,18 @@ from urllib import quote_plus
 from StringIO import StringIO
 import pkg_resources
 import requests
-from financedatahoarder.services.parse_utils import parse_idx_list
+from financedatahoarder.scraper.scrapers.parsers.morningstar_overview import parse_overview_key_stats, \
+    parse_overview_key_stats_fast
+from financedatahoarder.scraper.scrapers.parsers.morningstar_tab_1 import parse_trailing_returns, \
+    parse_trailing_returns_fast
+from financedatahoarder.services.parse_utils import parse_idx_list, parse_timestamps, \
+    parse_overview_key_stats_from_responses
+from scrapy import Selector
+from nose.tools import eq_
+from nose.tools import raises
 from nose_parameterized import parameterized
 import pandas as pd
-from pandas.util.testing import assert_series_equal
+from pandas.util.testing import assert_frame_equal, assert_series_equal
 
 
 class DummyResponse(object):
@@ -94,3 +102,111 @@ def test_parse_idx_list(response_filename, expected_idx):
     print 'actual:\n', s.getvalue()
     print '/actual'
     assert_series_equal(expected_idx, actual_idx)
+
+
+_CDX_JSON = '\n'.join([
+    '{"urlkey": "fi,morningstar)/", "timestamp": "20150403150012", "url": "http://url.com/?id=1", "status": "200"}',
+    '{"urlkey": "fi,morningstar)/", "timestamp": "20150403210014", "url": "http://url.com/?id=1", "status": "200"}',
+    '{"urlkey": "fi,morningstar)/", "timestamp": "20150403230014", "url": "http://url.com/?id=1", "status": "-"}',
+    '{"urlkey": "fi,morningstar)/", "timestamp": "20150404210015", "url": "http://url.com/?id=1", "status": "200"}',
+])
+_CDX_JSON_ARRAY = '''[["urlkey", "timestamp", "original", "statuscode"],
+["fi,morningstar)/", "20150403150012", "http://url.com/?id=1", "200"],
+["fi,morningstar)/", "20150403210014", "http://url.com/?id=1", "200"],
+["fi,morningstar)/", "20150403230014", "http://url.com/?id=1", "-"],
+["fi,morningstar)/", "20150404210015", "http://url.com/?id=1", "200"]]'''
+_CDX_TEXT = '\n'.join([
+    'fi,morningstar)/ 20150403150012 http://url.com/?id=1 text/html 200 AAA - - 1043 333 rec.warc.gz',
+    'fi,morningstar)/ 20150403210014 http://url.com/?id=1 text/html 200 AAA - - 1043 333 rec.warc.gz',
+    'fi,morningstar)/ 20150403230014 http://url.com/?id=1 warc/revisit - AAA - - 1043 333 rec.warc.gz',
+    'fi,morningstar)/ 20150404210015 http://url.com/?id=1 text/html 200 AAA - - 1043 333 rec.warc.gz',
+])
+
+
+def test_parse_idx_list_html_partially_unknown_layout():
+    content = pkg_resources.resource_string('financedatahoarder.services.tests', 'testdata/cdx_list_no_status.html')
+    # Last recording of 2015-04-05 in a row not matching the fast parser
+    content = content.replace('<td><a href="http://host.com/replay/20150405180012/',
+                              '<td class="recording"><a href="http://host.com/replay/20150405180012/')
+    actual_idx = parse_idx_list(DummyResponse(content))
+    eq_(u'http://host.com/replay/20150405180012/http://www.morningstar.fi/fi/funds/snapshot/snapshot.aspx'
+        u'?id=F0GBR04OGI', actual_idx[pd.Timestamp('2015-04-05')])
+
+
+@parameterized([(_CDX_JSON, ), (_CDX_JSON_ARRAY, ), (_CDX_TEXT, )])
+def test_parse_idx_list_cdx_server_output(content):
+    response = DummyResponse(content)
+    response.url = 'http://host.com/replay/pywb-cdx'
+    expected_idx = pd.Series([u'http://host.com/replay/20150403210014/http://url.com/?id=1',
+                              u'http://host.com/replay/20150404210015/http://url.com/?id=1'],
+                             index=pd.DatetimeIndex(['2015-04-03', '2015-04-04']))
+    assert_series_equal(expected_idx, parse_idx_list(response))
+
+
+@parameterized([(['2015031219000'], ), (['201503121900041'], ), (['2015031219000x'], ), (['20151312190004'], ),
+                (['20150231190004'], ), (['20150431190004'], )])
+@raises(ValueError)
+def test_parse_timestamps_invalid(timestamps):
+    parse_timestamps(timestamps)
+
+
+@parameterized([('funds_snapshot_20150310_F0GBR04O2R.html', ),
+                ('funds_snapshot_20150311_F0GBR04O2J.html', ),
+                ('etf_snapshot_20150312_0P0000M7ZP.html', ),
+                ('stock_20150320_knebv.html', )])
+def test_parse_overview_key_stats_fast_same_as_selector_based(filename):
+    content = pkg_resources.resource_stream('financedatahoarder.services.tests', 'testdata/{}'.format(filename)).read()
+    eq_(map(dict, parse_overview_key_stats(Selector(text=content))), map(dict, parse_overview_key_stats_fast(content)))
+
+
+@parameterized([('funds_snapshot_20150310_F0GBR04O2R.html',
+                 {'change_1d': -0.73, 'ongoing_charges': 0.6, 'fund_size': 217.36, 'share_class_size': 168.2}),
+                ('etf_snapshot_20150312_0P0000M7ZP.html',
+                 {'change_1d': -0.05, 'ongoing_charges': 0.09, 'fund_size': 4098.0, 'share_class_size': 4098.0}),
+                ('stock_20150320_knebv.html', {})])
+def test_parse_overview_key_stats_fields(filename, expected_fields):
+    content = pkg_resources.resource_stream('financedatahoarder.services.tests', 'testdata/{}'.format(filename)).read()
+    key_stats, = parse_overview_key_stats_fast(content)
+    eq_(expected_fields, {field: value for field, value in key_stats.iteritems()
+                          if field not in ('value', 'value_date')})
+
+
+def test_parse_overview_key_stats_rows_without_text_heading():
+    content = pkg_resources.resource_stream('financedatahoarder.services.tests',
+                                            'testdata/funds_snapshot_20150310_F0GBR04O2R.html').read()
+    # Empty and numeric headings are read by pandas as NaN and number column labels
+    content = content.replace('<tr><td class="line heading">ISIN</td>',
+                              '<tr><td class="line heading"></td><td class="line"> </td><td class="line text">1,5</td>'
+                              '</tr><tr><td class="line heading">2015</td><td class="line"> </td>'
+                              '<td class="line text">2,5</td></tr><tr><td class="line heading">ISIN</td>')
+    expected = {'value': 6.65, 'value_date': pd.Timestamp('2015-03-09', tz='UTC'), 'change_1d': -0.73,
+                'ongoing_charges': 0.6, 'fund_size': 217.36, 'share_class_size': 168.2}
+    eq_([expected], map(dict, parse_overview_key_stats(Selector(text=content))))
+    eq_([expected], map(dict, parse_overview_key_stats_fast(content)))
+
+
+@raises(ValueError)
+def test_parse_overview_key_stats_fast_invalid():
+    parse_overview_key_stats_fast(pkg_resources.resource_stream('financedatahoarder.services.tests',
+                                                                'testdata/invalid.html').read())
+
+
+def test_parse_overview_key_stats_from_responses_failed_request():
+    eq_([{}], parse_overview_key_stats_from_responses([None]))
+
+
+def test_parse_trailing_returns_fast_same_as_read_html_based():
+    content = pkg_resources.resource_stream('financedatahoarder.services.tests',
+                                            'testdata/funds_snapshot_tab1_20150310_F0GBR04O2R.html').read()
+    trailing_returns, = parse_trailing_returns_fast(content)
+    eq_(trailing_returns['time_interval'][:2], [u'1 p\xe4iv\xe4', u'1 viikko'])
+    eq_(trailing_returns['returns_total'][:2], [0.45, 1.37])
+    eq_(trailing_returns['returns_index'][:2], [-0.03, 0.21])
+    assert_frame_equal(pd.DataFrame(dict(parse_trailing_returns(Selector(text=content.decode('utf-8')))[0])),
+                       pd.DataFrame(dict(trailing_returns)))
+
+
+@raises(ValueError)
+def test_parse_trailing_returns_fast_invalid():
+    parse_trailing_returns_fast(pkg_resources.resource_stream('financedatahoarder.services.tests',
+                                                              'testdata/funds_snapshot_20150310_F0GBR04O2R.html').read())
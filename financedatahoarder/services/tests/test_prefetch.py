@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+from datetime import date
+from StringIO import StringIO
+
+from mock import Mock, call
+from nose.tools import eq_, assert_raises
+
+from financedatahoarder.services.prefetch import AlreadyRunning, Checkpoint, JobLock, prefetch, read_instruments
+
+
+class TestPrefetch(object):
+
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+        self.checkpoint_path = os.path.join(self.directory, 'checkpoint.json')
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def test_prefetch_new_days_in_batches(self):
+        checkpoint = Checkpoint(self.checkpoint_path)
+        checkpoint.update(['http://url2.com'], date(2015, 3, 8))
+        checkpoint.update(['http://url3.com'], date(2015, 3, 10))
+        client, sleep = Mock(failed_requests=0), Mock()
+
+        num_prefetched, _ = prefetch(client, ['http://url1.com', 'http://url2.com', 'http://url3.com'], checkpoint,
+                                     date(2015, 3, 1), date(2015, 3, 10), batch_size=1, rate=1000, sleep=sleep)
+
+        eq_(2, num_prefetched)
+        eq_([call((date(2015, 3, 1), date(2015, 3, 10)), ['http://url1.com']),
+             call((date(2015, 3, 9), date(2015, 3, 10)), ['http://url2.com'])],
+            client.query_key_stats_frame.call_args_list)
+        eq_(2, sleep.call_count)
+
+    def test_prefetch_resumes_from_checkpoint(self):
+        client = Mock(failed_requests=0)
+        client.query_key_stats_frame.side_effect = [None, IOError('pywb down')]
+        urls = ['http://url1.com', 'http://url2.com']
+        with assert_raises(IOError):
+            prefetch(client, urls, Checkpoint(self.checkpoint_path), date(2015, 3, 1), date(2015, 3, 10), batch_size=1)
+
+        client = Mock(failed_requests=0)
+        eq_(1, prefetch(client, urls, Checkpoint(self.checkpoint_path), date(2015, 3, 1), date(2015, 3, 10))[0])
+        client.query_key_stats_frame.assert_called_once_with((date(2015, 3, 1), date(2015, 3, 10)), ['http://url2.com'])
+        eq_(date(2015, 3, 10), Checkpoint(self.checkpoint_path).last_day('http://url2.com'))
+
+    def test_prefetch_does_not_checkpoint_failed_batches(self):
+        client = Mock(failed_requests=0)
+
+        def _query_key_stats_frame(date_interval, urls):
+            if urls == ['http://url1.com']:
+                client.failed_requests += 1
+        client.query_key_stats_frame.side_effect = _query_key_stats_frame
+        checkpoint = Checkpoint(self.checkpoint_path)
+
+        eq_(1, prefetch(client, ['http://url1.com', 'http://url2.com'], checkpoint, date(2015, 3, 1),
+                        date(2015, 3, 10), batch_size=1)[0])
+        eq_(None, checkpoint.last_day('http://url1.com'))
+        eq_(date(2015, 3, 10), checkpoint.last_day('http://url2.com'))
+
+    def test_job_lock_is_exclusive(self):
+        path = os.path.join(self.directory, 'prefetch.lock')
+        with JobLock(path):
+            with assert_raises(AlreadyRunning):
+                JobLock(path).acquire()
+        with JobLock(path):
+            pass
+
+
+def test_read_instruments():
+    eq_(['http://url1.com', 'http://url2.com'],
+        read_instruments(StringIO('# Funds\nhttp://url1.com\n\nhttp://url2.com\nhttp://url1.com\n')))
@@ -0,0 +1,54 @@
+import os
+import shutil
+import tempfile
+from datetime import date
+
+from mock import patch
+from nose.tools import eq_
+from nose_parameterized import parameterized
+
+from financedatahoarder.services.metrics import STAGE_SECONDS
+
+_directory = None
+rest_server = None
+
+
+def setup_module():
+    global _directory, rest_server
+    # Caches and stores of the module level client in a temporary directory instead of the working directory
+    _directory = tempfile.mkdtemp()
+    config_path = os.path.join(_directory, 'config.py')
+    with open(config_path, 'w') as f:
+        f.write('CDX_INDEX_DIR = {!r}\nTIMESERIES_DIR = {!r}\n'.format(os.path.join(_directory, 'cdx_index'),
+                                                                     os.path.join(_directory, 'timeseries')))
+    with patch.dict(os.environ, {'APP_CONFIG_FILE': config_path}):
+        from financedatahoarder.services import rest_server
+
+
+def teardown_module():
+    shutil.rmtree(_directory)
+
+
+def _get_stream(format_name):
+    url = 'http://www.morningstar.fi/fi/funds/snapshot/snapshot.aspx?id=F1'
+    with patch.object(rest_server, 'client') as client:
+        client.iter_key_stats.return_value = iter([[{'instrument_url': url, 'value': 1.5,
+                                                     'value_date': date(2015, 3, 9)}]])
+        response = rest_server.app.test_client().get('/instruments/stream/', query_string={
+            'format': format_name, 'date_interval': '2015-03-09/2015-03-10', 'url': url})
+        return response, client.iter_key_stats.call_count
+
+
+def test_stream_csv():
+    count_before = STAGE_SECONDS.count(('stream_csv',))
+    response, _ = _get_stream('csv')
+    eq_((200, 'text/csv'), (response.status_code, response.mimetype))
+    eq_('instrument_url,value,value_date\n'
+        'http://www.morningstar.fi/fi/funds/snapshot/snapshot.aspx?id=F1,1.5,2015-03-09\n', response.data)
+    eq_(count_before + 1, STAGE_SECONDS.count(('stream_csv',)))
+
+
+@parameterized([('npz', ), ('arrow', ), ('parquet', ), ('msgpack', )])
+def test_stream_binary_format_is_not_acceptable(format_name):
+    response, queries = _get_stream(format_name)
+    eq_((406, 0), (response.status_code, queries))
@@ -0,0 +1,146 @@
+from datetime import date
+import threading
+
+from mock import Mock, patch
+from nose.tools import eq_
+import pandas as pd
+import pkg_resources
+
+from financedatahoarder.services import seligson_csv_cache
+from financedatahoarder.services.data_access_api import NonCachingAsyncRequestsClient, SeligsonCSVKeyStatsResolver
+from financedatahoarder.services.seligson_csv_cache import SeligsonCSVCache
+from financedatahoarder.services.timeseries_store import KeyStatsTimeSeriesStore
+
+URL = 'http://www.seligson.fi/graafit/global-brands.csv'
+CONTENT = pkg_resources.resource_string('financedatahoarder.services.tests', 'testdata/seligson_global_brands.csv')
+
+
+class DummyCSVServer(object):
+    """Serves CSV with ETag, conditional requests and byte ranges"""
+
+    def __init__(self, content, etag='"1"'):
+        self.content = content
+        self.etag = etag
+        self.requests = []
+
+    def get(self, url, headers=None):
+        headers = headers or {}
+        self.requests.append(headers)
+        response = Mock(headers={'ETag': self.etag})
+        if headers.get('If-None-Match') == self.etag:
+            response.status_code, response.content = 304, ''
+        elif 'Range' in headers:
+            start = int(headers['Range'].partition('=')[2].rstrip('-'))
+            if start >= len(self.content):
+                response.status_code, response.content = 416, ''
+            else:
+                response.status_code, response.content = 206, self.content[start:]
+        else:
+            response.status_code, response.content = 200, self.content
+        return response
+
+
+def _cache(server):
+    return SeligsonCSVCache(refresh_after=60, session=server)
+
+
+def test_repeated_queries_use_cached_csv():
+    server = DummyCSVServer(CONTENT)
+    cache = _cache(server)
+    cache.get(URL, now=0)
+    values = cache.get(URL, now=59)
+    eq_(1, len(server.requests))
+    eq_(5.4663, values[pd.Timestamp('2015-03-13')])
+
+
+def test_revalidation_not_modified():
+    server = DummyCSVServer(CONTENT)
+    cache = _cache(server)
+    values = cache.get(URL, now=0)
+    assert cache.get(URL, now=60) is values
+    eq_('"1"', server.requests[1]['If-None-Match'])
+    eq_({'entries': 1, 'downloads': 1, 'revalidations': 1}, cache.stats())
+
+
+def test_revalidation_appends_tail():
+    server = DummyCSVServer(CONTENT)
+    cache = _cache(server)
+    cache.get(URL, now=0)
+    server.content, server.etag = CONTENT + '16.03.2015;5.5\n', '"2"'
+    values = cache.get(URL, now=60)
+    eq_(5.5, values[pd.Timestamp('2015-03-16')])
+    eq_(5.4663, values[pd.Timestamp('2015-03-13')])
+    eq_(len(CONTENT.splitlines()) + 1, len(values))
+    eq_(1, cache.downloads)
+
+
+def test_revalidation_downloads_rewritten_csv():
+    server = DummyCSVServer(CONTENT)
+    cache = _cache(server)
+    cache.get(URL, now=0)
+    server.content, server.etag = CONTENT.replace('13.03.2015;5.4663', '13.03.2015;6.0'), '"2"'
+    eq_(6.0, cache.get(URL, now=60)[pd.Timestamp('2015-03-13')])
+    eq_(2, cache.downloads)
+
+
+def test_revalidation_downloads_truncated_csv():
+    server = DummyCSVServer(CONTENT)
+    cache = _cache(server)
+    cache.get(URL, now=0)
+    # Range of the revalidation starts after the end of the rewritten CSV
+    server.content, server.etag = CONTENT.splitlines(True)[0], '"2"'
+    values = cache.get(URL, now=60)
+    eq_(1, len(values))
+    eq_(2, cache.downloads)
+
+
+def test_gets_of_different_urls_do_not_wait_for_each_other():
+    other_url = 'http://www.seligson.fi/graafit/global-pharma.csv'
+    server = DummyCSVServer(CONTENT)
+    requested, release = threading.Event(), threading.Event()
+
+    def get(url, headers=None):
+        if url == URL:
+            requested.set()
+            release.wait(5)
+        return DummyCSVServer.get(server, url, headers)
+
+    cache = SeligsonCSVCache(refresh_after=60, session=Mock(get=get))
+    slow = threading.Thread(target=cache.get, args=(URL,), kwargs={'now': 0})
+    slow.start()
+    requested.wait(5)
+    try:
+        eq_(5.4663, cache.get(other_url, now=0)[pd.Timestamp('2015-03-13')])
+        assert slow.is_alive()
+    finally:
+        release.set()
+        slow.join()
+    eq_(2, cache.downloads)
+
+
+def test_resolver_uses_csv_cache():
+    server = DummyCSVServer(CONTENT)
+    resolver = SeligsonCSVKeyStatsResolver('http://www.morningstar.fi/fi/funds/snapshot/snapshot.aspx?id=F0GBR04O2R',
+                                           csv_cache=_cache(server))
+    dates = pd.date_range(date(2015, 3, 12), date(2015, 3, 14))
+    eq_([5.4602, 5.4663, None],
+        [key_stats.get('value') for key_stats in resolver.parse(dates)])
+    eq_([], resolver.parse(pd.date_range(date(2016, 1, 1), date(2016, 1, 2))))
+    eq_(1, len(server.requests))
+
+
+def test_query_key_stats_does_not_store_dates_missing_from_csv():
+    url = 'http://www.morningstar.fi/fi/funds/snapshot/snapshot.aspx?id=F0GBR04O2R'
+    server = DummyCSVServer(CONTENT)
+    store = KeyStatsTimeSeriesStore()
+    client = NonCachingAsyncRequestsClient('http://dummybaseurl.com', 4, timeseries_store=store)
+    dates = pd.date_range(date(2015, 3, 16), date(2015, 3, 16))
+    with patch.object(seligson_csv_cache, 'default_cache', SeligsonCSVCache(refresh_after=0, session=server)):
+        # Value of the day is not yet published
+        eq_([], client.query_key_stats((date(2015, 3, 16), date(2015, 3, 16)), [url]))
+        eq_(list(dates), list(store.lookup(url, dates)[1]))
+
+        server.content, server.etag = CONTENT + '16.03.2015;5.5\n', '"2"'
+        eq_([5.5], [key_stats['value'] for key_stats in
+                    client.query_key_stats((date(2015, 3, 16), date(2015, 3, 16)), [url])])
+    eq_(0, len(store.lookup(url, dates)[1]))
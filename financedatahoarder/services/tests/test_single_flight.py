@@ -0,0 +1,63 @@
+import threading
+
+from nose.tools import eq_, assert_raises
+
+from financedatahoarder.services.single_flight import SingleFlight
+
+
+def _run_concurrently(flight, key, func, num_threads):
+    """Call `flight.do(key, func)` from threads, all of them starting while `func` is running"""
+    started, release = threading.Event(), threading.Event()
+    results = []
+
+    def _blocking_func():
+        started.set()
+        release.wait()
+        return func()
+
+    def _call():
+        try:
+            results.append(flight.do(key, _blocking_func))
+        except ValueError as e:
+            results.append(e)
+
+    leader = threading.Thread(target=_call)
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=_call) for _ in xrange(num_threads - 1)]
+    for thread in followers:
+        thread.start()
+    # Wait for the followers to block
+    while flight.coalesced < num_threads - 1:
+        threading.Event().wait(0.001)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join()
+    return results
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    calls = []
+    results = _run_concurrently(flight, 'key', lambda: calls.append(1) or 'result', 10)
+    eq_(['result'] * 10, results)
+    eq_(1, len(calls))
+    eq_({'in_flight': 0, 'executions': 1, 'coalesced': 9}, flight.stats())
+
+    # Finished work is not cached
+    eq_('result', flight.do('key', lambda: calls.append(1) or 'result'))
+    eq_(2, len(calls))
+
+
+def test_single_flight_raises_to_all_callers():
+    def _fail():
+        raise ValueError('failed')
+
+    flight = SingleFlight()
+    results = _run_concurrently(flight, 'key', _fail, 3)
+    eq_(3, len(results))
+    for result in results:
+        assert isinstance(result, ValueError)
+    with assert_raises(ValueError):
+        flight.do('key', _fail)
+    eq_(0, flight.stats()['in_flight'])
@@ -0,0 +1,43 @@
+import json
+
+from nose.tools import eq_
+import pandas as pd
+
+from financedatahoarder.services.streaming import iter_csv, iter_json, peek_first_nonempty
+from financedatahoarder.services.utils import dataframe_from_list_of_dicts
+
+
+def _key_stats(url, *values):
+    return [{'instrument_url': url, 'value': value, 'value_date': pd.Timestamp('2015-03-0{}'.format(i + 1), tz='UTC')}
+            for i, value in enumerate(values)]
+
+
+CHUNKS = [_key_stats('http://url1.com', 1.5, 2.25), [], _key_stats('http://url2.com', 3.0)]
+
+
+def test_iter_csv_matches_dataframe_csv():
+    key_stats = [dict(key_stat, value_date=key_stat['value_date'].strftime('%Y-%m-%d'))
+                 for key_stat in sum(CHUNKS, [])]
+    eq_(dataframe_from_list_of_dicts(key_stats).to_csv(index=False), ''.join(iter_csv(CHUNKS)))
+
+
+def test_iter_json():
+    eq_([{'instrument_url': 'http://url1.com', 'value': 1.5, 'value_date': '2015-03-01'},
+         {'instrument_url': 'http://url1.com', 'value': 2.25, 'value_date': '2015-03-02'},
+         {'instrument_url': 'http://url2.com', 'value': 3.0, 'value_date': '2015-03-01'}],
+        json.loads(''.join(iter_json(CHUNKS))))
+    eq_([], json.loads(''.join(iter_json([]))))
+
+
+def test_peek_first_nonempty_is_lazy():
+    consumed = []
+
+    def _chunks():
+        for chunk in [[], CHUNKS[0], CHUNKS[2]]:
+            consumed.append(chunk)
+            yield chunk
+
+    chunks = peek_first_nonempty(_chunks())
+    eq_(2, len(consumed))
+    eq_([CHUNKS[0], CHUNKS[2]], list(chunks))
+    eq_(None, peek_first_nonempty(iter([[], []])))
@@ -0,0 +1,80 @@
+from datetime import date
+
+import grequests
+import pandas as pd
+from pandas.util.testing import assert_frame_equal
+import requests
+from cachecontrol.cache import DictCache
+from mock import Mock
+from nose.tools import eq_
+
+from financedatahoarder.services.data_access_api import NonCachingAsyncRequestsClient
+from financedatahoarder.services.key_stats_cache import ParsedTrailingReturnsCache
+from financedatahoarder.services.tests.stub_pywb import StubPyWbServer
+from financedatahoarder.services.threadpool_client import ThreadPoolMap, ThreadPoolRequestsClient
+
+
+def _response(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    response.raw = Mock()
+    return response
+
+
+def test_thread_pool_map_retries_transient_errors():
+    session = Mock()
+    session.request.side_effect = [_response(503), requests.ConnectionError(), _response(200),
+                                   _response(404)]
+    thread_pool_map = ThreadPoolMap(1, retries=2, retry_backoff=0)
+    reqs = [grequests.get('http://host.com/1', session=session), grequests.get('http://host.com/2', session=session)]
+
+    eq_([200, 404], [response.status_code for response in thread_pool_map(reqs)])
+    eq_({'retried': 2, 'failed': 0}, thread_pool_map.stats())
+    eq_(5, session.request.call_args_list[0][1]['timeout'][0])
+
+
+def test_thread_pool_map_gives_up_after_retries():
+    session = Mock()
+    session.request.side_effect = requests.Timeout()
+    thread_pool_map = ThreadPoolMap(1, retries=1, retry_backoff=0)
+
+    eq_([None], thread_pool_map([grequests.get('http://host.com/1', session=session)]))
+    eq_(2, session.request.call_count)
+    eq_({'retried': 1, 'failed': 1}, thread_pool_map.stats())
+
+
+def test_clients_return_same_key_stats_from_stub_pywb():
+    url = 'http://www.morningstar.fi/fi/funds/snapshot/snapshot.aspx?id=F0GBR04O2Q'
+    date_interval = (date(2015, 3, 1), date(2015, 3, 10))
+    with StubPyWbServer(date(2015, 3, 3), 5) as stub:
+        actual = []
+        for client_class in (NonCachingAsyncRequestsClient, ThreadPoolRequestsClient):
+            client = client_class(stub.base_url, 4, cdx_output='json', http_cache=DictCache(),
+                                  list_http_cache=DictCache())
+            actual.append(client.query_key_stats(date_interval, [url]))
+
+    eq_(actual[0], actual[1])
+    # Every day is replayed with the same page
+    eq_([{'value': 6.65, 'value_date': pd.Timestamp('2015-03-09', tz='UTC'), 'instrument_url': url}], actual[0])
+    # Listing and a replay for each day, by both clients
+    eq_(2 * (1 + 5), stub.requests)
+
+
+def test_query_trailing_returns_from_stub_pywb():
+    url = 'http://www.morningstar.fi/fi/funds/snapshot/snapshot.aspx?id=F0GBR04O2R'
+    with StubPyWbServer(date(2015, 3, 9), 2, replay_filename='funds_snapshot_tab1_20150310_F0GBR04O2R.html') as stub:
+        client = NonCachingAsyncRequestsClient(stub.base_url, 4, cdx_output='json', http_cache=DictCache(),
+                                               list_http_cache=DictCache(),
+                                               trailing_returns_cache=ParsedTrailingReturnsCache(':memory:'))
+        trailing_returns = client.query_trailing_returns((date(2015, 3, 8), date(2015, 3, 10)), [url])
+        # Second query is answered from the caches
+        eq_(3, stub.requests)
+        assert_frame_equal(trailing_returns,
+                           client.query_trailing_returns((date(2015, 3, 8), date(2015, 3, 10)), [url]))
+        eq_(3, stub.requests)
+
+    eq_(20, len(trailing_returns))
+    eq_([url], trailing_returns['instrument_url'].unique().tolist())
+    eq_([pd.Timestamp('2015-03-09', tz='UTC'), pd.Timestamp('2015-03-10', tz='UTC')],
+        trailing_returns['date'].unique().tolist())
+    eq_([0.45, 1.37], trailing_returns['returns_total'].tolist()[:2])
@@ -0,0 +1,77 @@
+from datetime import date
+import shutil
+import tempfile
+
+from nose.tools import eq_
+import pandas as pd
+
+from financedatahoarder.services.timeseries_store import KeyStatsTimeSeriesStore
+
+
+def _key_stats(value_date, value):
+    return {'value_date': pd.Timestamp(value_date, tz='UTC'), 'value': value}
+
+
+def test_lookup_returns_stored_key_stats_and_missing_dates():
+    store = KeyStatsTimeSeriesStore()
+    store.update('http://url.com', pd.date_range('2015-03-10', '2015-03-13'),
+                 [(pd.Timestamp('2015-03-10'), _key_stats('2015-03-09', 1.5)),
+                  # Failed replays are not stored
+                  (pd.Timestamp('2015-03-11'), {}),
+                  (pd.Timestamp('2015-03-13'), _key_stats('2015-03-12', 2.5))],
+                 today=date(2015, 4, 1))
+
+    key_stats, missing = store.lookup('http://url.com', pd.date_range('2015-03-09', '2015-03-13'))
+    eq_([_key_stats('2015-03-09', 1.5), _key_stats('2015-03-12', 2.5)], key_stats)
+    # 2015-03-12 has no recording and is known to have no data
+    eq_(list(pd.date_range('2015-03-09', '2015-03-11', freq='2D')), list(missing))
+
+    key_stats, _ = store.lookup_array('http://url.com', pd.date_range('2015-03-09', '2015-03-13'))
+    eq_([(16503, 1.5), (16506, 2.5)], key_stats.tolist())
+
+
+def test_update_does_not_store_recent_days():
+    store = KeyStatsTimeSeriesStore(settle_days=1)
+    store.update('http://url.com', pd.date_range('2015-03-10', '2015-03-11'),
+                 [(pd.Timestamp('2015-03-10'), _key_stats('2015-03-09', 1.5)),
+                  (pd.Timestamp('2015-03-11'), _key_stats('2015-03-10', 2.5))],
+                 today=date(2015, 3, 11))
+    key_stats, missing = store.lookup('http://url.com', pd.date_range('2015-03-10', '2015-03-11'))
+    eq_([_key_stats('2015-03-09', 1.5)], key_stats)
+    eq_([pd.Timestamp('2015-03-11')], list(missing))
+
+
+def test_time_series_are_persisted():
+    directory = tempfile.mkdtemp()
+    try:
+        KeyStatsTimeSeriesStore(directory).update('http://url.com', pd.date_range('2015-03-10', '2015-03-10'),
+                                                  [(pd.Timestamp('2015-03-10'), _key_stats('2015-03-09', 1.5))],
+                                                  today=date(2015, 4, 1))
+        key_stats, missing = KeyStatsTimeSeriesStore(directory).lookup('http://url.com',
+                                                                       pd.date_range('2015-03-10', '2015-03-10'))
+        eq_([_key_stats('2015-03-09', 1.5)], key_stats)
+        eq_(0, len(missing))
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_stores_sharing_directory_see_and_keep_days_of_each_other():
+    directory = tempfile.mkdtemp()
+    try:
+        # E.g. the service and the crawler
+        service, crawler = KeyStatsTimeSeriesStore(directory), KeyStatsTimeSeriesStore(directory)
+        dates = pd.date_range('2015-03-10', '2015-03-11')
+        service.update('http://url.com', dates[:1], [(dates[0], _key_stats('2015-03-09', 1.5))],
+                       today=date(2015, 4, 1))
+        eq_(1, len(crawler.lookup('http://url.com', dates)[0]))
+        crawler.update('http://url.com', dates[1:], [(dates[1], _key_stats('2015-03-10', 2.5))],
+                       today=date(2015, 4, 1))
+
+        expected = [_key_stats('2015-03-09', 1.5), _key_stats('2015-03-10', 2.5)]
+        eq_(expected, service.lookup('http://url.com', dates)[0])
+        service.update('http://url.com', pd.date_range('2015-03-12', '2015-03-12'), [], today=date(2015, 4, 1))
+        for store in (service, crawler, KeyStatsTimeSeriesStore(directory)):
+            key_stats, missing = store.lookup('http://url.com', pd.date_range('2015-03-10', '2015-03-12'))
+            eq_((expected, 0), (key_stats, len(missing)))
+    finally:
+        shutil.rmtree(directory)
@@ -1,5 +1,8 @@
-from nose.tools import eq_
-from financedatahoarder.services.utils import iter_sort_uniq
+from nose.tools import eq_, raises
+from financedatahoarder.services.utils import iter_sort_uniq, assemble_key_stats, key_stats_array, \
+    key_stats_fields, key_stats_records
+import numpy as np
+import pandas as pd
 from nose_parameterized import parameterized
 
 
@@ -14,3 +17,42 @@ from nose_parameterized import parameterized
 def test_parse(values, expected):
     actual = iter_sort_uniq(values, key=lambda entry: entry['url'])
     eq_(expected, list(actual))
+
+
+def test_assemble_key_stats():
+    key_stats_by_url = {
+        'url1': [{'value': 1.0, 'value_date': pd.Timestamp('2015-03-02 18:00', tz='UTC')},
+                 {},
+                 # Duplicate value date
+                 {'value': 1.5, 'value_date': pd.Timestamp('2015-03-02', tz='UTC')},
+                 {'value': 2.0, 'value_date': pd.Timestamp('2015-03-01', tz='UTC')}],
+        'url2': [{'value': 3.0, 'value_date': pd.Timestamp('2015-03-01')}],
+    }
+    actual = key_stats_records(assemble_key_stats(['url2', 'url1', 'url2'], key_stats_by_url))
+    eq_([{'instrument_url': 'url2', 'value': 3.0, 'value_date': pd.Timestamp('2015-03-01', tz='UTC')},
+         {'instrument_url': 'url1', 'value': 2.0, 'value_date': pd.Timestamp('2015-03-01', tz='UTC')},
+         {'instrument_url': 'url1', 'value': 1.0, 'value_date': pd.Timestamp('2015-03-02', tz='UTC')}], actual)
+    eq_([], key_stats_records(assemble_key_stats(['url1'], {'url1': [{}]})))
+
+
+def test_assemble_key_stats_arrays():
+    fields = ('value', 'fund_size')
+    url1_key_stats = key_stats_array([{'value': 1.0, 'value_date': pd.Timestamp('2015-03-02 18:00', tz='UTC')}, {},
+                                      {'value': 2.0, 'value_date': pd.Timestamp('2015-03-01'), 'fund_size': 5.0}],
+                                     fields)
+    eq_([(16496, 1.0), (16495, 2.0)], url1_key_stats[['value_day', 'value']].tolist())
+    actual = assemble_key_stats(['url2', 'url1'], {'url1': url1_key_stats, 'url2': key_stats_array([], fields)}, fields)
+    eq_(['instrument_url', 'value_date', 'value', 'fund_size'], list(actual.columns))
+    eq_(['url1', 'url1'], list(actual['instrument_url']))
+    eq_([2.0, 1.0], list(actual['value']))
+    np.testing.assert_array_equal([5.0, np.nan], actual['fund_size'].values)
+
+
+def test_key_stats_fields():
+    eq_(('value',), key_stats_fields(None))
+    eq_(('fund_size', 'value'), key_stats_fields(['fund_size', 'value', 'fund_size']))
+
+
+@raises(ValueError)
+def test_key_stats_fields_unknown():
+    key_stats_fields(['value', 'price'])
@@ -0,0 +1,112 @@
+"""Archive client sending the requests with a thread pool instead of gevent
+
+The requests are the same :class:`grequests.AsyncRequest` objects as prepared for :func:`grequests_map`, so the
+listing, replay and parsing functions of :class:`NonCachingAsyncRequestsClient` are used as such.
+"""
+import logging
+import threading
+import time
+import urlparse
+from multiprocessing.pool import ThreadPool
+
+import requests
+
+from financedatahoarder.services.data_access_api import NonCachingAsyncRequestsClient
+from financedatahoarder.services.flow_control import RetryPolicy
+
+
+class ThreadPoolMap(object):
+    """Send requests with a thread pool, as a replacement of :func:`grequests_map`
+
+    Concurrency is limited by the size of the pool and by the number of requests in flight to a single host. Each
+    request has a timeout, and failed requests (connection errors, timeouts and transient HTTP errors) are retried as
+    defined by :class:`RetryPolicy`. Connections are kept alive by the session of the request.
+    """
+
+    def __init__(self, pool_size, per_host_limit=8, timeout=(5, 30), retries=2, retry_backoff=0.5):
+        """
+        :param pool_size: number of threads sending the requests
+        :type pool_size: int
+        :param per_host_limit: maximum number of concurrent requests to a single host
+        :type per_host_limit: int
+        :param timeout: requests timeout in seconds, or tuple of (connect, read) timeouts
+        :type timeout: float | (float, float)
+        :param retries: number of retries of a failed request
+        :type retries: int
+        :param retry_backoff: base delay between retries in seconds, see :class:`RetryPolicy`
+        :type retry_backoff: float
+        """
+        self._pool = ThreadPool(pool_size)
+        self._per_host_limit = per_host_limit
+        self._timeout = timeout
+        self._retry_policy = RetryPolicy(retries=retries, backoff=retry_backoff)
+        self._host_semaphores = {}
+        self._lock = threading.Lock()
+        self.retried = 0
+        self.failed = 0
+        self._logger = logging.getLogger('ThreadPoolMap')
+
+    def _host_semaphore(self, url):
+        host = urlparse.urlsplit(url).netloc
+        with self._lock:
+            semaphore = self._host_semaphores.get(host)
+            if semaphore is None:
+                semaphore = self._host_semaphores[host] = threading.BoundedSemaphore(self._per_host_limit)
+            return semaphore
+
+    def _send(self, req):
+        kwargs = dict(req.kwargs)
+        kwargs.setdefault('timeout', self._timeout)
+        semaphore = self._host_semaphore(req.url)
+        for attempt in xrange(self._retry_policy.retries + 1):
+            if attempt:
+                with self._lock:
+                    self.retried += 1
+                time.sleep(self._retry_policy.delay(attempt))
+            try:
+                with semaphore:
+                    response = req.session.request(req.method, req.url, **kwargs)
+            except requests.RequestException as e:
+                self._logger.warning('Request to %s failed (attempt %d): %s', req.url, attempt + 1, e)
+                continue
+            if not self._retry_policy.should_retry(response, attempt):
+                return response
+            self._logger.warning('Request to %s failed (attempt %d): HTTP %d', req.url, attempt + 1,
+                                 response.status_code)
+            response.close()
+        with self._lock:
+            self.failed += 1
+        return None
+
+    def __call__(self, reqs, size=None):
+        """Send the requests
+
+        :param size: ignored, concurrency is limited by the pool size and `per_host_limit`
+        :return: responses in the order of the requests, None for failed requests
+        :rtype: list[requests.Response | None]
+        """
+        return self._pool.map(self._send, reqs, chunksize=1)
+
+    def stats(self):
+        return {'retried': self.retried, 'failed': self.failed}
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+
+class ThreadPoolRequestsClient(NonCachingAsyncRequestsClient):
+    """:class:`NonCachingAsyncRequestsClient` sending the requests with :class:`ThreadPoolMap`"""
+
+    def __init__(self, base_replay_url, pool_size, per_host_limit=8, timeout=(5, 30), retries=2, retry_backoff=0.5,
+                 **kwargs):
+        """
+        :param pool_size: number of threads sending the requests
+        :type pool_size: int
+
+        See :class:`ThreadPoolMap` and :class:`NonCachingAsyncRequestsClient` for the other parameters.
+        """
+        self.thread_pool_map = ThreadPoolMap(pool_size, per_host_limit=per_host_limit, timeout=timeout,
+                                             retries=retries, retry_backoff=retry_backoff)
+        super(ThreadPoolRequestsClient, self).__init__(base_replay_url, pool_size, map_func=self.thread_pool_map,
+                                                       **kwargs)
@@ -0,0 +1,213 @@
+import fcntl
+import hashlib
+import logging
+import os
+import tempfile
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytz
+
+from financedatahoarder.services.utils import key_stats_dtype
+
+# Key stats of an instrument as columns sorted by query day. Days are days since epoch (int64), query days without
+# data have NaN value.
+KeyStatsTimeSeries = namedtuple('KeyStatsTimeSeries', ['query_days', 'value_days', 'values'])
+
+_EMPTY = KeyStatsTimeSeries(np.array([], dtype=np.int64), np.array([], dtype=np.int64),
+                            np.array([], dtype=np.float64))
+
+
+def to_days(dates):
+    """Convert dates to days since epoch
+
+    :type dates: pd.DatetimeIndex
+    :rtype: np.ndarray[int64]
+    """
+    return np.asarray(dates.values, dtype='datetime64[D]').astype(np.int64)
+
+
+def _day(timestamp):
+    return (timestamp.date() - datetime(1970, 1, 1).date()).days
+
+
+def merge_time_series(old, new):
+    """Merge two time series, query days of `new` take precedence
+
+    :type old: KeyStatsTimeSeries
+    :type new: KeyStatsTimeSeries
+    :rtype: KeyStatsTimeSeries
+    """
+    query_days = np.concatenate([new.query_days, old.query_days])
+    _, first = np.unique(query_days, return_index=True)
+    return KeyStatsTimeSeries(query_days[first], np.concatenate([new.value_days, old.value_days])[first],
+                              np.concatenate([new.values, old.values])[first])
+
+
+class KeyStatsTimeSeriesStore(object):
+    """Columnar store of key stats (query day, value day, value) keyed by instrument url
+
+    Time series are kept in memory as NumPy arrays sorted by query day, so that date interval queries are binary
+    searches. If `directory` is given, the time series are persisted on disk (one npz file per instrument url).
+
+    Only query days at least `settle_days` before the current day are stored, as recordings of recent days may still
+    change. Query days without recordings are stored as days without data, while days that could not be fetched or
+    parsed are not stored at all.
+
+    Several processes (e.g. uwsgi workers and the crawler) may share the directory. A time series is read again from
+    disk when its file has been replaced since it was read, and updates merge to the time series on disk while holding
+    a lock of the directory, so that days written by other processes are neither missed nor overwritten.
+    """
+
+    def __init__(self, directory=None, settle_days=1):
+        """
+        :param directory: directory to persist the time series in. None to keep the time series only in memory
+        :type directory: str | None
+        :param settle_days: number of most recent days not to store
+        :type settle_days: int
+        """
+        self._directory = directory
+        self._settle_days = settle_days
+        # (file version, time series) of each url, see _file_version
+        self._time_series = {}
+        self._logger = logging.getLogger('KeyStatsTimeSeriesStore')
+        if directory is not None and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, url):
+        if isinstance(url, unicode):
+            url = url.encode('utf-8')
+        return os.path.join(self._directory, hashlib.sha1(url).hexdigest() + '.npz')
+
+    def _file_version(self, url):
+        """Return (inode, size, modification time) of the file of the url, None if there is no file
+
+        Files are replaced on each save, so the version changes whenever the time series is saved by any process.
+        """
+        if self._directory is None:
+            return None
+        try:
+            stat = os.stat(self._path(url))
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime
+
+    def _lock(self):
+        """Return file locked exclusively for updating the time series of the directory, unlocked on close"""
+        f = open(os.path.join(self._directory, 'update.lock'), 'a')
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    def _load(self, url):
+        if self._directory is None:
+            return None
+        try:
+            with np.load(self._path(url)) as data:
+                return KeyStatsTimeSeries(*[data[field] for field in KeyStatsTimeSeries._fields])
+        except IOError:
+            return None
+        except (KeyError, ValueError):
+            self._logger.warning('Ignoring corrupted time series of %s', url, exc_info=True)
+            return None
+
+    def _save(self, url, time_series):
+        if self._directory is None:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self._directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **time_series._asdict())
+        os.rename(tmp_path, self._path(url))
+
+    def get(self, url):
+        """Return the time series of the url from memory, or from disk if the file has changed since it was read
+
+        :rtype: KeyStatsTimeSeries
+        """
+        version = self._file_version(url)
+        cached = self._time_series.get(url)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        time_series = self._load(url) if version is not None else None
+        if time_series is None:
+            self._time_series.pop(url, None)
+            return _EMPTY
+        self._time_series[url] = (version, time_series)
+        return time_series
+
+    def lookup_array(self, url, dates):
+        """Look up stored key stats of the url as an array
+
+        :param dates: query dates
+        :type dates: pd.DatetimeIndex
+        :return: tuple of (stored key stats, query dates not stored). Stored key stats are an array of
+            :func:`key_stats_dtype` with `value_day` and `value` columns.
+        :rtype: (np.ndarray, pd.DatetimeIndex)
+        """
+        time_series = self.get(url)
+        days = to_days(dates)
+        pos = np.minimum(np.searchsorted(time_series.query_days, days), max(len(time_series.query_days) - 1, 0))
+        found = time_series.query_days[pos] == days if len(time_series.query_days) else np.zeros(len(days), bool)
+        pos = pos[found]
+        pos = pos[~np.isnan(time_series.values[pos])]
+        key_stats = np.empty(len(pos), dtype=key_stats_dtype())
+        key_stats['value_day'] = time_series.value_days[pos]
+        key_stats['value'] = time_series.values[pos]
+        return key_stats, dates[~found]
+
+    def lookup(self, url, dates):
+        """Look up stored key stats of the url
+
+        :param dates: query dates
+        :type dates: pd.DatetimeIndex
+        :return: tuple of (stored key stats, query dates not stored). Stored key stats are dicts with `value` and
+            `value_date` keys.
+        :rtype: (list[dict], pd.DatetimeIndex)
+        """
+        key_stats, missing_dates = self.lookup_array(url, dates)
+        value_dates = pd.DatetimeIndex(key_stats['value_day'].astype('datetime64[D]'), tz=pytz.UTC)
+        return [{'value': value, 'value_date': value_date}
+                for value, value_date in zip(key_stats['value'].tolist(), value_dates)], missing_dates
+
+    def update(self, url, dates, key_stats_by_date, today=None):
+        """Store key stats of the url
+
+        :param dates: queried dates
+        :type dates: pd.DatetimeIndex
+        :param key_stats_by_date: (date, key stats) pairs of the dates having a recording. Key stats are empty for
+            recordings that could not be fetched or parsed.
+        :type key_stats_by_date: list[(pd.Timestamp, OverviewKeyStats | dict)]
+        :param today: current date, defaults to current UTC date
+        """
+        today = datetime.now(pytz.UTC).date() if today is None else today
+        settled_before = (today - datetime(1970, 1, 1).date()).days - self._settle_days + 1
+        failed_days = set()
+        query_days, value_days, values = [], [], []
+        for date, key_stats in key_stats_by_date:
+            if key_stats:
+                query_days.append(_day(date))
+                value_days.append(_day(key_stats['value_date']))
+                values.append(key_stats['value'])
+            else:
+                failed_days.add(_day(date))
+        recorded_days = set(query_days) | failed_days
+        # Days without recording
+        for day in to_days(dates).tolist():
+            if day not in recorded_days:
+                query_days.append(day)
+                value_days.append(day)
+                values.append(np.nan)
+        new = KeyStatsTimeSeries(np.array(query_days, dtype=np.int64), np.array(value_days, dtype=np.int64),
+                                 np.array(values, dtype=np.float64))
+        settled = new.query_days < settled_before
+        if not settled.any():
+            return
+        new = KeyStatsTimeSeries(*[column[settled] for column in new])
+        if self._directory is None:
+            self._time_series[url] = (None, merge_time_series(self.get(url), new))
+            return
+        with self._lock():
+            time_series = merge_time_series(self.get(url), new)
+            self._save(url, time_series)
+            self._time_series[url] = (self._file_version(url), time_series)
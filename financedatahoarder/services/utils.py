@@ -1,9 +1,16 @@
+import collections
 import functools
 import itertools
 import operator
 import numpy as np
 import pandas as pd
 
+from financedatahoarder.scraper.scrapers.parsers.morningstar_overview import KEY_STATS_FIELDS
+
+# Key stats fields that can be queried, besides `instrument_url` and `value_date`
+KEY_STATS_FIELD_NAMES = ('value',) + tuple(KEY_STATS_FIELDS)
+DEFAULT_KEY_STATS_FIELDS = ('value',)
+
 
 def dataframe_from_list_of_dicts(dicts, index=None):
     """Convert list of dicts to DataFrame"""
@@ -28,4 +35,133 @@ def iter_sort_uniq(sequence, key):
                           itertools.imap(
                               operator.itemgetter(1),
                               itertools.groupby(sorted(sequence, key=key), key=key))
-    )
\ No newline at end of file
+    )
+
+def key_stats_fields(fields=None):
+    """Validate the key stats fields to query
+
+    :param fields: names of the fields, see :data:`KEY_STATS_FIELD_NAMES`. None for :data:`DEFAULT_KEY_STATS_FIELDS`
+    :type fields: list[str] | None
+    :return: unique fields, in the given order
+    :rtype: tuple[str]
+    :raise ValueError: on unknown fields
+    """
+    if not fields:
+        return DEFAULT_KEY_STATS_FIELDS
+    unknown = [field for field in fields if field not in KEY_STATS_FIELD_NAMES]
+    if unknown:
+        raise ValueError('Unknown key stats fields: {} (available: {})'.format(', '.join(unknown),
+                                                                             ', '.join(KEY_STATS_FIELD_NAMES)))
+    return tuple(collections.OrderedDict.fromkeys(fields))
+
+
+def key_stats_dtype(fields=DEFAULT_KEY_STATS_FIELDS):
+    """Return dtype of key stats arrays: `value_day` (days since epoch in UTC, int64) and a float64 column of each field
+
+    :type fields: tuple[str]
+    :rtype: np.dtype
+    """
+    return np.dtype([('value_day', np.int64)] + [(str(field), np.float64) for field in fields])
+
+
+def key_stats_array(key_stats, fields=DEFAULT_KEY_STATS_FIELDS):
+    """Convert parsed key stats of an instrument to a structured array of :func:`key_stats_dtype`
+
+    Empty (invalid) key stats are dropped, value dates are truncated to UTC days and fields missing from the key stats
+    are NaN.
+
+    :type key_stats: list[OverviewKeyStats | dict]
+    :rtype: np.ndarray
+    """
+    key_stats = [key_stat for key_stat in key_stats if key_stat]
+    array = np.empty(len(key_stats), dtype=key_stats_dtype(fields))
+    if key_stats:
+        array['value_day'] = pd.to_datetime([key_stat['value_date'] for key_stat in key_stats],
+                                            utc=True).values.astype('datetime64[D]').astype(np.int64)
+        for field in fields:
+            array[field] = [key_stat.get(field, np.nan) for key_stat in key_stats]
+    return array
+
+
+def assemble_key_stats(urls, key_stats_by_url, fields=DEFAULT_KEY_STATS_FIELDS):
+    """Assemble key stats of the urls as columns
+
+    The result is sorted by value date and rank of the url in `urls` (stable), keeping only the first key stats of each
+    (value date, url) pair. Urls are stored once, as categories of the `instrument_url` column.
+
+    :param urls: urls, possibly with duplicates
+    :type urls: list[str]
+    :param key_stats_by_url: key stats of each url, as arrays returned by :func:`key_stats_array` (with the `fields`),
+        or as parsed key stats to convert with :func:`key_stats_array`
+    :type key_stats_by_url: dict[str, np.ndarray | list[OverviewKeyStats | dict]]
+    :param fields: key stats fields to assemble
+    :type fields: tuple[str]
+    :return: DataFrame with `instrument_url` (categorical) and `value_date` columns and a column for each field
+    :rtype: pd.DataFrame
+    """
+    unique_urls = list(collections.OrderedDict.fromkeys(urls))
+    arrays = []
+    for url in unique_urls:
+        key_stats = key_stats_by_url[url]
+        arrays.append(key_stats if isinstance(key_stats, np.ndarray) else key_stats_array(key_stats, fields))
+    records = np.concatenate(arrays) if arrays else np.empty(0, dtype=key_stats_dtype(fields))
+
+    days = records['value_day']
+    ranks = np.repeat(np.arange(len(unique_urls)), [len(array) for array in arrays])
+    order = np.lexsort((ranks, days))
+    days, ranks = days[order], ranks[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (days[1:] != days[:-1]) | (ranks[1:] != ranks[:-1])
+    order = order[first]
+
+    columns = collections.OrderedDict([
+        ('instrument_url', pd.Categorical.from_codes(ranks[first], unique_urls)),
+        ('value_date', pd.DatetimeIndex(days[first].astype('datetime64[D]'), tz='UTC'))])
+    for field in fields:
+        columns[field] = records[field][order]
+    return pd.DataFrame(columns, columns=['instrument_url', 'value_date'] + list(fields))
+
+
+TRAILING_RETURNS_COLUMNS = ['instrument_url', 'date', 'time_interval', 'returns_total', 'returns_class',
+                            'returns_index']
+
+
+def assemble_trailing_returns(urls, tables_by_url):
+    """Assemble trailing returns tables of the urls as columns, one row per time interval of each table
+
+    Empty (invalid) tables are dropped. The result is sorted by date and rank of the url in `urls` (stable).
+
+    :param urls: urls, possibly with duplicates
+    :param tables_by_url: (query date, trailing returns table) pairs of each url. Tables are dicts of columns.
+    :type tables_by_url: dict[str, list[(pd.Timestamp, dict)]]
+    :return: DataFrame with :data:`TRAILING_RETURNS_COLUMNS`
+    :rtype: pd.DataFrame
+    """
+    unique_urls = list(collections.OrderedDict.fromkeys(urls))
+    entries = sorted(((pd.Timestamp(date).value, rank, table)
+                      for rank, url in enumerate(unique_urls) for date, table in tables_by_url[url] if table),
+                     key=operator.itemgetter(0, 1))
+    counts = [len(table['time_interval']) for _, _, table in entries]
+    columns = collections.OrderedDict([
+        ('instrument_url', np.asarray(unique_urls, dtype=object)[np.repeat([rank for _, rank, _ in entries],
+                                                                              counts).astype(np.int64)]),
+        ('date', pd.DatetimeIndex(np.repeat(np.array([date for date, _, _ in entries], dtype='datetime64[ns]'),
+                                            counts), tz='UTC').floor('D'))])
+    for field in TRAILING_RETURNS_COLUMNS[2:]:
+        values = list(itertools.chain.from_iterable(table[field] for _, _, table in entries))
+        columns[field] = np.array(values, dtype=object if field == 'time_interval' else np.float64)
+    return pd.DataFrame(columns, columns=TRAILING_RETURNS_COLUMNS)
+
+
+def key_stats_records(df):
+    """Convert key stats assembled by :func:`assemble_key_stats` to list of dicts
+
+    :rtype: list[dict]
+    """
+    columns = list(df.columns)
+    values = [df[column].values.tolist() for column in columns]
+    # Box each unique value date only once
+    codes, value_dates = pd.factorize(df['value_date'])
+    value_dates = list(value_dates)
+    values[columns.index('value_date')] = [value_dates[code] for code in codes]
+    return [dict(itertools.izip(columns, row)) for row in itertools.izip(*values)]